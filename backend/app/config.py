@@ -6,6 +6,8 @@ class Settings(BaseSettings):
     # Supabase
     supabase_url: str
     supabase_service_role_key: str
+    supabase_pool_size: int = 20  # Keep-alive PostgREST connections per process
+    supabase_timeout: float = 10.0
 
     # OpenRouter (LLM)
     openrouter_api_key: str
@@ -17,6 +19,13 @@ class Settings(BaseSettings):
     twilio_account_sid: str
     twilio_auth_token: str
     twilio_whatsapp_number: str = "+2250104278080"
+    twilio_api_base: str = "https://api.twilio.com"
+    twilio_content_base: str = "https://content.twilio.com"
+    twilio_pool_size: int = 50  # Keep-alive connections per process
+    twilio_http2: bool = True
+    twilio_timeout: float = 15.0
+    twilio_connect_timeout: float = 5.0
+    twilio_status_callback_url: str = ""  # Public URL of POST /api/twilio/status-callback; empty = no delivery callbacks
 
     # Redis
     redis_url: str = "redis://redis:6379/0"
@@ -31,6 +40,95 @@ class Settings(BaseSettings):
     rag_top_k: int = 5
     max_conversation_history: int = 10
 
+    # Inbound message ingestion: "sync" (reply within the request) or "queue"
+    # (enqueue in Redis, return immediately, consumers in the API process reply)
+    ai_ingestion_mode: str = "sync"
+    ai_queue_concurrency: int = 8  # Messages processed at once per API process
+    ai_queue_status_ttl_seconds: int = 24 * 3600
+    ai_queue_stale_seconds: int = 300  # Conversations without a consumer heartbeat for this long are requeued
+
+    # Coalescing of rapid-fire messages: one reply per burst (opt-in)
+    ai_coalesce_enabled: bool = False
+    ai_coalesce_window_seconds: float = 2.0  # Quiet time before a burst is answered
+
+    # Streamed replies: the first sentence/paragraph is sent as its own WhatsApp message.
+    # Default for conversations whose `ai_streaming` column is NULL.
+    ai_streaming_enabled: bool = False
+    ai_streaming_min_chars: int = 60  # Shorter openings ("Bonjour Madame.") wait for the next sentence
+
+    # Retrieval ranking (hybrid scoring is opt-in: needs the hybrid_search SQL function)
+    rag_hybrid_search_enabled: bool = False
+    rag_candidate_count: int = 12  # Chunks fetched before dedupe / trimming; at most rag_top_k are kept
+    rag_similarity_threshold: float = 0.3  # Minimum cosine similarity of a chunk
+    rag_keyword_weight: float = 0.3  # Score = vector * (1 - kw - prio) + keyword * kw + priority/10 * prio
+    rag_priority_weight: float = 0.1
+    rag_relative_score_cutoff: float = 0.75  # Drop chunks scoring below this fraction of the best one
+    rag_dedupe_threshold: float = 0.8  # Word-shingle Jaccard above which two chunks are duplicates
+    rag_context_max_tokens: int = 1200
+
+    # Prompt token budget (system prompt + context + summary + recent turns + question)
+    prompt_max_tokens: int = 2500
+    conversation_summary_enabled: bool = True
+    conversation_summary_keep_turns: int = 6  # Recent turns kept verbatim; older ones go to the summary
+    conversation_summary_max_words: int = 120
+    conversation_summary_ttl_seconds: int = 30 * 24 * 3600
+
+    # Local in-process vector index (opt-in, replaces the match_documents RPC for small corpora)
+    local_vector_index_enabled: bool = False
+    local_vector_index_max_rows: int = 5000  # Above this, fall back to pgvector
+    local_vector_index_refresh_seconds: int = 60
+
+    # Query embedding cache
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 5000
+    embedding_cache_ttl_seconds: int = 7 * 24 * 3600
+    embedding_cache_redis: bool = True
+
+    # Semantic response cache (opt-in)
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.95  # Cosine similarity required for a hit
+    semantic_cache_ttl_seconds: int = 24 * 3600
+    semantic_cache_max_entries: int = 1000
+    semantic_cache_sync_seconds: int = 30  # Refresh of the local tier from Redis
+    semantic_cache_version_check_seconds: int = 60  # knowledge_base change detection
+
+    # Write-behind persistence of messages / ai_logs (API process)
+    write_behind_enabled: bool = True
+    write_behind_batch_size: int = 50  # Rows per multi-row insert
+    write_behind_flush_seconds: float = 0.2  # Max wait after the first queued row
+    write_behind_max_retries: int = 5  # Transient Supabase errors only
+    write_behind_max_queue: int = 10000  # Producers wait beyond this
+
+    # Conversation context cache (recent turns + conversation row, Redis + local LRU)
+    conversation_cache_enabled: bool = True
+    conversation_cache_ttl_seconds: int = 3600  # Idle conversations are evicted
+    conversation_cache_meta_ttl_seconds: int = 300  # Conversation rows (status, ai_streaming...)
+    conversation_cache_local_max_entries: int = 2000  # Per process
+    conversation_cache_revalidate_seconds: int = 60  # Max staleness for messages written outside the backend
+
+    # WhatsApp templates cache (invalidated through Redis pub/sub on every write)
+    template_cache_ttl_seconds: int = 60
+    template_poll_base_seconds: int = 300  # First approval poll; intervals then double with the template's age
+    template_poll_max_seconds: int = 6 * 3600
+    template_poll_concurrency: int = 10  # Twilio approval requests in flight
+
+    # Bulk sending (campaigns & automations)
+    send_rate_per_second: float = 10.0  # Token-bucket rate per sender number, shared across workers
+    send_burst: int = 10
+    send_concurrency: int = 20  # Max Twilio requests in flight per task
+    campaign_chunk_size: int = 500  # Recipients per Celery subtask
+    campaign_db_batch_size: int = 100  # campaign_messages rows per RPC (enqueue / claim / complete)
+    audience_page_size: int = 1000  # Phones per audience_phones page; keep <= PostgREST max_rows
+    automation_lock_seconds: int = 240  # check_automations run lock (beat interval is 5 min)
+    automation_run_ttl_seconds: int = 3600  # Max duration of one automation dispatch before it can run again
+    automation_cooldown_hours: int = 7 * 24  # A recipient gets the same automation at most once per window
+
+    # Twilio delivery status callbacks (Redis stream, applied in batches by the API process)
+    status_stream_maxlen: int = 1_000_000  # Approximate cap of the callback stream
+    status_batch_size: int = 500  # Callbacks per XREADGROUP / apply_message_statuses call
+    status_stale_seconds: int = 60  # Unacked callbacks older than this are reclaimed
+    status_unmatched_ttl_seconds: int = 600  # Callbacks whose SID is still unknown are retried until then
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,12 +1,46 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings, Settings
-from app.routers import ai, templates, campaigns
+from app.routers import ai, templates, campaigns, twilio_callbacks
+from app.services.supabase_service import close_postgrest
+from app.services.twilio_service import close_twilio_http
+from app.services.rag import warm_up_rag
+from app.services.vector_index import load_local_index
+from app.services.write_behind import start_write_behind, stop_write_behind
+from app.services.ai_queue import start_ai_consumers, stop_ai_consumers
+from app.services.template_cache import start_template_cache_listener
+from app.services.status_callbacks import start_status_consumer, stop_status_consumer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        warm_up_rag()
+    except Exception as e:
+        # Not fatal: the runtime is built lazily on the first message instead
+        logger.error(f"RAG warm-up failed: {e}", exc_info=True)
+    await load_local_index()
+    start_template_cache_listener()
+    start_write_behind()
+    start_ai_consumers()
+    start_status_consumer()
+    yield
+    await stop_status_consumer()
+    await stop_ai_consumers()
+    await stop_write_behind()
+    await close_postgrest()
+    await close_twilio_http()
+
 
 app = FastAPI(
     title="Bobotcho Backend",
     description="Backend API for Bobotcho WhatsApp Agent — RAG, Templates, Campaigns",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 settings = get_settings()
@@ -32,6 +66,8 @@ async def verify_api_key(request: Request):
 app.include_router(ai.router, prefix="/api", dependencies=[Depends(verify_api_key)])
 app.include_router(templates.router, prefix="/api", dependencies=[Depends(verify_api_key)])
 app.include_router(campaigns.router, prefix="/api", dependencies=[Depends(verify_api_key)])
+# Called by Twilio: authenticated by the request signature, not the API key
+app.include_router(twilio_callbacks.router, prefix="/api")
 
 
 @app.get("/health")
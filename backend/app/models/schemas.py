@@ -16,9 +16,22 @@ class AIResponseBody(BaseModel):
     success: bool
     response: str = Field("", description="AI-generated response text")
     latency_ms: int = 0
+    timings: dict[str, int] = Field(default_factory=dict, description="Per-stage latency breakdown (ms)")
+    status: Optional[str] = Field(None, description="Queue ingestion mode: queued, processing, done or failed")
     error: Optional[str] = None
 
 
+class AIRequestStatus(BaseModel):
+    messageId: str
+    conversationId: str
+    status: str = Field(..., description="queued, processing, done or failed")
+    response: str = ""
+    error: Optional[str] = None
+    latency_ms: int = 0
+    queued_at: float = Field(..., description="Unix timestamp")
+    finished_at: Optional[float] = None
+
+
 # ── Templates ────────────────────────────────────────────────────────────────
 
 class TemplateCategory(str, Enum):
@@ -71,14 +84,14 @@ class SendTemplateResponse(BaseModel):
 class CampaignSendRequest(BaseModel):
     campaign_id: str = Field(..., description="Campaign UUID from Supabase")
     template_name: str = Field(..., description="Template name to use")
-    audience: str = Field("all", description="Audience segment: all, active_30d, inactive_30d, new_7d")
+    audience: str = Field("all", description="Audience segment: all, active_30d, inactive_30d, new_7d, segment:<id>")
     variables: dict[str, str] = Field(default_factory=dict, description="Default variable values")
 
 
 class CampaignSendResponse(BaseModel):
     success: bool
     task_id: str = Field("", description="Celery task ID for tracking")
-    estimated_recipients: int = 0
+    estimated_recipients: int = Field(0, description="Unknown at launch: the audience is resolved by the planning task")
     error: Optional[str] = None
 
 
@@ -1,13 +1,14 @@
+from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import AIRequestBody, AIResponseBody
-from app.services.rag import generate_ai_response
-from app.services.twilio_service import send_freeform_message
-from app.services.supabase_service import (
-    get_conversation,
-    insert_message,
-    insert_ai_log,
-)
-import time
+from app.config import get_settings
+from app.models.schemas import AIRequestBody, AIResponseBody, AIRequestStatus
+from app.services.ai_responder import process_ai_request, ConversationNotFoundError
+from app.services.ai_queue import enqueue_ai_request, get_ai_request_status
+from app.services.coalescer import coalesce_ai_request
+from app.services.conversation_cache import record_message
+from app.services.rag import get_rag_runtime
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.semantic_cache import get_semantic_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,73 +19,52 @@ router = APIRouter(tags=["AI"])
 async def ai_response(request: AIRequestBody):
     """Process an incoming WhatsApp message and generate an AI response.
 
-    This endpoint replaces the n8n RAG workflow:
-    1. Generates AI response via RAG (LangChain + Supabase pgvector)
-    2. Saves the AI response to Supabase messages
-    3. Sends the response via Twilio WhatsApp
-    4. Logs the interaction to ai_logs
+    In queue ingestion mode the request is only enqueued and the call returns
+    at once; follow it with `GET /api/ai-response/{messageId}`. With
+    coalescing, messages of a burst that are answered by a later request
+    return `status="coalesced"`.
     """
-    start_time = time.time()
-
+    settings = get_settings()
+    # The inbound message is already in Supabase: keep the cached history current without reading it back
+    await record_message(
+        request.conversationId, request.messageId, "customer", request.Body, datetime.now(timezone.utc).isoformat(),
+    )
+    if settings.ai_ingestion_mode == "queue":
+        status = await enqueue_ai_request(request)
+        return AIResponseBody(success=True, status=status)
     try:
-        # 1. Verify conversation exists
-        conversation = await get_conversation(request.conversationId)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-
-        shop_id = conversation.get("shop_id", "")
-
-        # 2. Generate AI response via RAG
-        ai_text = await generate_ai_response(
-            message=request.Body,
-            conversation_id=request.conversationId,
-        )
+        if settings.ai_coalesce_enabled:
+            return await coalesce_ai_request(request)
+        return await process_ai_request(request)
+    except ConversationNotFoundError:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-        # 3. Save AI response to messages
-        await insert_message(
-            conversation_id=request.conversationId,
-            shop_id=shop_id,
-            role="agent",
-            content=ai_text,
-            metadata={"source": "rag-fastapi", "customer_phone": request.From},
-        )
 
-        # 4. Send via Twilio WhatsApp
-        twilio_result = await send_freeform_message(to=request.From, body=ai_text)
+@router.get("/ai-response/{message_id}", response_model=AIRequestStatus)
+async def ai_response_status(message_id: str):
+    """Status of a queued message: queued, processing, done or failed."""
+    status = await get_ai_request_status(message_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown messageId")
+    return status
 
-        if not twilio_result["success"]:
-            logger.error(f"Twilio send failed: {twilio_result.get('error')}")
 
-        # 5. Log the interaction
-        latency_ms = int((time.time() - start_time) * 1000)
-        await insert_ai_log(
-            shop_id=shop_id,
-            conversation_id=request.conversationId,
-            input_text=request.Body,
-            output_text=ai_text,
-            metrics={
-                "latency_ms": latency_ms,
-                "provider": "openrouter-gpt-4o-mini",
-                "source": "fastapi-rag",
-                "twilio_sid": twilio_result.get("message_sid"),
-                "twilio_success": twilio_result["success"],
-            },
-        )
+@router.get("/ai/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the semantic response cache and the query embedding cache."""
+    cache = get_semantic_cache()
+    embeddings = get_rag_runtime().embeddings
+    return {
+        "semantic": await cache.get_stats() if cache else {"enabled": False},
+        "embeddings": embeddings.get_stats() if isinstance(embeddings, CachedEmbeddings) else {"enabled": False},
+    }
 
-        return AIResponseBody(
-            success=True,
-            response=ai_text,
-            latency_ms=latency_ms,
-        )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        latency_ms = int((time.time() - start_time) * 1000)
-        logger.error(f"AI response failed: {e}", exc_info=True)
-        return AIResponseBody(
-            success=False,
-            response="",
-            latency_ms=latency_ms,
-            error=str(e),
-        )
+@router.post("/ai/cache/invalidate")
+async def invalidate_semantic_cache():
+    """Drop every cached answer (e.g. after reseeding the knowledge base)."""
+    cache = get_semantic_cache()
+    if cache is None:
+        return {"enabled": False, "invalidated": False}
+    await cache.invalidate()
+    return {"enabled": True, "invalidated": True}
@@ -8,25 +8,26 @@ from app.models.schemas import (
 from app.services.supabase_service import (
     get_campaign,
     update_campaign,
-    get_audience_phones,
-    get_template_by_name,
 )
+from app.services.template_cache import get_template
 from app.services.twilio_service import send_freeform_message
-from app.tasks.campaign_tasks import send_campaign_bulk
+from app.tasks.campaign_tasks import plan_campaign
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["Campaigns"])
 
 
-@router.post("/campaigns/send", response_model=CampaignSendResponse)
+@router.post("/campaigns/send", response_model=CampaignSendResponse, status_code=202)
 async def launch_campaign(request: CampaignSendRequest):
-    """Launch a campaign: resolve audience, then dispatch bulk send via Celery.
+    """Launch a campaign: validate it, then hand audience planning and sending to Celery.
 
     1. Validate campaign and template exist
-    2. Resolve audience phone numbers
-    3. Dispatch Celery task for async bulk sending
-    4. Update campaign status to 'sending'
+    2. Update campaign status to 'sending'
+    3. Queue `plan_campaign`, which snapshots the audience into campaign_messages
+       and dispatches the chunked chord (no audience scan in the request)
+
+    Returns 202 at once; progress is read from the campaign counters.
     """
     # 1. Validate campaign
     campaign = await get_campaign(request.campaign_id)
@@ -34,7 +35,7 @@ async def launch_campaign(request: CampaignSendRequest):
         raise HTTPException(status_code=404, detail="Campaign not found")
 
     # 2. Validate template
-    template = await get_template_by_name(request.template_name)
+    template = await get_template(request.template_name)
     if not template:
         raise HTTPException(status_code=404, detail=f"Template '{request.template_name}' not found")
 
@@ -45,31 +46,26 @@ async def launch_campaign(request: CampaignSendRequest):
     if not content_sid:
         raise HTTPException(status_code=400, detail="Template has no Twilio Content SID")
 
-    # 3. Resolve audience
-    phones = await get_audience_phones(request.audience)
-    if not phones:
-        raise HTTPException(status_code=400, detail="No recipients found for this audience segment")
-
-    # 4. Dispatch Celery task
-    task = send_campaign_bulk.delay(
-        campaign_id=request.campaign_id,
-        content_sid=content_sid,
-        phones=phones,
-        variables=request.variables,
-    )
+    # 3. Update campaign status (before queuing, so a fast planner's final status isn't overwritten)
+    await update_campaign(request.campaign_id, {"status": "sending"})
 
-    # 5. Update campaign status
-    await update_campaign(request.campaign_id, {
-        "status": "sending",
-        "sent_count": 0,
-    })
+    # 4. Plan and dispatch in the background
+    try:
+        task = plan_campaign.delay(
+            campaign_id=request.campaign_id,
+            content_sid=content_sid,
+            audience=request.audience,
+            variables=request.variables,
+        )
+    except Exception:
+        await update_campaign(request.campaign_id, {"status": campaign["status"]})
+        raise
 
-    logger.info(f"Campaign {request.campaign_id} dispatched: {len(phones)} recipients, task={task.id}")
+    logger.info(f"Campaign {request.campaign_id} accepted: planning audience '{request.audience}', task={task.id}")
 
     return CampaignSendResponse(
         success=True,
         task_id=task.id,
-        estimated_recipients=len(phones),
     )
 
 
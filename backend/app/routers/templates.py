@@ -5,16 +5,17 @@ from app.models.schemas import (
     SendTemplateRequest,
     SendTemplateResponse,
 )
-from app.services.supabase_service import (
-    get_all_templates,
-    get_template_by_name,
-    upsert_template,
+from app.services.template_cache import (
+    get_template,
+    list_templates as list_cached_templates,
+    save_template,
 )
 from app.services.twilio_service import (
     send_template_message,
     create_content_template,
     submit_template_for_approval,
     check_template_approval_status,
+    TERMINAL_APPROVAL_STATUSES,
 )
 import logging
 
@@ -24,8 +25,8 @@ router = APIRouter(tags=["Templates"])
 
 @router.get("/templates", response_model=list[TemplateResponse])
 async def list_templates():
-    """List all WhatsApp templates from Supabase."""
-    templates = await get_all_templates()
+    """List all WhatsApp templates (served from the template cache)."""
+    templates = await list_cached_templates()
     return [
         TemplateResponse(
             id=t["id"],
@@ -84,7 +85,7 @@ async def create_template(request: CreateTemplateRequest):
         "variables": request.variables,
         "twilio_content_sid": content_sid,
     }
-    saved = await upsert_template(template_data)
+    saved = await save_template(template_data)
 
     return TemplateResponse(
         id=saved.get("id", ""),
@@ -103,7 +104,7 @@ async def create_template(request: CreateTemplateRequest):
 async def send_template(request: SendTemplateRequest):
     """Send a WhatsApp template message to a recipient."""
     # Fetch template from DB
-    template = await get_template_by_name(request.template_name)
+    template = await get_template(request.template_name)
     if not template:
         raise HTTPException(status_code=404, detail=f"Template '{request.template_name}' not found")
 
@@ -131,7 +132,7 @@ async def send_template(request: SendTemplateRequest):
 @router.get("/templates/{template_name}/status")
 async def get_template_status(template_name: str):
     """Check the approval status of a template on Twilio/Meta."""
-    template = await get_template_by_name(template_name)
+    template = await get_template(template_name)
     if not template:
         raise HTTPException(status_code=404, detail=f"Template '{template_name}' not found")
 
@@ -141,9 +142,10 @@ async def get_template_status(template_name: str):
 
     result = await check_template_approval_status(content_sid)
 
-    # Update local status if changed
-    if result["success"] and result.get("status") != template["status"]:
-        await upsert_template({
+    # Update local status once Meta has decided (intermediate statuses keep it pending)
+    if (result["success"] and result.get("status") in TERMINAL_APPROVAL_STATUSES
+            and result["status"] != template["status"]):
+        await save_template({
             "name": template_name,
             "status": result["status"],
         })
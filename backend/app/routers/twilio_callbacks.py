@@ -0,0 +1,25 @@
+from urllib.parse import parse_qsl
+from fastapi import APIRouter, HTTPException, Request, Response
+from app.config import get_settings
+from app.services.status_callbacks import enqueue_status_callback, validate_signature
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(tags=["Twilio"])
+
+
+@router.post("/twilio/status-callback", status_code=204)
+async def status_callback(request: Request):
+    """Delivery status callback of campaign messages (Twilio StatusCallback).
+
+    Authenticated by the X-Twilio-Signature header instead of the API key.
+    The callback is only appended to a Redis stream: statuses are applied to
+    `campaign_messages` and the campaign counters in batches.
+    """
+    params = dict(parse_qsl((await request.body()).decode(), keep_blank_values=True))
+    url = get_settings().twilio_status_callback_url or str(request.url)
+    if not validate_signature(url, params, request.headers.get("X-Twilio-Signature", "")):
+        logger.warning(f"Rejected status callback with an invalid signature for {url}")
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+    await enqueue_status_callback(params)
+    return Response(status_code=204)
@@ -0,0 +1,266 @@
+from typing import Optional
+from app.config import get_settings
+from app.models.schemas import AIRequestBody
+from app.services.ai_responder import ConversationNotFoundError
+from app.services.coalescer import merge_requests, run_until_superseded
+from app.services.redis_service import get_redis
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Conversations with pending messages, each listed at most once: a conversation
+# is owned by a single consumer from BLPOP until ack, which keeps its order.
+READY_KEY = "ai:ready"
+# conversation_id -> last heartbeat of the consumer holding it (crash recovery)
+INFLIGHT_KEY = "ai:inflight"
+
+
+def _conversation_key(conversation_id: str) -> str:
+    return f"ai:conv:{conversation_id}"
+
+
+def _status_key(message_id: str) -> str:
+    return f"ai:status:{message_id}"
+
+
+# Enqueue a request unless its messageId is already known (webhook retries).
+# The conversation becomes ready only if it had nothing pending.
+_ENQUEUE_LUA = """
+if redis.call('HSETNX', KEYS[3], 'status', 'queued') == 0 then
+  return redis.call('HGET', KEYS[3], 'status')
+end
+redis.call('HSET', KEYS[3], 'conversation_id', ARGV[2], 'queued_at', ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+if redis.call('RPUSH', KEYS[1], ARGV[1]) == 1 then
+  redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+return 'queued'
+"""
+
+# Drop the ARGV[2] processed messages; hand the conversation back if more wait.
+_ACK_LUA = """
+redis.call('LTRIM', KEYS[1], ARGV[2], -1)
+redis.call('HDEL', KEYS[3], ARGV[1])
+if redis.call('LLEN', KEYS[1]) > 0 then
+  redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+# Refresh a held conversation's timestamp, unless the sweeper took it back already.
+_HEARTBEAT_LUA = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+  redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+  return 1
+end
+return 0
+"""
+
+# Give a conversation back if its consumer stopped heartbeating (died mid-processing).
+_REQUEUE_STALE_LUA = """
+local ts = redis.call('HGET', KEYS[1], ARGV[1])
+if ts and tonumber(ts) < tonumber(ARGV[2]) then
+  redis.call('HDEL', KEYS[1], ARGV[1])
+  redis.call('RPUSH', KEYS[2], ARGV[1])
+  return 1
+end
+return 0
+"""
+
+
+async def enqueue_ai_request(request: AIRequestBody) -> str:
+    """Queue an inbound message; returns its status ('queued', or the current one for a duplicate)."""
+    settings = get_settings()
+    redis = get_redis()
+    status = await redis.register_script(_ENQUEUE_LUA)(
+        keys=[_conversation_key(request.conversationId), READY_KEY, _status_key(request.messageId)],
+        args=[request.model_dump_json(), request.conversationId, time.time(), settings.ai_queue_status_ttl_seconds],
+    )
+    return status.decode() if isinstance(status, bytes) else status
+
+
+async def _set_status(message_id: str, **fields):
+    await get_redis().hset(_status_key(message_id), mapping=fields)
+
+
+async def get_ai_request_status(message_id: str) -> Optional[dict]:
+    """Current state of a queued message, or None if unknown or expired."""
+    data = {k.decode(): v.decode() for k, v in (await get_redis().hgetall(_status_key(message_id))).items()}
+    if not data:
+        return None
+    return {
+        "messageId": message_id,
+        "conversationId": data.get("conversation_id", ""),
+        "status": data["status"],
+        "response": data.get("response", ""),
+        "error": data.get("error") or None,
+        "latency_ms": int(data.get("latency_ms", 0)),
+        "queued_at": float(data.get("queued_at", 0)),
+        "finished_at": float(data["finished_at"]) if "finished_at" in data else None,
+    }
+
+
+class AIQueueConsumers:
+    """Pool of async consumers running the AI pipeline for queued messages.
+
+    At most `concurrency` messages are processed at once per process, and one
+    conversation is never processed by two consumers at the same time, so
+    replies follow the order of the inbound messages. With a coalesce window,
+    a burst of messages gets a single reply, regenerated if another message
+    arrives before it is sent.
+    """
+
+    def __init__(self, concurrency: int, stale_seconds: int, coalesce_window: float = 0.0):
+        self.concurrency = concurrency
+        self.stale_seconds = stale_seconds
+        self.coalesce_window = coalesce_window  # 0 = one reply per message
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self, timeout: float = 30.0):
+        """Let in-flight messages finish (up to `timeout`), then cancel."""
+        self._stopping = True
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            # Their conversations stay in INFLIGHT_KEY and are requeued by the sweeper
+            logger.warning(f"AI queue: {len(pending)} consumers cancelled at shutdown")
+
+    async def _consume(self):
+        redis = get_redis()
+        while not self._stopping:
+            try:
+                item = await redis.blpop(READY_KEY, timeout=1)
+                if item is None:
+                    continue
+                await self._process_conversation(item[1].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"AI queue consumer error: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _collect(self, key: str) -> list[bytes]:
+        """Messages to answer now: the head, or the whole burst once it has settled."""
+        redis = get_redis()
+        if not self.coalesce_window:
+            head = await redis.lindex(key, 0)
+            return [head] if head is not None else []
+        # Debounce: wait until no message arrived for a full window (at most 5 windows)
+        count = await redis.llen(key)
+        for _ in range(5):
+            await asyncio.sleep(self.coalesce_window)
+            latest = await redis.llen(key)
+            if latest == count:
+                break
+            count = latest
+        return await redis.lrange(key, 0, -1)
+
+    async def _process_conversation(self, conversation_id: str):
+        redis = get_redis()
+        key = _conversation_key(conversation_id)
+        await redis.hset(INFLIGHT_KEY, conversation_id, time.time())
+        heartbeat = asyncio.create_task(self._heartbeat(conversation_id))
+
+        processed = 0
+        try:
+            while True:
+                raw_requests = await self._collect(key)
+                if not raw_requests:
+                    break
+                requests = [AIRequestBody.model_validate_json(raw) for raw in raw_requests]
+
+                async def is_superseded() -> bool:
+                    return self.coalesce_window > 0 and await redis.llen(key) > len(raw_requests)
+
+                if await self._process(requests, is_superseded):
+                    processed = len(raw_requests)
+                    break
+                # A newer message arrived mid-generation: answer the whole burst instead
+        finally:
+            heartbeat.cancel()
+
+        await redis.register_script(_ACK_LUA)(keys=[key, READY_KEY, INFLIGHT_KEY], args=[conversation_id, processed])
+
+    async def _heartbeat(self, conversation_id: str):
+        """Keep a held conversation fresh so the sweeper only requeues those of dead consumers."""
+        beat = get_redis().register_script(_HEARTBEAT_LUA)
+        while True:
+            await asyncio.sleep(max(1, self.stale_seconds / 3))
+            try:
+                if not await beat(keys=[INFLIGHT_KEY], args=[conversation_id, time.time()]):
+                    logger.warning(f"AI queue: conversation {conversation_id} was requeued while still processing")
+                    return
+            except Exception as e:
+                logger.warning(f"AI queue heartbeat failed for {conversation_id}: {e}")
+
+    async def _process(self, requests: list[AIRequestBody], is_superseded) -> bool:
+        """Answer `requests` with one reply; False if superseded before sending."""
+        for request in requests:
+            await _set_status(request.messageId, status="processing")
+        try:
+            result = await run_until_superseded(merge_requests(requests), is_superseded)
+            if result is None:
+                return False
+            fields = {
+                "status": "done" if result.success else "failed",
+                "response": result.response,
+                "error": result.error or "",
+                "latency_ms": result.latency_ms,
+            }
+        except ConversationNotFoundError:
+            fields = {"status": "failed", "error": "Conversation not found"}
+        except Exception as e:
+            logger.error(f"AI queue processing failed for {requests[-1].messageId}: {e}", exc_info=True)
+            fields = {"status": "failed", "error": str(e)}
+        for request in requests:
+            await _set_status(request.messageId, finished_at=time.time(), **fields)
+        return True
+
+    async def _sweep(self):
+        requeue = get_redis().register_script(_REQUEUE_STALE_LUA)
+        while not self._stopping:
+            try:
+                cutoff = time.time() - self.stale_seconds
+                for conversation_id, ts in (await get_redis().hgetall(INFLIGHT_KEY)).items():
+                    if float(ts) < cutoff and await requeue(keys=[INFLIGHT_KEY, READY_KEY], args=[conversation_id, cutoff]):
+                        logger.warning(f"AI queue: requeued stale conversation {conversation_id.decode()}")
+            except Exception as e:
+                logger.error(f"AI queue sweep failed: {e}", exc_info=True)
+            for _ in range(max(1, self.stale_seconds // 2)):
+                if self._stopping:
+                    return
+                await asyncio.sleep(1)
+
+
+_consumers: Optional[AIQueueConsumers] = None
+
+
+def start_ai_consumers():
+    """Start the consumer pool in queue ingestion mode (FastAPI startup)."""
+    global _consumers
+    settings = get_settings()
+    if settings.ai_ingestion_mode != "queue" or _consumers is not None:
+        return
+    _consumers = AIQueueConsumers(
+        concurrency=settings.ai_queue_concurrency,
+        stale_seconds=settings.ai_queue_stale_seconds,
+        coalesce_window=settings.ai_coalesce_window_seconds if settings.ai_coalesce_enabled else 0.0,
+    )
+    _consumers.start()
+    logger.info(f"AI queue: {settings.ai_queue_concurrency} consumers started")
+
+
+async def stop_ai_consumers():
+    """Stop the consumer pool (FastAPI shutdown)."""
+    global _consumers
+    if _consumers is not None:
+        await _consumers.stop()
+        _consumers = None
@@ -0,0 +1,153 @@
+from app.config import get_settings
+from app.models.schemas import AIRequestBody, AIResponseBody
+from app.services.rag import run_rag
+from app.services.twilio_service import send_freeform_message
+from app.services.conversation_cache import get_conversation
+from app.services.write_behind import queue_message, queue_ai_log
+from typing import Callable, Optional
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _streaming_enabled(conversation: dict) -> bool:
+    """Per-conversation switch (`conversations.ai_streaming`), NULL meaning the global default."""
+    enabled = conversation.get("ai_streaming")
+    return get_settings().ai_streaming_enabled if enabled is None else enabled
+
+
+class ConversationNotFoundError(Exception):
+    pass
+
+
+async def process_ai_request(
+    request: AIRequestBody,
+    on_commit: Optional[Callable[[], None]] = None,
+) -> AIResponseBody:
+    """Generate, send and record the AI reply to an incoming WhatsApp message.
+
+    Replaces the n8n RAG workflow (called inline by `/api/ai-response`, or by
+    the ingestion queue consumers):
+    1. Generates AI response via RAG (LangChain + Supabase pgvector)
+    2. Queues the AI response for Supabase messages (write-behind)
+    3. Sends the response via Twilio WhatsApp
+    4. Queues the interaction for ai_logs
+
+    In streaming mode (per conversation), the first sentence is sent as soon
+    as it is generated and the rest follows as a second WhatsApp message; the
+    full text is still stored once.
+
+    `on_commit` is called right before anything is sent to the customer; until
+    then the call can be cancelled without side effects.
+    """
+    start_time = time.time()
+    timings: dict[str, int] = {}
+
+    def _lap(key: str, since: float) -> float:
+        now = time.time()
+        timings[key] = int((now - since) * 1000)
+        return now
+
+    try:
+        # 1. Verify conversation exists
+        step = time.time()
+        conversation = await get_conversation(request.conversationId)
+        if not conversation:
+            raise ConversationNotFoundError(request.conversationId)
+        step = _lap("conversation_ms", step)
+
+        shop_id = conversation.get("shop_id", "")
+
+        # 2. Generate AI response via RAG (first segment dispatched early when streaming)
+        first_send: Optional[asyncio.Task] = None
+
+        def send_first_segment(segment: str):
+            nonlocal first_send
+            if on_commit:
+                on_commit()
+            first_send = asyncio.create_task(send_freeform_message(to=request.From, body=segment))
+
+        rag = await run_rag(
+            message=request.Body,
+            conversation_id=request.conversationId,
+            on_first_segment=send_first_segment if _streaming_enabled(conversation) else None,
+        )
+        ai_text = rag.text
+        timings.update(rag.timings)
+        step = time.time()
+        if on_commit and first_send is None:
+            on_commit()
+
+        # 3. Save AI response to messages (write-behind), overlapping with the Twilio send
+        persist = asyncio.create_task(queue_message(
+            conversation_id=request.conversationId,
+            shop_id=shop_id,
+            role="agent",
+            content=ai_text,
+            metadata={"source": "rag-fastapi", "customer_phone": request.From},
+        ))
+
+        # 4. Send via Twilio WhatsApp (the rest of the reply, when the first segment went out already)
+        twilio_results = []
+        remaining = ai_text
+        if first_send is not None:
+            first_result = await first_send
+            twilio_results.append(first_result)
+            if first_result["success"]:
+                remaining = rag.remainder
+        if remaining:
+            twilio_results.append(await send_freeform_message(to=request.From, body=remaining))
+        step = _lap("twilio_ms", step)
+        await persist
+        _lap("persist_wait_ms", step)
+
+        twilio_result = twilio_results[0] if twilio_results else {"success": False, "error": "empty reply"}
+        for result in twilio_results:
+            if not result["success"]:
+                logger.error(f"Twilio send failed: {result.get('error')}")
+
+        # 5. Log the interaction (write-behind)
+        latency_ms = int((time.time() - start_time) * 1000)
+        await queue_ai_log(
+            shop_id=shop_id,
+            conversation_id=request.conversationId,
+            input_text=request.Body,
+            output_text=ai_text,
+            metrics={
+                "latency_ms": latency_ms,
+                "provider": "openrouter-gpt-4o-mini",
+                "source": "fastapi-rag",
+                "twilio_sid": twilio_result.get("message_sid"),
+                "twilio_success": twilio_result["success"] and all(result["success"] for result in twilio_results),
+                "twilio_sids": [result.get("message_sid") for result in twilio_results],
+                "streamed": rag.first_segment is not None,
+                "docs_count": rag.docs_count,
+                "cache_hit": rag.cache_hit,
+                "tokens": rag.token_counts,
+                "timings": timings,
+            },
+        )
+
+        logger.info(f"AI response for {request.conversationId}: {latency_ms}ms {timings}")
+
+        return AIResponseBody(
+            success=True,
+            response=ai_text,
+            latency_ms=latency_ms,
+            timings=timings,
+        )
+
+    except ConversationNotFoundError:
+        raise
+    except Exception as e:
+        latency_ms = int((time.time() - start_time) * 1000)
+        logger.error(f"AI response failed: {e}", exc_info=True)
+        return AIResponseBody(
+            success=False,
+            response="",
+            latency_ms=latency_ms,
+            timings=timings,
+            error=str(e),
+        )
@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SendResult:
+    phone: str
+    success: bool
+    message_sid: Optional[str] = None
+    error: Optional[str] = None
+
+
+SendFn = Callable[[str], Awaitable[dict]]
+
+
+async def send_bulk(
+    phones: Iterable[str],
+    send: SendFn,
+    rate_limiter,
+    concurrency: int = 20,
+) -> list[SendResult]:
+    """Send to every phone on the current event loop.
+
+    Up to `concurrency` sends are in flight at once; each one first takes a
+    token from `rate_limiter`, so throughput is capped by the bucket rate and
+    not by per-request latency. `send` must return the
+    `{"success", "message_sid", "error"}` dict used by twilio_service.
+    If a worker raises, the other workers are cancelled before the error
+    propagates.
+    """
+    queue = iter(phones)
+    results: list[SendResult] = []
+
+    async def _worker():
+        for phone in queue:
+            await rate_limiter.acquire()
+            try:
+                response = await send(phone)
+                result = SendResult(
+                    phone=phone,
+                    success=response["success"],
+                    message_sid=response.get("message_sid"),
+                    error=response.get("error"),
+                )
+            except Exception as e:
+                logger.error(f"Bulk send to {phone} raised: {e}")
+                result = SendResult(phone=phone, success=False, error=str(e))
+
+            results.append(result)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        # A worker raised (e.g. the rate limiter lost Redis) or we were cancelled:
+        # none may keep sending once the caller has given up on the batch
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    return results
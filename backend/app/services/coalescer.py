@@ -0,0 +1,113 @@
+from contextlib import suppress
+from typing import Awaitable, Callable, Optional
+from app.config import get_settings
+from app.models.schemas import AIRequestBody, AIResponseBody
+from app.services.ai_responder import process_ai_request
+from app.services.redis_service import get_redis
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+COALESCED_STATUS = "coalesced"
+PENDING_TTL_SECONDS = 3600
+SUPERSEDED_POLL_SECONDS = 0.2
+
+
+def _pending_key(conversation_id: str) -> str:
+    return f"ai:pending:{conversation_id}"
+
+
+def _generation_key(conversation_id: str) -> str:
+    return f"ai:pending_gen:{conversation_id}"
+
+
+def merge_requests(requests: list[AIRequestBody]) -> AIRequestBody:
+    """One request for a burst of messages: bodies in arrival order, ids of the latest."""
+    if len(requests) == 1:
+        return requests[0]
+    return requests[-1].model_copy(update={"Body": "\n".join(request.Body for request in requests)})
+
+
+async def run_until_superseded(
+    request: AIRequestBody,
+    is_superseded: Callable[[], Awaitable[bool]],
+    on_commit: Optional[Callable[[], None]] = None,
+) -> Optional[AIResponseBody]:
+    """Run the AI pipeline, cancelling it if a newer message arrives before the reply is sent.
+
+    Returns None when cancelled. Once the reply starts going out (commit),
+    newer messages no longer cancel it.
+    """
+    committed = False
+
+    def commit():
+        nonlocal committed
+        committed = True
+        if on_commit:
+            on_commit()
+
+    task = asyncio.create_task(process_ai_request(request, on_commit=commit))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=SUPERSEDED_POLL_SECONDS)
+        if done:
+            return task.result()
+        if not committed and await is_superseded() and not committed:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+            logger.info(f"Generation for conversation {request.conversationId} superseded by a newer message")
+            return None
+
+
+async def coalesce_ai_request(request: AIRequestBody) -> AIResponseBody:
+    """Debounce a conversation's messages in synchronous ingestion mode.
+
+    Each message is appended to a per-conversation pending list and bumps a
+    generation counter; after `ai_coalesce_window_seconds` only the latest
+    message's request goes on, answering every pending message in one reply.
+    Earlier requests return `status="coalesced"` without replying.
+    """
+    settings = get_settings()
+    redis = get_redis()
+    pending_key = _pending_key(request.conversationId)
+    generation_key = _generation_key(request.conversationId)
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.rpush(pending_key, request.model_dump_json())
+        pipe.incr(generation_key)
+        pipe.expire(pending_key, PENDING_TTL_SECONDS)
+        pipe.expire(generation_key, PENDING_TTL_SECONDS)
+        _, generation, _, _ = await pipe.execute()
+
+    async def is_superseded() -> bool:
+        return int(await redis.get(generation_key) or 0) != generation
+
+    await asyncio.sleep(settings.ai_coalesce_window_seconds)
+    if await is_superseded():
+        return AIResponseBody(success=True, status=COALESCED_STATUS)
+
+    raw_requests = await redis.lrange(pending_key, 0, -1)
+    requests = [AIRequestBody.model_validate_json(raw) for raw in raw_requests] or [request]
+    trim: Optional[asyncio.Task] = None
+
+    def consume_pending():
+        # Drop the answered messages as soon as the reply is committed, so a
+        # newer request does not answer them again
+        nonlocal trim
+        trim = asyncio.create_task(redis.ltrim(pending_key, len(raw_requests), -1))
+
+    try:
+        result = await run_until_superseded(merge_requests(requests), is_superseded, on_commit=consume_pending)
+    finally:
+        if trim is None and not await is_superseded():
+            # Failed before replying: do not carry these messages into the next turn
+            consume_pending()
+        if trim is not None:
+            await trim
+
+    if result is None:
+        return AIResponseBody(success=True, status=COALESCED_STATUS)
+    if len(requests) > 1:
+        logger.info(f"Coalesced {len(requests)} messages of conversation {request.conversationId} into one reply")
+    return result
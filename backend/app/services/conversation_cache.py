@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from app.config import get_settings
+from app.services.redis_service import get_redis
+from app.services.supabase_service import (
+    get_conversation as fetch_conversation,
+    get_conversation_messages,
+    get_newest_message_id,
+)
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Append a turn to a cached conversation and bump its version (only if it is
+# cached: a cold conversation is loaded whole on the next read). Returns the
+# new version, 0 if nothing was appended. KEYS: turns list, state hash.
+_APPEND_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 0 or redis.call('HGET', KEYS[2], 'newest_id') == ARGV[3] then
+  return 0
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('HSET', KEYS[2], 'newest_id', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return redis.call('HINCRBY', KEYS[2], 'version', 1)
+"""
+
+
+@dataclass
+class _LocalHistory:
+    turns: list[dict]
+    version: int
+
+
+class ConversationContextCache:
+    """Recent turns and metadata of conversations, in Redis with a local LRU in front.
+
+    Turns are kept in a per-conversation ring buffer (Redis list capped at
+    `history_size`) written through by the backend: its replies and every
+    inbound message received by `/api/ai-response`. Each write bumps a
+    version in Redis, which is all a read checks before using the local copy,
+    so the hot path never queries Supabase. Messages written elsewhere (e.g.
+    an operator reply from the dashboard) are picked up by a light newest-id
+    check at most every `revalidate_seconds`. Idle conversations expire
+    after `ttl_seconds`. Conversation rows are cached for `meta_ttl_seconds`.
+    """
+
+    def __init__(self, history_size: int, ttl_seconds: int, meta_ttl_seconds: int, local_max_entries: int,
+                 revalidate_seconds: int):
+        self.history_size = history_size
+        self.ttl_seconds = ttl_seconds
+        self.meta_ttl_seconds = meta_ttl_seconds
+        self.local_max_entries = local_max_entries
+        self.revalidate_seconds = revalidate_seconds
+        self._history: "OrderedDict[str, _LocalHistory]" = OrderedDict()
+        self._meta: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self.stats = {
+            "local_hits": 0, "redis_hits": 0, "revalidations": 0, "reloads": 0, "meta_hits": 0, "meta_misses": 0,
+        }
+
+    @staticmethod
+    def _turns_key(conversation_id: str) -> str:
+        return f"convctx:{conversation_id}:turns"
+
+    @staticmethod
+    def _state_key(conversation_id: str) -> str:
+        return f"convctx:{conversation_id}:state"
+
+    @staticmethod
+    def _meta_key(conversation_id: str) -> str:
+        return f"convctx:{conversation_id}:meta"
+
+    def _remember(self, store: OrderedDict, key: str, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.local_max_entries:
+            store.popitem(last=False)
+
+    # ── Conversation row ─────────────────────────────────────────────────────
+
+    async def get_conversation(self, conversation_id: str) -> Optional[dict]:
+        cached = self._meta.get(conversation_id)
+        if cached and cached[0] > time.monotonic():
+            self._meta.move_to_end(conversation_id)
+            self.stats["meta_hits"] += 1
+            return cached[1]
+
+        redis = get_redis()
+        raw = await redis.get(self._meta_key(conversation_id))
+        if raw is not None:
+            conversation = json.loads(raw)
+            self.stats["meta_hits"] += 1
+        else:
+            conversation = await fetch_conversation(conversation_id)
+            self.stats["meta_misses"] += 1
+            if conversation is None:
+                return None
+            await redis.set(self._meta_key(conversation_id), json.dumps(conversation), ex=self.meta_ttl_seconds)
+
+        self._remember(self._meta, conversation_id, (time.monotonic() + self.meta_ttl_seconds, conversation))
+        return conversation
+
+    # ── Recent turns ─────────────────────────────────────────────────────────
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[dict]:
+        """Last `limit` messages, oldest first (`id`, `role`, `content`, `created_at`)."""
+        version, checked_at = await get_redis().hmget(self._state_key(conversation_id), "version", "checked_at")
+        if version is None:
+            entry = await self._reload(conversation_id)
+        else:
+            entry = self._history.get(conversation_id)
+            if entry is not None and entry.version == int(version):
+                self._history.move_to_end(conversation_id)
+                self.stats["local_hits"] += 1
+            else:
+                entry = await self._load(conversation_id)
+                self.stats["redis_hits"] += 1
+            if entry is None:
+                entry = await self._reload(conversation_id)
+            elif time.time() - float(checked_at or 0) >= self.revalidate_seconds:
+                entry = await self._revalidate(conversation_id, entry)
+
+        self._remember(self._history, conversation_id, entry)
+        return entry.turns[-limit:]
+
+    async def _revalidate(self, conversation_id: str, entry: _LocalHistory) -> _LocalHistory:
+        """Reload only if Supabase's newest message is unknown to the cache (written elsewhere)."""
+        self.stats["revalidations"] += 1
+        newest_id = await get_newest_message_id(conversation_id)
+        if newest_id is None or any(turn["id"] == newest_id for turn in entry.turns):
+            # Backend rows still in the write-behind queue are newer than Supabase's: not a miss
+            await get_redis().hset(self._state_key(conversation_id), "checked_at", time.time())
+            return entry
+        return await self._reload(conversation_id, keep=entry.turns)
+
+    async def _reload(self, conversation_id: str, keep: list[dict] = ()) -> _LocalHistory:
+        """Load the history from Supabase, plus `keep` turns not flushed yet by the write-behind queue."""
+        self.stats["reloads"] += 1
+        turns = await get_conversation_messages(conversation_id, limit=self.history_size)
+        if keep:
+            known = {turn["id"] for turn in turns}
+            newest = turns[-1]["created_at"] if turns else ""
+            turns += [turn for turn in keep if turn["id"] not in known and turn["created_at"] > newest]
+        turns = turns[-self.history_size:]
+
+        turns_key, state_key = self._turns_key(conversation_id), self._state_key(conversation_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(turns_key)
+            if turns:
+                pipe.rpush(turns_key, *[json.dumps(turn) for turn in turns])
+            pipe.hset(state_key, mapping={"newest_id": turns[-1]["id"] if turns else "", "checked_at": time.time()})
+            pipe.hincrby(state_key, "version", 1)
+            pipe.expire(turns_key, self.ttl_seconds)
+            pipe.expire(state_key, self.ttl_seconds)
+            version = (await pipe.execute())[3 if turns else 2]
+        return _LocalHistory(turns, version)
+
+    async def _load(self, conversation_id: str) -> Optional[_LocalHistory]:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hget(self._state_key(conversation_id), "version")
+            pipe.lrange(self._turns_key(conversation_id), 0, -1)
+            version, raw_turns = await pipe.execute()
+        if version is None:
+            return None
+        return _LocalHistory([json.loads(raw) for raw in raw_turns], int(version))
+
+    async def append(self, conversation_id: str, message_id: str, role: str, content: str, created_at: str):
+        """Write-through of a message the backend knows about (sent or received)."""
+        turn = {"id": message_id, "role": role, "content": content, "created_at": created_at}
+        version = await get_redis().register_script(_APPEND_LUA)(
+            keys=[self._turns_key(conversation_id), self._state_key(conversation_id)],
+            args=[json.dumps(turn), self.history_size, message_id, self.ttl_seconds],
+        )
+        # Keep the local copy current when it was the latest version; otherwise the next read reloads it
+        local = self._history.get(conversation_id)
+        if version and local is not None and local.version == version - 1:
+            local.turns = (local.turns + [turn])[-self.history_size:]
+            local.version = version
+
+
+_cache: Optional[ConversationContextCache] = None
+
+
+def get_conversation_cache() -> Optional[ConversationContextCache]:
+    """Get the process-wide conversation cache, or None when disabled."""
+    global _cache
+    settings = get_settings()
+    if not settings.conversation_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = ConversationContextCache(
+            history_size=settings.max_conversation_history,
+            ttl_seconds=settings.conversation_cache_ttl_seconds,
+            meta_ttl_seconds=settings.conversation_cache_meta_ttl_seconds,
+            local_max_entries=settings.conversation_cache_local_max_entries,
+            revalidate_seconds=settings.conversation_cache_revalidate_seconds,
+        )
+    return _cache
+
+
+async def get_conversation(conversation_id: str) -> Optional[dict]:
+    """Conversation row, from the cache when enabled."""
+    cache = get_conversation_cache()
+    if cache is None:
+        return await fetch_conversation(conversation_id)
+    try:
+        return await cache.get_conversation(conversation_id)
+    except Exception as e:
+        logger.warning(f"Conversation cache read failed: {e}")
+        return await fetch_conversation(conversation_id)
+
+
+async def get_recent_messages(conversation_id: str, limit: int) -> list[dict]:
+    """Recent messages of a conversation, oldest first, from the cache when enabled."""
+    cache = get_conversation_cache()
+    if cache is not None:
+        try:
+            return await cache.get_recent_messages(conversation_id, limit)
+        except Exception as e:
+            logger.warning(f"Conversation cache read failed: {e}")
+    return await get_conversation_messages(conversation_id, limit=limit)
+
+
+async def record_message(conversation_id: str, message_id: str, role: str, content: str, created_at: str):
+    """Best-effort write-through; a miss only costs a reload on the next read."""
+    cache = get_conversation_cache()
+    if cache is None:
+        return
+    try:
+        await cache.append(conversation_id, message_id, role, content, created_at)
+    except Exception as e:
+        logger.warning(f"Conversation cache write failed: {e}")
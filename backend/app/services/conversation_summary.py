@@ -0,0 +1,108 @@
+from dataclasses import dataclass, asdict
+from typing import Optional
+from app.config import get_settings
+from app.services.prompt_builder import format_turn
+from app.services.redis_service import get_redis
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Tu tiens à jour le résumé d'une conversation WhatsApp entre un client et le Concierge Bobotcho.
+
+Résumé actuel :
+{summary}
+
+Nouveaux échanges :
+{turns}
+
+Réécris le résumé en y intégrant les nouveaux échanges : besoins et objections du client, informations déjà données (prix, quartier, livraison, paiement), engagements pris. Français, style télégraphique, {max_words} mots maximum."""
+
+SUMMARY_LOCK_SECONDS = 60
+
+# Keep references so running updates are not garbage-collected
+_updates: set[asyncio.Task] = set()
+
+
+@dataclass
+class ConversationSummary:
+    text: str = ""
+    through_id: Optional[str] = None  # Last message folded into the summary
+    turns: int = 0  # Messages folded so far
+
+
+def _summary_key(conversation_id: str) -> str:
+    return f"convctx:{conversation_id}:summary"
+
+
+def _lock_key(conversation_id: str) -> str:
+    return f"convctx:{conversation_id}:summary_lock"
+
+
+async def get_summary(conversation_id: str) -> ConversationSummary:
+    """Cached rolling summary of a conversation (empty if none yet or on Redis failure)."""
+    if not get_settings().conversation_summary_enabled:
+        return ConversationSummary()
+    try:
+        raw = await get_redis().get(_summary_key(conversation_id))
+    except Exception as e:
+        logger.warning(f"Conversation summary read failed: {e}")
+        return ConversationSummary()
+    return ConversationSummary(**json.loads(raw)) if raw else ConversationSummary()
+
+
+def unsummarized_turns(summary: ConversationSummary, dropped: list[dict], kept: list[dict]) -> list[dict]:
+    """Turns left out of the prompt that the summary does not cover yet (oldest first)."""
+    dropped_ids = [turn.get("id") for turn in dropped]
+    if summary.through_id in dropped_ids:
+        return dropped[dropped_ids.index(summary.through_id) + 1:]
+    if summary.through_id and any(turn.get("id") == summary.through_id for turn in kept):
+        return []
+    return dropped
+
+
+async def _update_summary(chain, conversation_id: str, summary: ConversationSummary, turns: list[dict]):
+    settings = get_settings()
+    redis = get_redis()
+    if not await redis.set(_lock_key(conversation_id), 1, nx=True, ex=SUMMARY_LOCK_SECONDS):
+        return  # Another process is folding these turns already
+    try:
+        result = await chain.ainvoke({
+            "summary": summary.text or "(aucun)",
+            "turns": "\n".join(format_turn(turn) for turn in turns),
+            "max_words": settings.conversation_summary_max_words,
+        })
+        updated = ConversationSummary(
+            text=result.content.strip(),
+            through_id=turns[-1].get("id"),
+            turns=summary.turns + len(turns),
+        )
+        await redis.set(
+            _summary_key(conversation_id),
+            json.dumps(asdict(updated)),
+            ex=settings.conversation_summary_ttl_seconds,
+        )
+        logger.debug(f"Summary of conversation {conversation_id} now covers {updated.turns} messages")
+    except Exception as e:
+        logger.warning(f"Conversation summary update failed for {conversation_id}: {e}")
+    finally:
+        await redis.delete(_lock_key(conversation_id))
+
+
+def schedule_summary_update(chain, conversation_id: str, summary: ConversationSummary,
+                            dropped: list[dict], kept: list[dict]):
+    """Fold the turns that just left the prompt into the summary, in the background.
+
+    The summary is extended with the new turns only (never regenerated from
+    the full history); the reply does not wait for it, so the next message
+    uses the updated summary.
+    """
+    if not get_settings().conversation_summary_enabled:
+        return
+    turns = unsummarized_turns(summary, dropped, kept)
+    if not turns:
+        return
+    task = asyncio.create_task(_update_summary(chain, conversation_id, summary, turns))
+    _updates.add(task)
+    task.add_done_callback(_updates.discard)
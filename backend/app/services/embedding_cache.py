@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from typing import Optional
+from langchain_core.embeddings import Embeddings
+from app.services.redis_service import get_redis
+import numpy as np
+import hashlib
+import re
+import time
+import unicodedata
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SPACES = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([?!.,;:])")
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a customer message for cache keys.
+
+    "  Prix ?" and "prix?" map to the same key; wording is otherwise kept.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().strip()
+    text = _SPACES.sub(" ", text)
+    return _SPACE_BEFORE_PUNCT.sub(r"\1", text)
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of a query embeddings model.
+
+    Keys are sha256(model + normalized text). Vectors are stored as float32
+    bytes in an in-process LRU and, optionally, in Redis with a TTL so every
+    process shares them. Document embeddings are not cached.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, max_entries: int,
+                 ttl_seconds: int, use_redis: bool = True):
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_redis = use_redis
+        self._local: "OrderedDict[str, bytes]" = OrderedDict()
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "miss_ms_total": 0}
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(f"{self.model}\n{normalize_query(text)}".encode()).hexdigest()
+        return f"emb:{self.model}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[bytes]:
+        value = self._local.get(key)
+        if value is not None:
+            self._local.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: bytes):
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _to_bytes(vector: list[float]) -> bytes:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    @staticmethod
+    def _to_list(value: bytes) -> list[float]:
+        return np.frombuffer(value, dtype=np.float32).tolist()
+
+    def _record_miss(self, start: float):
+        self.stats["misses"] += 1
+        self.stats["miss_ms_total"] += int((time.perf_counter() - start) * 1000)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        value = self._get_local(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return self._to_list(value)
+
+        start = time.perf_counter()
+        vector = self.underlying.embed_query(text)
+        self._record_miss(start)
+        self._put_local(key, self._to_bytes(vector))
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        value = self._get_local(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return self._to_list(value)
+
+        if self.use_redis:
+            try:
+                value = await get_redis().get(key)
+            except Exception as e:
+                logger.warning(f"Embedding cache read failed: {e}")
+            if value is not None:
+                self.stats["redis_hits"] += 1
+                self._put_local(key, value)
+                return self._to_list(value)
+
+        start = time.perf_counter()
+        vector = await self.underlying.aembed_query(text)
+        self._record_miss(start)
+
+        value = self._to_bytes(vector)
+        self._put_local(key, value)
+        if self.use_redis:
+            try:
+                await get_redis().set(key, value, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+        return vector
+
+    def get_stats(self) -> dict:
+        """Hit ratio and the embedding latency saved by hits (estimated from the mean miss)."""
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        lookups = hits + self.stats["misses"]
+        mean_miss_ms = self.stats["miss_ms_total"] / self.stats["misses"] if self.stats["misses"] else 0.0
+        return {
+            "enabled": True,
+            "model": self.model,
+            "entries": len(self._local),
+            **self.stats,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "mean_miss_ms": round(mean_miss_ms, 1),
+            "saved_ms_estimate": int(hits * mean_miss_ms),
+        }
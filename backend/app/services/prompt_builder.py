@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+from typing import Optional
+from app.config import Settings
+from app.services.retrieval import RetrievedChunk
+from app.services.tokens import count_tokens
+
+NO_CONTEXT = "Aucune information spécifique trouvée dans la base de connaissances."
+SUMMARY_LABEL = "Résumé des échanges précédents"
+
+
+@dataclass
+class PromptParts:
+    context: str
+    chat_history: str
+    chunks_used: int = 0
+    history_turns: list[dict] = field(default_factory=list)  # Turns kept verbatim, oldest first
+    dropped_turns: list[dict] = field(default_factory=list)  # Older loaded turns, left to the summary
+    token_counts: dict[str, int] = field(default_factory=dict)
+
+
+def format_turn(message: dict) -> str:
+    role_label = "Client" if message["role"] == "customer" else "Concierge"
+    return f"{role_label}: {message['content']}"
+
+
+def build_prompt(
+    system_tokens: int,
+    question: str,
+    chunks: list[RetrievedChunk],
+    history: list[dict],
+    summary: Optional[str],
+    settings: Settings,
+) -> PromptParts:
+    """Pack retrieved context, conversation summary and recent turns into `prompt_max_tokens`.
+
+    `system_tokens` is the size of the system prompt without its variables.
+    Priority order: context chunks (best first, within `rag_context_max_tokens`),
+    the rolling summary, then the most recent turns (at most
+    `conversation_summary_keep_turns`, newest first). Turns that do not fit
+    are returned in `dropped_turns` so the summary can absorb them.
+    """
+    counts = {"system": system_tokens, "question": count_tokens(question)}
+    remaining = settings.prompt_max_tokens - system_tokens - counts["question"]
+
+    # 1. Context
+    kept_chunks: list[str] = []
+    context_budget = min(remaining, settings.rag_context_max_tokens)
+    used = 0
+    for chunk in chunks:
+        tokens = chunk.tokens or count_tokens(chunk.content)
+        if used + tokens > context_budget:
+            break
+        kept_chunks.append(chunk.content)
+        used += tokens
+    context = "\n\n".join(kept_chunks) if kept_chunks else NO_CONTEXT
+    counts["context"] = used if kept_chunks else count_tokens(NO_CONTEXT)
+    remaining -= counts["context"]
+
+    # 2. Rolling summary of older turns
+    summary_line = f"{SUMMARY_LABEL}: {summary}" if summary else ""
+    counts["summary"] = count_tokens(summary_line)
+    if counts["summary"] > remaining:
+        summary_line, counts["summary"] = "", 0
+    remaining -= counts["summary"]
+
+    # 3. Recent turns, newest first
+    keep = settings.conversation_summary_keep_turns
+    lines: list[str] = []
+    kept_count = 0
+    counts["history"] = 0
+    for message in reversed(history[-keep:] if keep else []):
+        line = format_turn(message)
+        tokens = count_tokens(line) + 1  # + newline
+        if tokens > remaining:
+            break
+        lines.append(line)
+        remaining -= tokens
+        counts["history"] += tokens
+        kept_count += 1
+    lines.reverse()
+
+    split = len(history) - kept_count
+    chat_history = "\n".join(([summary_line] if summary_line else []) + lines)
+    counts["prompt_total"] = sum(counts.values())
+    return PromptParts(
+        context=context,
+        chat_history=chat_history + "\n" if chat_history else "",
+        chunks_used=len(kept_chunks),
+        history_turns=history[split:],
+        dropped_turns=history[:split],
+        token_counts=counts,
+    )
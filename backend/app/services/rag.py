@@ -1,11 +1,24 @@
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import SupabaseVectorStore
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferWindowMemory
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from app.config import get_settings
-from app.services.supabase_service import get_supabase, get_conversation_messages
+from app.services.conversation_cache import get_recent_messages
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.retrieval import retrieve
+from app.services.prompt_builder import build_prompt
+from app.services.conversation_summary import SUMMARY_PROMPT, get_summary, schedule_summary_update
+from app.services.tokens import count_tokens
+from app.services.semantic_cache import SemanticCache, CacheEntry, get_semantic_cache, is_cacheable_turn
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Optional
+import asyncio
+import re
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,13 +51,22 @@ Ton ton est 'Abidjan Premium' : poli, chaleureux, expert et utilisant le vouvoie
 Réponds à la question du client de manière concise et professionnelle."""
 
 
-def _get_embeddings() -> OpenAIEmbeddings:
-    """Get OpenAI embeddings model."""
+def _get_embeddings() -> Embeddings:
+    """Get OpenAI embeddings model, behind the query embedding cache when enabled."""
     settings = get_settings()
-    return OpenAIEmbeddings(
+    embeddings = OpenAIEmbeddings(
         model=settings.embedding_model,
         openai_api_key=settings.openai_api_key,
     )
+    if not settings.embedding_cache_enabled:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        model=settings.embedding_model,
+        max_entries=settings.embedding_cache_max_entries,
+        ttl_seconds=settings.embedding_cache_ttl_seconds,
+        use_redis=settings.embedding_cache_redis,
+    )
 
 
 def _get_llm() -> ChatOpenAI:
@@ -59,65 +81,235 @@ def _get_llm() -> ChatOpenAI:
     )
 
 
-def _get_vector_store() -> SupabaseVectorStore:
-    """Get Supabase vector store for RAG retrieval."""
-    client = get_supabase()
-    embeddings = _get_embeddings()
-    return SupabaseVectorStore(
-        client=client,
-        embedding=embeddings,
-        table_name="knowledge_base",
-        query_name="match_documents",
-    )
+def _get_prompt() -> ChatPromptTemplate:
+    """Get the concierge prompt (system rules + customer question)."""
+    return ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(SYSTEM_PROMPT),
+        HumanMessagePromptTemplate.from_template("{question}"),
+    ])
 
 
-async def generate_ai_response(message: str, conversation_id: str) -> str:
-    """Generate an AI response using RAG (retrieve + generate).
+@lru_cache()
+def _system_prompt_tokens() -> int:
+    """Tokens of the system prompt itself, without context and history."""
+    return count_tokens(SYSTEM_PROMPT.format(context="", chat_history=""))
 
-    1. Retrieve relevant documents from Supabase pgvector
-    2. Load conversation history
-    3. Generate response with OpenRouter LLM
+
+class RagRuntime:
+    """Process-wide RAG objects, built once and reused by every request.
+
+    Keeping the OpenAI/OpenRouter clients alive keeps their HTTP connection
+    pools (and TLS sessions) warm between WhatsApp messages.
     """
+
+    def __init__(self):
+        self.embeddings = _get_embeddings()
+        self.llm = _get_llm()
+        self.prompt = _get_prompt()
+        self.chain = self.prompt | self.llm
+        self.summary_chain = ChatPromptTemplate.from_template(SUMMARY_PROMPT) | self.llm
+
+
+_runtime: Optional[RagRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_rag_runtime() -> RagRuntime:
+    """Get or lazily build the process-wide RAG runtime."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = RagRuntime()
+    return _runtime
+
+
+def warm_up_rag():
+    """Build the RAG runtime ahead of the first message (FastAPI startup)."""
+    start = time.perf_counter()
+    get_rag_runtime()
+    logger.info(f"RAG runtime ready in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+FALLBACK_RESPONSE = "Merci pour votre message. Nos conseillers Bobotcho sont actuellement indisponibles, mais nous traiterons votre demande en priorité dès demain matin à 8h. Merci de votre patience !"
+
+
+@dataclass
+class RagResult:
+    text: str
+    docs_count: int = 0
+    timings: dict[str, int] = field(default_factory=dict)  # Stage latencies in ms
+    cache_hit: bool = False
+    error: Optional[str] = None
+    first_segment: Optional[str] = None  # Already handed to `on_first_segment` while streaming
+    token_counts: dict[str, int] = field(default_factory=dict)  # Prompt parts and completion
+
+    @property
+    def remainder(self) -> str:
+        """Text not yet dispatched: everything after the streamed first segment."""
+        if not self.first_segment:
+            return self.text
+        return self.text[len(self.first_segment):].strip()
+
+
+def _elapsed_ms(start: float) -> int:
+    return int((time.perf_counter() - start) * 1000)
+
+
+async def _timed(coro, timings: dict, key: str):
+    start = time.perf_counter()
     try:
-        # 1. Retrieve relevant context
-        vector_store = _get_vector_store()
-        retriever = vector_store.as_retriever(search_kwargs={"k": get_settings().rag_top_k})
-        docs = retriever.invoke(message)
-        context = "\n\n".join([doc.page_content for doc in docs])
-
-        if not context.strip():
-            context = "Aucune information spécifique trouvée dans la base de connaissances."
-
-        # 2. Load conversation history
-        history_messages = await get_conversation_messages(
-            conversation_id,
-            limit=get_settings().max_conversation_history,
-        )
+        return await coro
+    finally:
+        timings[key] = _elapsed_ms(start)
 
-        chat_history = ""
-        for msg in history_messages:
-            role_label = "Client" if msg["role"] == "customer" else "Concierge"
-            chat_history += f"{role_label}: {msg['content']}\n"
 
-        # 3. Generate response
-        llm = _get_llm()
+async def _cache_lookup(cache: Optional[SemanticCache], embedding) -> Optional[CacheEntry]:
+    """Best-effort cache read: a cache outage must not fail the reply."""
+    if cache is None:
+        return None
+    try:
+        return await cache.lookup(embedding)
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed: {e}")
+        return None
 
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(SYSTEM_PROMPT),
-            HumanMessagePromptTemplate.from_template("{question}"),
-        ])
 
-        chain = prompt | llm
-        result = chain.invoke({
-            "context": context,
-            "chat_history": chat_history,
+async def _cache_store(cache: Optional[SemanticCache], embedding, question: str, answer: str, generation_ms: int):
+    if cache is None:
+        return
+    try:
+        await cache.store(embedding, question, answer, generation_ms)
+    except Exception as e:
+        logger.warning(f"Semantic cache store failed: {e}")
+
+
+# A segment ends at a blank line or after sentence punctuation followed by whitespace
+_SEGMENT_END = re.compile(r"\n\s*\n|(?<=[.!?…])\s+")
+
+
+def split_first_segment(text: str, min_chars: int) -> Optional[str]:
+    """First complete paragraph or sentence(s) of at least `min_chars`, if any yet."""
+    for match in _SEGMENT_END.finditer(text):
+        if match.start() >= min_chars:
+            return text[:match.start()].strip()
+    return None
+
+
+async def _stream_text(chain, inputs: dict, on_first_segment: Callable[[str], None],
+                       min_chars: int, dispatched: list[str]) -> str:
+    """Consume the chain token by token, handing off the first segment as soon as it is complete."""
+    buffer = ""
+    async for chunk in chain.astream(inputs):
+        buffer += chunk.content
+        if not dispatched:
+            segment = split_first_segment(buffer.lstrip(), min_chars)
+            if segment:
+                dispatched.append(segment)
+                on_first_segment(segment)
+    return buffer.strip()
+
+
+async def run_rag(
+    message: str,
+    conversation_id: str,
+    on_first_segment: Optional[Callable[[str], None]] = None,
+) -> RagResult:
+    """Run the RAG pipeline and report per-stage latencies.
+
+    1. Embed the question, load the conversation history and its summary, concurrently
+    2. Answer from the semantic cache for standalone questions, when enabled
+    3. Retrieve relevant chunks (local index, hybrid SQL search or pgvector), deduped and trimmed,
+       and pack them with the summary and recent turns into the prompt token budget
+    4. Generate response with OpenRouter LLM, then fold the turns left out of the
+       prompt into the conversation summary (in the background)
+
+    With `on_first_segment`, generation is streamed and the callback receives
+    the first complete sentence/paragraph while the rest is still generated;
+    `RagResult.remainder` is what is left to send.
+
+    Never raises: on failure the fallback message is returned with `error` set
+    (or only the segment already dispatched, if streaming had started).
+    """
+    start = time.perf_counter()
+    timings: dict[str, int] = {}
+    settings = get_settings()
+    dispatched: list[str] = []
+
+    def _dispatch(segment: str):
+        timings["first_segment_ms"] = _elapsed_ms(start)
+        on_first_segment(segment)
+
+    try:
+        runtime = get_rag_runtime()
+
+        # 1. Embed the question + load conversation history and summary
+        embedding, history_messages, summary = await asyncio.gather(
+            _timed(runtime.embeddings.aembed_query(message), timings, "embedding_ms"),
+            _timed(get_recent_messages(
+                conversation_id,
+                limit=settings.max_conversation_history,
+            ), timings, "history_ms"),
+            get_summary(conversation_id),
+        )
+
+        # 2. Semantic cache (only for questions that do not depend on the history)
+        cache = get_semantic_cache() if is_cacheable_turn(history_messages) else None
+        cached = await _timed(_cache_lookup(cache, embedding), timings, "cache_ms") if cache else None
+        if cached:
+            timings["rag_total_ms"] = _elapsed_ms(start)
+            logger.info(f"Semantic cache hit for conversation {conversation_id}: '{cached.question}'")
+            return RagResult(text=cached.answer, timings=timings, cache_hit=True)
+
+        # 3. Retrieve, dedupe and trim the context
+        chunks = await _timed(retrieve(embedding, message), timings, "retrieval_ms")
+        parts = build_prompt(_system_prompt_tokens(), message, chunks, history_messages, summary.text, settings)
+
+        # 4. Generate response (streamed when the caller wants the first segment early)
+        inputs = {
+            "context": parts.context,
+            "chat_history": parts.chat_history,
             "question": message,
-        })
+        }
+        if on_first_segment is None:
+            result = await _timed(runtime.chain.ainvoke(inputs), timings, "generation_ms")
+            response_text = result.content.strip()
+        else:
+            response_text = await _timed(
+                _stream_text(runtime.chain, inputs, _dispatch, settings.ai_streaming_min_chars, dispatched),
+                timings,
+                "generation_ms",
+            )
+        if not response_text and not dispatched:
+            # Nothing to send (and nothing worth caching): take the fallback path below
+            raise ValueError("empty completion")
+        await _cache_store(cache, embedding, message, response_text, timings["generation_ms"])
+        schedule_summary_update(runtime.summary_chain, conversation_id, summary, parts.dropped_turns, parts.history_turns)
 
-        response_text = result.content.strip()
-        logger.info(f"RAG response generated for conversation {conversation_id} ({len(docs)} docs retrieved)")
-        return response_text
+        token_counts = {**parts.token_counts, "completion": count_tokens(response_text)}
+        timings["rag_total_ms"] = _elapsed_ms(start)
+        logger.info(
+            f"RAG response generated for conversation {conversation_id} "
+            f"({parts.chunks_used} chunks in context, {token_counts['prompt_total']} prompt tokens, timings={timings})"
+        )
+        return RagResult(
+            text=response_text,
+            docs_count=parts.chunks_used,
+            timings=timings,
+            first_segment=dispatched[0] if dispatched else None,
+            token_counts=token_counts,
+        )
 
     except Exception as e:
+        timings["rag_total_ms"] = _elapsed_ms(start)
         logger.error(f"RAG generation failed: {e}", exc_info=True)
-        return "Merci pour votre message. Nos conseillers Bobotcho sont actuellement indisponibles, mais nous traiterons votre demande en priorité dès demain matin à 8h. Merci de votre patience !"
+        if dispatched:
+            # The customer already has the first segment: do not follow it with the fallback
+            return RagResult(text=dispatched[0], timings=timings, error=str(e), first_segment=dispatched[0])
+        return RagResult(text=FALLBACK_RESPONSE, timings=timings, error=str(e))
+
+
+async def generate_ai_response(message: str, conversation_id: str) -> str:
+    """Generate an AI response using RAG (retrieve + generate)."""
+    result = await run_rag(message, conversation_id)
+    return result.text
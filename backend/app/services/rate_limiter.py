@@ -0,0 +1,71 @@
+from app.config import get_settings
+from app.services.redis_service import get_redis
+from typing import Optional
+import redis.asyncio as aioredis
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Atomic token bucket. Uses Redis server time so that every worker sees the
+# same clock. Returns 0 when a token was taken, otherwise the wait in ms.
+_TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+  tokens = burst
+  ts = now
+end
+
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class RedisTokenBucket:
+    """Token bucket shared by every process talking to the same Redis."""
+
+    def __init__(self, redis: aioredis.Redis, key: str, rate: float, burst: int):
+        self.redis = redis
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self._script = redis.register_script(_TOKEN_BUCKET_LUA)
+
+    async def acquire(self):
+        """Wait until a token is available, then take it."""
+        while True:
+            wait_ms = await self._script(keys=[self.key], args=[self.rate, self.burst])
+            if not wait_ms:
+                return
+            await asyncio.sleep(int(wait_ms) / 1000)
+
+
+def get_sender_rate_limiter(sender: Optional[str] = None) -> RedisTokenBucket:
+    """Get the shared rate limiter for a WhatsApp sender number."""
+    settings = get_settings()
+    sender = sender or settings.twilio_whatsapp_number
+    return RedisTokenBucket(
+        get_redis(),
+        key=f"ratelimit:twilio:{sender}",
+        rate=settings.send_rate_per_second,
+        burst=settings.send_burst,
+    )
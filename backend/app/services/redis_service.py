@@ -0,0 +1,29 @@
+import redis.asyncio as aioredis
+from app.config import get_settings
+import asyncio
+import weakref
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One client per event loop: redis.asyncio connections are bound to the loop
+# that opened them (the API loop, or a Celery worker's runtime loop).
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> aioredis.Redis:
+    """Get or create the async Redis client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        settings = get_settings()
+        client = aioredis.from_url(settings.redis_url)
+        _clients[loop] = client
+    return client
+
+
+async def close_redis():
+    """Close the Redis client of the running event loop (worker shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
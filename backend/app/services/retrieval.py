@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from typing import Optional
+from app.config import get_settings, Settings
+from app.services.embedding_cache import normalize_query
+from app.services.supabase_service import hybrid_search_knowledge_base, match_knowledge_base
+from app.services.tokens import count_tokens
+from app.services.vector_index import get_local_index
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WORDS = re.compile(r"\w+")
+
+# Frequent French words that carry no retrieval signal
+_STOPWORDS = frozenset("""
+    alors aussi avec avez avoir cela ces cette comme combien comment dans des elle est
+    faire fait les leur mais mes moi mon nos notre nous par pas peut peux plus pour
+    pourquoi quand que quel quelle quels qui sans ses son sont sur tes ton une vos
+    votre vous bonjour bonsoir merci svp
+""".split())
+
+
+@dataclass
+class RetrievedChunk:
+    content: str
+    metadata: dict
+    score: Optional[float] = None  # Combined ranking score; None when only the rank is known
+    similarity: Optional[float] = None  # Cosine similarity with the question
+    keyword_score: Optional[float] = None
+    priority: Optional[int] = None
+    title: Optional[str] = None
+    id: Optional[str] = None
+    tokens: int = 0
+
+
+def _terms(text: str) -> set[str]:
+    # Crude stemming: "livraisons" and "livraison" count as the same term
+    return {
+        word.rstrip("s")
+        for word in _WORDS.findall(normalize_query(text))
+        if len(word) > 2 and word not in _STOPWORDS
+    }
+
+
+def keyword_score(question: str, text: str) -> float:
+    """Share of the question's meaningful terms found in `text` (0..1).
+
+    In-process stand-in for the full-text / trigram score of `hybrid_search`.
+    """
+    question_terms = _terms(question)
+    if not question_terms:
+        return 0.0
+    return len(question_terms & _terms(text)) / len(question_terms)
+
+
+def combined_score(similarity: float, keyword: float, priority: Optional[int], settings: Settings) -> float:
+    """Same weighting as the `hybrid_search` SQL function."""
+    vector_weight = 1 - settings.rag_keyword_weight - settings.rag_priority_weight
+    return (
+        vector_weight * similarity
+        + settings.rag_keyword_weight * keyword
+        + settings.rag_priority_weight * (priority if priority is not None else 5) / 10
+    )
+
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = _WORDS.findall(normalize_query(text))
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe_chunks(chunks: list[RetrievedChunk], threshold: float) -> list[RetrievedChunk]:
+    """Drop chunks that are near-copies of a better-ranked one (word 3-gram Jaccard)."""
+    kept: list[RetrievedChunk] = []
+    kept_shingles: list[set] = []
+    for chunk in chunks:
+        shingles = _shingles(chunk.content)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def trim_chunks(chunks: list[RetrievedChunk], max_chunks: int, relative_cutoff: float, max_tokens: int) -> list[RetrievedChunk]:
+    """Keep the fewest chunks that carry the answer.
+
+    Stops at `max_chunks`, at the first chunk scoring below `relative_cutoff`
+    of the best score, or when the context would exceed `max_tokens`. The best
+    chunk is always kept.
+    """
+    kept: list[RetrievedChunk] = []
+    used_tokens = 0
+    best = chunks[0].score if chunks else None
+    for chunk in chunks[:max_chunks]:
+        chunk.tokens = count_tokens(chunk.content)
+        if kept:
+            if best is not None and chunk.score is not None and chunk.score < best * relative_cutoff:
+                break
+            if used_tokens + chunk.tokens > max_tokens:
+                break
+        kept.append(chunk)
+        used_tokens += chunk.tokens
+    return kept
+
+
+def rank_rows(rows: list[dict], question: str, settings: Settings) -> list[RetrievedChunk]:
+    """Turn scored rows (SQL `hybrid_search`, `match_knowledge_base` or local index) into ranked chunks.
+
+    Rows without a combined score (local index) are scored here, with the
+    keyword component only when hybrid search is enabled.
+    """
+    chunks = []
+    for row in rows:
+        similarity = row.get("similarity")
+        if similarity is not None and similarity < settings.rag_similarity_threshold:
+            continue
+        keyword = row.get("keyword_score")
+        score = row.get("score")
+        if score is None and similarity is not None:
+            if settings.rag_hybrid_search_enabled:
+                keyword = keyword_score(question, f"{row.get('title') or ''}\n{row['content']}")
+                score = combined_score(similarity, keyword, row.get("priority"), settings)
+            else:
+                score = similarity
+        chunks.append(RetrievedChunk(
+            content=row["content"],
+            metadata=row.get("metadata") or {},
+            score=score,
+            similarity=similarity,
+            keyword_score=keyword,
+            priority=row.get("priority"),
+            title=row.get("title"),
+            id=row.get("id"),
+        ))
+    chunks.sort(key=lambda chunk: chunk.score if chunk.score is not None else 0.0, reverse=True)
+    return chunks
+
+
+def select_chunks(chunks: list[RetrievedChunk], settings: Settings) -> list[RetrievedChunk]:
+    """Dedupe then trim ranked chunks to what goes into the prompt."""
+    return trim_chunks(
+        dedupe_chunks(chunks, settings.rag_dedupe_threshold),
+        max_chunks=settings.rag_top_k,
+        relative_cutoff=settings.rag_relative_score_cutoff,
+        max_tokens=settings.rag_context_max_tokens,
+    )
+
+
+async def retrieve(embedding: list[float], question: str, filter: Optional[dict] = None) -> list[RetrievedChunk]:
+    """Fetch candidates, rank them and keep only what the prompt needs.
+
+    Candidates come from the in-process index when loaded, else from the
+    `hybrid_search` SQL function (when enabled), else from `match_documents`.
+    `filter` restricts every path to rows whose metadata contains it
+    (`metadata @> filter`). Every path returns the cosine similarity (`match_knowledge_base` converts
+    the distance `match_documents` returns), so `rag_similarity_threshold`
+    applies the same way to all of them.
+    """
+    settings = get_settings()
+
+    local_index = get_local_index()
+    if local_index is not None:
+        rows = local_index.search_rows(embedding, k=settings.rag_candidate_count, filter=filter)
+    elif settings.rag_hybrid_search_enabled:
+        rows = await hybrid_search_knowledge_base(
+            embedding,
+            question,
+            match_count=settings.rag_candidate_count,
+            match_threshold=settings.rag_similarity_threshold,
+            keyword_weight=settings.rag_keyword_weight,
+            priority_weight=settings.rag_priority_weight,
+            filter=filter,
+        )
+    else:
+        rows = await match_knowledge_base(embedding, match_count=settings.rag_candidate_count, filter=filter)
+
+    candidates = rank_rows(rows, question, settings)
+    chunks = select_chunks(candidates, settings)
+    logger.debug(f"Retrieval kept {len(chunks)}/{len(candidates)} chunks ({sum(c.tokens for c in chunks)} tokens)")
+    return chunks
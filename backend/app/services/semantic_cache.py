@@ -0,0 +1,240 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from app.config import get_settings
+from app.services.redis_service import get_redis
+from app.services.supabase_service import get_knowledge_base_version
+import numpy as np
+import base64
+import json
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "semcache:stats"
+EPOCH_KEY = "semcache:epoch"  # Bumped by invalidate() so every process drops its local tier
+
+
+@dataclass
+class CacheEntry:
+    id: str
+    vector: np.ndarray  # Normalized float32 query embedding
+    question: str
+    answer: str
+    generation_ms: int
+    expires_at: float
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Answer cache keyed by query embedding, with TTL and LRU eviction.
+
+    Two tiers: an in-process LRU that is scanned with one matrix product, and
+    a Redis list shared by all processes that the local tier is refreshed from
+    every `sync_seconds`. Entries are namespaced by the knowledge_base version
+    (row count + latest updated_at) and an explicit epoch, so any change to the
+    KB or a call to `invalidate()` retires every cached answer.
+    """
+
+    def __init__(self, threshold: float, ttl_seconds: int, max_entries: int,
+                 sync_seconds: int, version_check_seconds: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sync_seconds = sync_seconds
+        self.version_check_seconds = version_check_seconds
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: list[str] = []
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._synced_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "saved_generation_ms": 0}
+
+    # ── Versioning ───────────────────────────────────────────────────────────
+
+    async def _current_version(self) -> str:
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at > self.version_check_seconds:
+            epoch = await get_redis().get(EPOCH_KEY)
+            version = f"{await get_knowledge_base_version()}:{int(epoch or 0)}"
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"Knowledge base changed ({self._version} -> {version}), clearing semantic cache")
+                self._clear_local()
+                self._version = version
+            self._version_checked_at = now
+        return self._version
+
+    def _redis_key(self, version: str) -> str:
+        return f"semcache:{version}"
+
+    def _clear_local(self):
+        self._entries.clear()
+        self._matrix = None
+        self._synced_at = 0.0
+
+    async def invalidate(self):
+        """Drop every cached answer in every process.
+
+        Immediate here; other processes follow at their next version check.
+        """
+        version = self._version
+        self._clear_local()
+        self._version = None
+        redis = get_redis()
+        await redis.incr(EPOCH_KEY)
+        if version is not None:
+            await redis.delete(self._redis_key(version))
+
+    # ── Local tier ───────────────────────────────────────────────────────────
+
+    def _put_local(self, entry: CacheEntry):
+        self._entries[entry.id] = entry
+        self._entries.move_to_end(entry.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def _search_local(self, vector: np.ndarray) -> Optional[CacheEntry]:
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+        if not self._entries:
+            return None
+
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            self._matrix = np.stack([self._entries[key].vector for key in self._matrix_ids])
+
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        entry = self._entries[self._matrix_ids[best]]
+        self._entries.move_to_end(entry.id)
+        return entry
+
+    # ── Shared tier ──────────────────────────────────────────────────────────
+
+    async def _sync_from_redis(self, version: str):
+        if time.monotonic() - self._synced_at < self.sync_seconds:
+            return
+        self._synced_at = time.monotonic()
+
+        now = time.time()
+        raw_entries = await get_redis().lrange(self._redis_key(version), 0, self.max_entries - 1)
+        # Oldest first so the most recent entries end up most recently used
+        for raw in reversed(raw_entries):
+            data = json.loads(raw)
+            if data["expires_at"] <= now or data["id"] in self._entries:
+                continue
+            self._put_local(CacheEntry(
+                id=data["id"],
+                vector=np.frombuffer(base64.b64decode(data["vector"]), dtype=np.float32),
+                question=data["question"],
+                answer=data["answer"],
+                generation_ms=data["generation_ms"],
+                expires_at=data["expires_at"],
+            ))
+
+    # ── Public API ───────────────────────────────────────────────────────────
+
+    async def lookup(self, embedding) -> Optional[CacheEntry]:
+        """Return the closest cached answer above the similarity threshold."""
+        version = await self._current_version()
+        await self._sync_from_redis(version)
+
+        entry = self._search_local(_normalize(embedding))
+        self.stats["hits" if entry else "misses"] += 1
+        if entry:
+            self.stats["saved_generation_ms"] += entry.generation_ms
+
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hincrby(STATS_KEY, "hits" if entry else "misses", 1)
+            if entry:
+                pipe.hincrby(STATS_KEY, "saved_generation_ms", entry.generation_ms)
+            await pipe.execute()
+        return entry
+
+    async def store(self, embedding, question: str, answer: str, generation_ms: int):
+        """Cache an answer in both tiers."""
+        version = await self._current_version()
+        entry = CacheEntry(
+            id=uuid.uuid4().hex,
+            vector=_normalize(embedding),
+            question=question,
+            answer=answer,
+            generation_ms=generation_ms,
+            expires_at=time.time() + self.ttl_seconds,
+        )
+        self._put_local(entry)
+        self.stats["stores"] += 1
+
+        key = self._redis_key(version)
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.lpush(key, json.dumps({
+                "id": entry.id,
+                "vector": base64.b64encode(entry.vector.tobytes()).decode(),
+                "question": question,
+                "answer": answer,
+                "generation_ms": generation_ms,
+                "expires_at": entry.expires_at,
+            }))
+            pipe.ltrim(key, 0, self.max_entries - 1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.hincrby(STATS_KEY, "stores", 1)
+            await pipe.execute()
+
+    async def get_stats(self) -> dict:
+        """Counters for this process and for all processes (Redis)."""
+        shared = await get_redis().hgetall(STATS_KEY)
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": True,
+            "version": self._version,
+            "entries": len(self._entries),
+            "process": {**self.stats, "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0},
+            "global": {k.decode(): int(v) for k, v in shared.items()},
+        }
+
+
+_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Get the process-wide semantic cache, or None when disabled."""
+    global _cache
+    settings = get_settings()
+    if not settings.semantic_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = SemanticCache(
+            threshold=settings.semantic_cache_threshold,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+            max_entries=settings.semantic_cache_max_entries,
+            sync_seconds=settings.semantic_cache_sync_seconds,
+            version_check_seconds=settings.semantic_cache_version_check_seconds,
+        )
+    return _cache
+
+
+def is_cacheable_turn(history_messages: list[dict]) -> bool:
+    """Only standalone questions are cached: no agent reply in the history yet.
+
+    Once the concierge has answered, the next message may depend on that
+    exchange ("et avec installation ?"), so it is always generated.
+    """
+    return all(msg["role"] == "customer" for msg in history_messages)
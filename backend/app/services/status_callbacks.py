@@ -0,0 +1,218 @@
+from datetime import datetime, timezone
+from typing import Optional
+from twilio.request_validator import RequestValidator
+from app.config import get_settings
+from app.services.redis_service import get_redis
+from app.services.supabase_service import apply_message_statuses
+import asyncio
+import os
+import redis
+import socket
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Raw callbacks, appended by the endpoint and read by a consumer group: each
+# entry stays pending until its status has been applied, so a crashed API
+# process loses nothing (another consumer reclaims it).
+STREAM_KEY = "twilio:status"
+GROUP = "status-appliers"
+
+# Twilio MessageStatus -> campaign_messages status
+_STATUSES = {
+    "sent": "sent",
+    "delivered": "delivered",
+    "read": "read",
+    "failed": "failed",
+    "undelivered": "failed",
+}
+_RANK = {"queued": 0, "sending": 0, "sent": 1, "delivered": 2, "read": 3}
+
+
+def validate_signature(url: str, params: dict, signature: str) -> bool:
+    """Check that a callback was signed by Twilio with our auth token (X-Twilio-Signature)."""
+    return RequestValidator(get_settings().twilio_auth_token).validate(url, params, signature)
+
+
+def advances(current: str, new: str) -> bool:
+    """Whether moving from `current` to `new` goes forward (same rule as apply_message_statuses).
+
+    queued < sent < delivered < read; failed is terminal and only reachable
+    before delivery.
+    """
+    if current == "failed":
+        return False
+    if new == "failed":
+        return _RANK.get(current, 0) < _RANK["delivered"]
+    return _RANK[new] > _RANK.get(current, 0)
+
+
+def _entry_time(entry_id: bytes) -> float:
+    """Stream entry IDs start with the append time in milliseconds."""
+    return int(entry_id.split(b"-", 1)[0]) / 1000
+
+
+def coalesce_statuses(entries: list[tuple[bytes, dict]]) -> dict[str, dict]:
+    """Fold a batch of callbacks into one update per MessageSid, the furthest status winning."""
+    updates: dict[str, dict] = {}
+    for entry_id, fields in entries:
+        if not fields:
+            continue
+        sid, status = fields[b"sid"].decode(), fields[b"status"].decode()
+        current = updates.get(sid)
+        if current is None or advances(current["status"], status):
+            updates[sid] = {
+                "twilio_sid": sid,
+                "status": status,
+                "at": datetime.fromtimestamp(_entry_time(entry_id), timezone.utc).isoformat(),
+                "error_message": fields.get(b"error", b"").decode() or None,
+            }
+    return updates
+
+
+async def enqueue_status_callback(params: dict) -> bool:
+    """Append a callback to the stream; False for statuses that change nothing (queued, sending...)."""
+    status = _STATUSES.get(params.get("MessageStatus", ""))
+    sid = params.get("MessageSid")
+    if status is None or not sid:
+        return False
+    error_code = params.get("ErrorCode")
+    await get_redis().xadd(
+        STREAM_KEY,
+        {"sid": sid, "status": status, "error": f"Twilio error {error_code}" if error_code else ""},
+        maxlen=get_settings().status_stream_maxlen,
+        approximate=True,
+    )
+    return True
+
+
+class StatusCallbackConsumer:
+    """Applies queued delivery callbacks to `campaign_messages` in batches.
+
+    Each read takes up to `batch_size` callbacks, keeps one status per
+    MessageSid and writes them in a single `apply_message_statuses` call.
+    A callback can arrive before the worker has stored the message SID: it is
+    then left pending and retried when reclaimed, until it is
+    `unmatched_ttl_seconds` old. Entries left pending by a dead consumer are
+    reclaimed after `stale_seconds`.
+    """
+
+    def __init__(self, batch_size: int, stale_seconds: int, unmatched_ttl_seconds: int):
+        self.batch_size = batch_size
+        self.stale_seconds = stale_seconds
+        self.unmatched_ttl_seconds = unmatched_ttl_seconds
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"received": 0, "applied": 0, "unmatched": 0, "dropped": 0, "batches": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish the current batch (up to `timeout`); unapplied entries stay pending in the stream."""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Status callbacks: consumer cancelled at shutdown")
+
+    async def _ensure_group(self):
+        try:
+            await get_redis().xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _run(self):
+        redis_client = get_redis()
+        next_claim = 0.0
+        while not self._stopping:
+            try:
+                await self._ensure_group()
+                break
+            except Exception as e:
+                logger.error(f"Status callbacks: cannot create consumer group: {e}")
+                await asyncio.sleep(1)
+        while not self._stopping:
+            try:
+                entries = []
+                if time.monotonic() >= next_claim:
+                    entries = await self._reclaim()
+                    # A full page means more are waiting: claim again on the next turn
+                    if len(entries) < self.batch_size:
+                        next_claim = time.monotonic() + self.stale_seconds
+                if not entries:
+                    response = await redis_client.xreadgroup(
+                        GROUP, self.name, {STREAM_KEY: ">"}, count=self.batch_size, block=1000,
+                    )
+                    entries = response[0][1] if response else []
+                if entries:
+                    await self._apply(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Status callbacks: batch failed: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _reclaim(self) -> list[tuple[bytes, dict]]:
+        response = await get_redis().xautoclaim(
+            STREAM_KEY, GROUP, self.name,
+            min_idle_time=self.stale_seconds * 1000, start_id="0-0", count=self.batch_size,
+        )
+        return [(entry_id, fields) for entry_id, fields in response[1] if entry_id]
+
+    async def _apply(self, entries: list[tuple[bytes, dict]]):
+        updates = coalesce_statuses(entries)
+        matched = await apply_message_statuses(list(updates.values()))
+
+        expired_before = time.time() - self.unmatched_ttl_seconds
+        done, unmatched, dropped = [], 0, 0
+        for entry_id, fields in entries:
+            if fields and fields[b"sid"].decode() not in matched:
+                if _entry_time(entry_id) >= expired_before:
+                    unmatched += 1
+                    continue  # Left pending: the SID may not be stored yet
+                dropped += 1
+            done.append(entry_id)
+        if done:
+            redis_client = get_redis()
+            await redis_client.xack(STREAM_KEY, GROUP, *done)
+            await redis_client.xdel(STREAM_KEY, *done)
+
+        self.stats["batches"] += 1
+        self.stats["received"] += len(entries)
+        self.stats["applied"] += len(matched)
+        self.stats["unmatched"] += unmatched
+        self.stats["dropped"] += dropped
+        if dropped:
+            logger.warning(f"Status callbacks: dropped {dropped} callbacks for unknown message SIDs")
+
+
+_consumer: Optional[StatusCallbackConsumer] = None
+
+
+def start_status_consumer():
+    """Start applying delivery callbacks when they are enabled (FastAPI startup)."""
+    global _consumer
+    settings = get_settings()
+    if not settings.twilio_status_callback_url or _consumer is not None:
+        return
+    _consumer = StatusCallbackConsumer(
+        batch_size=settings.status_batch_size,
+        stale_seconds=settings.status_stale_seconds,
+        unmatched_ttl_seconds=settings.status_unmatched_ttl_seconds,
+    )
+    _consumer.start()
+    logger.info(f"Status callbacks: consumer {_consumer.name} started")
+
+
+async def stop_status_consumer():
+    """Stop the consumer (FastAPI shutdown)."""
+    global _consumer
+    if _consumer is not None:
+        await _consumer.stop()
+        _consumer = None
@@ -1,15 +1,26 @@
 from supabase import create_client, Client
 from app.config import get_settings
-from typing import Optional
+from typing import Any, AsyncIterator, Optional
+import asyncio
+import weakref
+import httpx
 import logging
 
 logger = logging.getLogger(__name__)
 
 _client: Optional[Client] = None
 
+# One pooled PostgREST client per event loop: httpx connections are bound to
+# the loop that opened them (the API loop, or a Celery worker's runtime loop).
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
 
 def get_supabase() -> Client:
-    """Get or create Supabase admin client (service role)."""
+    """Get or create Supabase admin client (service role).
+
+    Synchronous: only used where a library needs a supabase-py client
+    (LangChain's SupabaseVectorStore). Data access goes through `get_postgrest()`.
+    """
     global _client
     if _client is None:
         settings = get_settings()
@@ -17,44 +28,99 @@ def get_supabase() -> Client:
     return _client
 
 
+def get_postgrest() -> httpx.AsyncClient:
+    """Get or create the pooled, keep-alive PostgREST client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        settings = get_settings()
+        key = settings.supabase_service_role_key
+        client = httpx.AsyncClient(
+            base_url=f"{settings.supabase_url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=settings.supabase_pool_size,
+                max_keepalive_connections=settings.supabase_pool_size,
+            ),
+            timeout=settings.supabase_timeout,
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def close_postgrest():
+    """Close the PostgREST client of the running event loop (app / worker shutdown)."""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _request(
+    method: str,
+    path: str,
+    params: Optional[dict] = None,
+    json: Any = None,
+    prefer: Optional[str] = None,
+) -> Any:
+    """Run a PostgREST request and return the decoded JSON body (None if empty)."""
+    headers = {"Prefer": prefer} if prefer else None
+    response = await get_postgrest().request(method, path, params=params, json=json, headers=headers)
+    response.raise_for_status()
+    if not response.content:
+        return None
+    return response.json()
+
+
+async def _rpc(function: str, params: dict) -> Any:
+    """Call a Postgres function exposed by PostgREST."""
+    return await _request("POST", f"/rpc/{function}", json=params)
+
+
 async def get_conversation(conversation_id: str) -> Optional[dict]:
     """Fetch a conversation by ID."""
-    client = get_supabase()
     try:
-        result = client.table("conversations").select("*").eq("id", conversation_id).maybe_single().execute()
-        return result.data
+        rows = await _request("GET", "/conversations", params={
+            "select": "*",
+            "id": f"eq.{conversation_id}",
+            "limit": 1,
+        })
+        return rows[0] if rows else None
     except Exception as e:
-        logger.warning(f"get_conversation({conversation_id}): {e}")
-        # Fallback: try with .execute() and pick first result
-        try:
-            result = client.table("conversations").select("*").eq("id", conversation_id).execute()
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-        except Exception as e2:
-            logger.error(f"get_conversation fallback failed: {e2}")
+        logger.error(f"get_conversation({conversation_id}): {e}")
         return None
 
 
 async def get_conversation_messages(conversation_id: str, limit: int = 10) -> list[dict]:
     """Fetch recent messages for a conversation, ordered oldest first."""
-    client = get_supabase()
-    result = (
-        client.table("messages")
-        .select("role, content, created_at")
-        .eq("conversation_id", conversation_id)
-        .order("created_at", desc=True)
-        .limit(limit)
-        .execute()
-    )
-    messages = result.data or []
+    messages = await _request("GET", "/messages", params={
+        "select": "id,role,content,created_at",
+        "conversation_id": f"eq.{conversation_id}",
+        "order": "created_at.desc",
+        "limit": limit,
+    }) or []
     messages.reverse()
     return messages
 
 
-async def insert_message(conversation_id: str, shop_id: str, role: str, content: str, metadata: dict = None) -> dict:
-    """Insert a message into the messages table."""
-    client = get_supabase()
-    data = {
+async def get_newest_message_id(conversation_id: str) -> Optional[str]:
+    """Id of the latest message of a conversation (index-only query, no count)."""
+    rows = await _request("GET", "/messages", params={
+        "select": "id",
+        "conversation_id": f"eq.{conversation_id}",
+        "order": "created_at.desc",
+        "limit": 1,
+    }) or []
+    return rows[0]["id"] if rows else None
+
+
+def build_message_row(conversation_id: str, shop_id: str, role: str, content: str, metadata: dict = None,
+                      message_id: Optional[str] = None) -> dict:
+    """Row for the messages table (`message_id` lets the caller know the id before the insert)."""
+    row = {
         "conversation_id": conversation_id,
         "shop_id": shop_id,
         "role": role,
@@ -62,116 +128,321 @@ async def insert_message(conversation_id: str, shop_id: str, role: str, content:
         "type": "text",
         "metadata": metadata or {},
     }
-    result = client.table("messages").insert(data).execute()
-    return result.data[0] if result.data else {}
+    if message_id:
+        row["id"] = message_id
+    return row
 
 
-async def insert_ai_log(shop_id: str, conversation_id: str, input_text: str, output_text: str, metrics: dict = None):
-    """Log an AI interaction for audit."""
-    client = get_supabase()
-    client.table("ai_logs").insert({
+def build_ai_log_row(shop_id: str, conversation_id: str, input_text: str, output_text: str, metrics: dict = None) -> dict:
+    """Row for the ai_logs table."""
+    return {
         "shop_id": shop_id,
         "conversation_id": conversation_id,
         "input": input_text,
         "output": output_text,
         "metrics": metrics or {},
-    }).execute()
-
-
-async def get_template_by_name(template_name: str) -> Optional[dict]:
-    """Fetch a WhatsApp template by name."""
-    client = get_supabase()
-    result = (
-        client.table("whatsapp_templates")
-        .select("*")
-        .eq("name", template_name)
-        .maybe_single()
-        .execute()
-    )
-    return result.data
+    }
+
+
+async def insert_message(conversation_id: str, shop_id: str, role: str, content: str, metadata: dict = None) -> dict:
+    """Insert a message into the messages table."""
+    data = build_message_row(conversation_id, shop_id, role, content, metadata)
+    rows = await _request("POST", "/messages", json=data, prefer="return=representation")
+    return rows[0] if rows else {}
+
+
+async def insert_ai_log(shop_id: str, conversation_id: str, input_text: str, output_text: str, metrics: dict = None):
+    """Log an AI interaction for audit."""
+    data = build_ai_log_row(shop_id, conversation_id, input_text, output_text, metrics)
+    await _request("POST", "/ai_logs", json=data, prefer="return=minimal")
+
+
+async def insert_rows(table: str, rows: list[dict]):
+    """Multi-row insert in one request (rows must share the same keys)."""
+    if not rows:
+        return
+    await _request("POST", f"/{table}", json=rows, prefer="return=minimal")
+
+
+async def get_knowledge_base_version() -> str:
+    """Cheap fingerprint of the embedded knowledge_base rows: row count + latest updated_at.
+
+    Rows without an embedding are left out, as in `get_knowledge_base_rows`,
+    so the count matches what the local index holds.
+    """
+    response = await get_postgrest().get("/knowledge_base", params={
+        "select": "updated_at",
+        "embedding": "not.is.null",
+        "order": "updated_at.desc.nullslast",
+        "limit": 1,
+    }, headers={"Prefer": "count=exact"})
+    response.raise_for_status()
+    rows = response.json()
+    total = response.headers.get("content-range", "*/0").split("/")[-1]
+    latest = rows[0]["updated_at"] if rows else ""
+    return f"{total}:{latest}"
+
+
+async def get_knowledge_base_rows(updated_after: Optional[str] = None, page_size: int = 500) -> list[dict]:
+    """Fetch knowledge_base rows with their embeddings, keyset-paginated on id.
+
+    With `updated_after`, only rows changed since that timestamp are returned.
+    """
+    rows: list[dict] = []
+    last_id = None
+    while True:
+        params = {
+            "select": "id,title,content,category,priority,metadata,embedding,updated_at",
+            "embedding": "not.is.null",
+            "order": "id",
+            "limit": page_size,
+        }
+        if updated_after:
+            params["updated_at"] = f"gt.{updated_after}"
+        if last_id:
+            params["id"] = f"gt.{last_id}"
+        page = await _request("GET", "/knowledge_base", params=params) or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last_id = page[-1]["id"]
+
+
+async def match_knowledge_base(embedding: list[float], match_count: int, filter: Optional[dict] = None) -> list[dict]:
+    """Nearest knowledge_base chunks with their cosine similarity (SQL `match_documents`).
+
+    `match_documents` returns the cosine *distance* (`embedding <=> query`) in
+    its `similarity` column; it is turned into a similarity here so every
+    retrieval path scores the same way.
+    """
+    rows = await _rpc("match_documents", {
+        "query_embedding": embedding,
+        "match_count": match_count,
+        "filter": filter or {},
+    }) or []
+    for row in rows:
+        if row.get("similarity") is not None:
+            row["similarity"] = 1 - row["similarity"]
+    return rows
+
+
+async def hybrid_search_knowledge_base(
+    embedding: list[float],
+    query_text: str,
+    match_count: int,
+    match_threshold: float,
+    keyword_weight: float,
+    priority_weight: float,
+    filter: Optional[dict] = None,
+) -> list[dict]:
+    """Rank knowledge_base chunks by vector similarity + keyword match + priority (SQL `hybrid_search`)."""
+    return await _rpc("hybrid_search", {
+        "query_embedding": embedding,
+        "query_text": query_text,
+        "match_count": match_count,
+        "match_threshold": match_threshold,
+        "keyword_weight": keyword_weight,
+        "priority_weight": priority_weight,
+        "filter": filter or {},
+    }) or []
 
 
 async def get_all_templates() -> list[dict]:
     """Fetch all WhatsApp templates."""
-    client = get_supabase()
-    result = client.table("whatsapp_templates").select("*").order("created_at").execute()
-    return result.data or []
+    return await _request("GET", "/whatsapp_templates", params={
+        "select": "*",
+        "order": "created_at",
+    }) or []
+
+
+async def get_pending_templates() -> list[dict]:
+    """Fetch templates awaiting Meta approval that have a Twilio Content SID."""
+    return await _request("GET", "/whatsapp_templates", params={
+        "select": "*",
+        "status": "eq.pending",
+        "twilio_content_sid": "not.is.null",
+        "order": "created_at",
+    }) or []
+
+
+async def upsert_templates(rows: list[dict]):
+    """Insert or update several templates in one request (rows must share the same columns)."""
+    if not rows:
+        return
+    await _request(
+        "POST",
+        "/whatsapp_templates",
+        params={"on_conflict": "name"},
+        json=rows,
+        prefer="resolution=merge-duplicates,return=minimal",
+    )
 
 
 async def upsert_template(template_data: dict) -> dict:
     """Insert or update a WhatsApp template."""
-    client = get_supabase()
-    result = client.table("whatsapp_templates").upsert(template_data, on_conflict="name").execute()
-    return result.data[0] if result.data else {}
+    rows = await _request(
+        "POST",
+        "/whatsapp_templates",
+        params={"on_conflict": "name"},
+        json=template_data,
+        prefer="resolution=merge-duplicates,return=representation",
+    )
+    return rows[0] if rows else {}
 
 
 async def get_campaign(campaign_id: str) -> Optional[dict]:
     """Fetch a campaign by ID."""
-    client = get_supabase()
-    result = client.table("campaigns").select("*").eq("id", campaign_id).maybe_single().execute()
-    return result.data
+    rows = await _request("GET", "/campaigns", params={
+        "select": "*",
+        "id": f"eq.{campaign_id}",
+        "limit": 1,
+    })
+    return rows[0] if rows else None
 
 
 async def update_campaign(campaign_id: str, data: dict):
     """Update campaign fields."""
-    client = get_supabase()
-    client.table("campaigns").update(data).eq("id", campaign_id).execute()
-
-
-async def get_audience_phones(segment: str = "all") -> list[str]:
-    """Get phone numbers for a campaign audience segment."""
-    client = get_supabase()
-
-    if segment == "active_30d":
-        from datetime import datetime, timedelta
-        cutoff = (datetime.utcnow() - timedelta(days=30)).isoformat()
-        result = (
-            client.table("conversations")
-            .select("customer_phone")
-            .eq("status", "active")
-            .gte("last_message_at", cutoff)
-            .execute()
-        )
-    elif segment == "inactive_30d":
-        from datetime import datetime, timedelta
-        cutoff = (datetime.utcnow() - timedelta(days=30)).isoformat()
-        result = (
-            client.table("conversations")
-            .select("customer_phone")
-            .lt("last_message_at", cutoff)
-            .execute()
-        )
-    elif segment == "new_7d":
-        from datetime import datetime, timedelta
-        cutoff = (datetime.utcnow() - timedelta(days=7)).isoformat()
-        result = (
-            client.table("conversations")
-            .select("customer_phone")
-            .gte("created_at", cutoff)
-            .execute()
-        )
-    else:
-        result = client.table("conversations").select("customer_phone").execute()
+    await _request("PATCH", "/campaigns", params={"id": f"eq.{campaign_id}"}, json=data, prefer="return=minimal")
 
-    phones = list({row["customer_phone"] for row in (result.data or [])})
-    return phones
+
+async def stream_audience_phones(
+    audience: str = "all",
+    after: Optional[str] = None,
+    through: Optional[str] = None,
+    page_size: int = 1000,
+) -> AsyncIterator[str]:
+    """Yield the distinct phone numbers of an audience, in order, one page at a time.
+
+    `audience` is all, active_30d, inactive_30d, new_7d or `segment:<id>`.
+    Resolved by the `audience_phones` SQL function with keyset pagination
+    (numbers in `(after, through]`), so memory stays flat whatever the
+    audience size.
+    """
+    while True:
+        rows = await _rpc("audience_phones", {
+            "p_audience": audience,
+            "p_after": after,
+            "p_through": through,
+            "p_limit": page_size,
+        }) or []
+        for row in rows:
+            yield row["customer_phone"]
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["customer_phone"]
 
 
 async def get_active_automations() -> list[dict]:
     """Fetch all active automations."""
-    client = get_supabase()
-    result = (
-        client.table("automations")
-        .select("*")
-        .eq("is_active", True)
-        .execute()
-    )
-    return result.data or []
+    return await _request("GET", "/automations", params={
+        "select": "*",
+        "is_active": "eq.true",
+    }) or []
+
+
+async def get_automation_candidates(automation_id: str, segment: str, since: Optional[str], until: str,
+                                    cooldown_hours: int) -> list[dict]:
+    """Recipients who entered an automation's segment in (since, until].
+
+    Returns `{customer_phone, recently_sent}` rows; `recently_sent` marks
+    numbers this automation already messaged within the cooldown.
+    """
+    return await _rpc("automation_candidates", {
+        "p_automation_id": automation_id,
+        "p_segment": segment,
+        "p_since": since,
+        "p_until": until,
+        "p_cooldown_hours": cooldown_hours,
+    }) or []
+
+
+async def update_automation(automation_id: str, data: dict):
+    """Update automation fields."""
+    await _request("PATCH", "/automations", params={"id": f"eq.{automation_id}"}, json=data, prefer="return=minimal")
+
+
+async def increment_automation_executions(automation_id: str, delta: int = 1) -> Optional[int]:
+    """Atomically add `delta` to an automation's execution count; returns the new count."""
+    return await _rpc("increment_automation_executions", {"p_automation_id": automation_id, "p_delta": delta})
+
+
+async def enqueue_campaign_messages(campaign_id: str, phones: list[str], batch_size: int = 500) -> list[dict]:
+    """Create queued campaign_messages rows for the recipients, one RPC per batch.
+
+    Existing rows are kept as is; returns `{id, customer_phone, status}` for
+    every recipient so the caller can skip those already sent.
+    """
+    rows = []
+    for i in range(0, len(phones), batch_size):
+        rows.extend(await _rpc("enqueue_campaign_messages", {
+            "p_campaign_id": campaign_id,
+            "p_phones": phones[i:i + batch_size],
+        }) or [])
+    return rows
+
+
+async def stream_campaign_messages(
+    campaign_id: str,
+    after: Optional[str] = None,
+    through: Optional[str] = None,
+    page_size: int = 1000,
+) -> AsyncIterator[dict]:
+    """Yield a campaign's recipient rows (`{id, customer_phone, status}`) in phone order.
+
+    Keyset-paginated on `(campaign_id, customer_phone)`, numbers in
+    `(after, through]`: the snapshot written by `enqueue_campaign_messages`,
+    read back one page at a time.
+    """
+    while True:
+        params = {
+            "select": "id,customer_phone,status",
+            "campaign_id": f"eq.{campaign_id}",
+            "order": "customer_phone",
+            "limit": page_size,
+        }
+        bounds = []
+        if after is not None:
+            bounds.append(f'customer_phone.gt."{after}"')
+        if through is not None:
+            bounds.append(f'customer_phone.lte."{through}"')
+        if bounds:
+            params["and"] = f"({','.join(bounds)})"
+        rows = await _request("GET", "/campaign_messages", params=params) or []
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["customer_phone"]
+
+
+async def claim_campaign_messages(message_ids: list[str]) -> list[dict]:
+    """Atomically move queued rows to 'sending'; returns only the rows claimed."""
+    return await _rpc("claim_campaign_messages", {"p_ids": message_ids}) or []
+
+
+async def complete_campaign_messages(results: list[dict], count_accepted: bool = True) -> int:
+    """Record a batch of send outcomes (`{id, status, twilio_sid, error_message}`).
+
+    The campaign counters are incremented in the same transaction, for the
+    rows that were still 'sending' only; returns how many were counted.
+    With `count_accepted=False` (delivery callbacks enabled), messages
+    accepted by Twilio are not counted as delivered yet.
+    """
+    if not results:
+        return 0
+    return await _rpc("complete_campaign_messages", {
+        "p_results": results,
+        "p_count_accepted": count_accepted,
+    }) or 0
+
 
+async def apply_message_statuses(updates: list[dict]) -> set[str]:
+    """Apply a batch of delivery statuses (`{twilio_sid, status, at, error_message}`, one per SID).
 
-async def increment_automation_executions(automation_id: str):
-    """Increment the execution count for an automation."""
-    client = get_supabase()
-    automation = client.table("automations").select("executions_count").eq("id", automation_id).single().execute()
-    current = automation.data.get("executions_count", 0) if automation.data else 0
-    client.table("automations").update({"executions_count": current + 1}).eq("id", automation_id).execute()
+    Only forward transitions are applied, with their campaign counter deltas,
+    in one transaction. Returns the SIDs found in `campaign_messages`.
+    """
+    if not updates:
+        return set()
+    rows = await _rpc("apply_message_statuses", {"p_updates": updates})
+    return {row["twilio_sid"] for row in rows or []}
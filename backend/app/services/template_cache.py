@@ -0,0 +1,126 @@
+from typing import Optional
+from app.config import get_settings
+from app.services.redis_service import get_redis
+from app.services.supabase_service import get_all_templates, upsert_template, upsert_templates
+import redis
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "templates:invalidate"
+
+
+class TemplateCache:
+    """In-process copy of `whatsapp_templates`, keyed by name.
+
+    The table is small and rarely written, so it is loaded whole in one
+    query and kept for `ttl_seconds`. Writers publish on
+    `INVALIDATE_CHANNEL`; every API and worker process listening on it drops
+    its copy at once, the TTL only covers missed notifications.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._templates: Optional[dict[str, dict]] = None  # Insertion order = created_at
+        self._loaded_at = 0.0
+        self._generation = 0  # Bumped by clear(): a load started before it is not kept
+        self._listener: Optional[threading.Thread] = None
+        self.stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    async def _load(self) -> dict[str, dict]:
+        templates = self._templates
+        if templates is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            self.stats["hits"] += 1
+            return templates
+        loaded_at, generation = time.monotonic(), self._generation
+        templates = {template["name"]: template for template in await get_all_templates()}
+        if generation == self._generation:
+            self._templates, self._loaded_at = templates, loaded_at
+        self.stats["loads"] += 1
+        return templates
+
+    async def get(self, name: str) -> Optional[dict]:
+        return (await self._load()).get(name)
+
+    async def get_many(self, names: list[str]) -> dict[str, dict]:
+        templates = await self._load()
+        return {name: templates[name] for name in names if name in templates}
+
+    async def all(self) -> list[dict]:
+        return list((await self._load()).values())
+
+    def clear(self):
+        self._generation += 1
+        self._templates = None
+        self.stats["invalidations"] += 1
+
+    def listen(self):
+        """Drop the local copy whenever any process publishes an invalidation (background thread)."""
+        if self._listener is not None:
+            return
+        try:
+            pubsub = redis.Redis.from_url(get_settings().redis_url).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATE_CHANNEL: lambda message: self.clear()})
+            self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        except Exception as e:
+            logger.warning(f"Template cache: invalidation listener unavailable ({e}), relying on TTL")
+
+
+_cache: Optional[TemplateCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_template_cache() -> TemplateCache:
+    """Get the process-wide template cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TemplateCache(ttl_seconds=get_settings().template_cache_ttl_seconds)
+    return _cache
+
+
+def start_template_cache_listener():
+    """Subscribe this process to template invalidations (API startup, Celery worker init)."""
+    get_template_cache().listen()
+
+
+async def get_template(name: str) -> Optional[dict]:
+    """WhatsApp template by name, from the cache."""
+    return await get_template_cache().get(name)
+
+
+async def get_templates(names: list[str]) -> dict[str, dict]:
+    """Several templates by name, from the cache."""
+    return await get_template_cache().get_many(names)
+
+
+async def list_templates() -> list[dict]:
+    """Every template, ordered by creation, from the cache."""
+    return await get_template_cache().all()
+
+
+async def invalidate_templates():
+    """Drop the template cache in this process and, through Redis pub/sub, in all others."""
+    get_template_cache().clear()
+    try:
+        await get_redis().publish(INVALIDATE_CHANNEL, "1")
+    except Exception as e:
+        logger.warning(f"Template cache invalidation not published: {e}")
+
+
+async def save_template(template_data: dict) -> dict:
+    """Upsert a template and invalidate every cached copy."""
+    saved = await upsert_template(template_data)
+    await invalidate_templates()
+    return saved
+
+
+async def save_templates(rows: list[dict]):
+    """Bulk upsert of templates, then one invalidation for all of them."""
+    if not rows:
+        return
+    await upsert_templates(rows)
+    await invalidate_templates()
@@ -0,0 +1,28 @@
+from functools import lru_cache
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = "cl100k_base"
+
+
+@lru_cache()
+def _get_encoding():
+    """Load the tiktoken encoding once; None if it cannot be loaded (e.g. no network on first use)."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable ({e}), estimating tokens from text length")
+        return None
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Number of tokens in `text` (estimated at ~4 characters per token without tiktoken)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,58 +1,112 @@
-from twilio.rest import Client
 from app.config import get_settings
-from typing import Optional
+from typing import Any, Optional
+import asyncio
+import json
+import weakref
+import httpx
 import logging
 
 logger = logging.getLogger(__name__)
 
-_client: Optional[Client] = None
+# One pooled Twilio client per event loop: httpx connections are bound to the
+# loop that opened them (the API loop, or a Celery worker's runtime loop).
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
 
 
-def get_twilio_client() -> Client:
-    """Get or create Twilio client."""
-    global _client
-    if _client is None:
+class TwilioAPIError(Exception):
+    """Error response from the Twilio REST API."""
+
+    def __init__(self, status_code: int, message: str, code: Optional[int] = None):
+        super().__init__(f"HTTP {status_code}: {message}" + (f" (code {code})" if code else ""))
+        self.status_code = status_code
+        self.code = code
+
+
+def get_twilio_http() -> httpx.AsyncClient:
+    """Get or create the pooled, keep-alive Twilio client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
         settings = get_settings()
-        _client = Client(settings.twilio_account_sid, settings.twilio_auth_token)
-    return _client
+        client = httpx.AsyncClient(
+            auth=(settings.twilio_account_sid, settings.twilio_auth_token),
+            http2=settings.twilio_http2,
+            limits=httpx.Limits(
+                max_connections=settings.twilio_pool_size,
+                max_keepalive_connections=settings.twilio_pool_size,
+            ),
+            timeout=httpx.Timeout(settings.twilio_timeout, connect=settings.twilio_connect_timeout),
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def close_twilio_http():
+    """Close the Twilio client of the running event loop (app / worker shutdown)."""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _twilio_request(method: str, url: str, data: Optional[dict] = None, json_body: Any = None) -> dict:
+    """Call the Twilio REST API and return the decoded JSON body."""
+    response = await get_twilio_http().request(method, url, data=data, json=json_body)
+    payload = response.json() if response.content else {}
+    if response.status_code >= 400:
+        raise TwilioAPIError(response.status_code, payload.get("message", response.text), payload.get("code"))
+    return payload
+
+
+def _whatsapp_address(phone: str) -> str:
+    return f"whatsapp:{phone}" if not phone.startswith("whatsapp:") else phone
+
+
+def _messages_url() -> str:
+    settings = get_settings()
+    return f"{settings.twilio_api_base}/2010-04-01/Accounts/{settings.twilio_account_sid}/Messages.json"
 
 
 async def send_freeform_message(to: str, body: str) -> dict:
     """Send a freeform WhatsApp message (within 24h window)."""
     settings = get_settings()
-    client = get_twilio_client()
 
     try:
-        message = client.messages.create(
-            from_=f"whatsapp:{settings.twilio_whatsapp_number}",
-            to=f"whatsapp:{to}" if not to.startswith("whatsapp:") else to,
-            body=body,
-        )
-        logger.info(f"Sent freeform message to {to}: {message.sid}")
-        return {"success": True, "message_sid": message.sid}
+        message = await _twilio_request("POST", _messages_url(), data={
+            "From": f"whatsapp:{settings.twilio_whatsapp_number}",
+            "To": _whatsapp_address(to),
+            "Body": body,
+        })
+        logger.info(f"Sent freeform message to {to}: {message['sid']}")
+        return {"success": True, "message_sid": message["sid"]}
     except Exception as e:
         logger.error(f"Failed to send freeform message to {to}: {e}")
         return {"success": False, "error": str(e)}
 
 
-async def send_template_message(to: str, content_sid: str, variables: dict = None) -> dict:
-    """Send a WhatsApp template message using Twilio Content API."""
+async def send_template_message(to: str, content_sid: str, variables: dict = None,
+                                status_callback: Optional[str] = None) -> dict:
+    """Send a WhatsApp template message using Twilio Content API.
+
+    With `status_callback`, Twilio POSTs each delivery status change of the
+    message to that URL.
+    """
     settings = get_settings()
-    client = get_twilio_client()
 
     try:
-        kwargs = {
-            "from_": f"whatsapp:{settings.twilio_whatsapp_number}",
-            "to": f"whatsapp:{to}" if not to.startswith("whatsapp:") else to,
-            "content_sid": content_sid,
+        data = {
+            "From": f"whatsapp:{settings.twilio_whatsapp_number}",
+            "To": _whatsapp_address(to),
+            "ContentSid": content_sid,
         }
 
         if variables:
-            kwargs["content_variables"] = str(variables)
+            data["ContentVariables"] = json.dumps(variables)
+        if status_callback:
+            data["StatusCallback"] = status_callback
 
-        message = client.messages.create(**kwargs)
-        logger.info(f"Sent template {content_sid} to {to}: {message.sid}")
-        return {"success": True, "message_sid": message.sid}
+        message = await _twilio_request("POST", _messages_url(), data=data)
+        logger.info(f"Sent template {content_sid} to {to}: {message['sid']}")
+        return {"success": True, "message_sid": message["sid"]}
     except Exception as e:
         logger.error(f"Failed to send template to {to}: {e}")
         return {"success": False, "error": str(e)}
@@ -67,27 +121,26 @@ async def create_content_template(
 ) -> dict:
     """Create a new WhatsApp template via Twilio Content API."""
     settings = get_settings()
-    client = get_twilio_client()
 
     try:
         # Build the content template body
-        types = {
-            "twilio/text": {
-                "body": body,
-            }
+        payload = {
+            "friendly_name": name,
+            "language": language,
+            "types": {
+                "twilio/text": {
+                    "body": body,
+                }
+            },
         }
 
         if variables:
-            types["twilio/text"]["variables"] = variables
+            payload["variables"] = variables
 
-        content = client.content.v1.contents.create(
-            friendly_name=name,
-            language=language,
-            types=types,
-        )
+        content = await _twilio_request("POST", f"{settings.twilio_content_base}/v1/Content", json_body=payload)
 
-        logger.info(f"Created content template: {content.sid}")
-        return {"success": True, "content_sid": content.sid, "status": "draft"}
+        logger.info(f"Created content template: {content['sid']}")
+        return {"success": True, "content_sid": content["sid"], "status": "draft"}
     except Exception as e:
         logger.error(f"Failed to create content template: {e}")
         return {"success": False, "error": str(e)}
@@ -96,12 +149,12 @@ async def create_content_template(
 async def submit_template_for_approval(content_sid: str, name: str, category: str = "UTILITY") -> dict:
     """Submit a content template for WhatsApp/Meta approval."""
     settings = get_settings()
-    client = get_twilio_client()
 
     try:
-        approval = client.content.v1.contents(content_sid).approval_requests.create(
-            name=name,
-            category=category.lower(),
+        await _twilio_request(
+            "POST",
+            f"{settings.twilio_content_base}/v1/Content/{content_sid}/ApprovalRequests/whatsapp",
+            json_body={"name": name, "category": category.lower()},
         )
 
         logger.info(f"Submitted template {content_sid} for approval")
@@ -111,17 +164,23 @@ async def submit_template_for_approval(content_sid: str, name: str, category: st
         return {"success": False, "error": str(e)}
 
 
+# WhatsApp approval outcomes worth storing; anything else ("received", "unknown"...) is still pending
+TERMINAL_APPROVAL_STATUSES = frozenset({"approved", "rejected", "paused", "disabled"})
+
+
 async def check_template_approval_status(content_sid: str) -> dict:
     """Check the approval status of a content template."""
     settings = get_settings()
-    client = get_twilio_client()
 
     try:
-        approval = client.content.v1.contents(content_sid).approval_fetch.fetch()
+        approval = await _twilio_request(
+            "GET",
+            f"{settings.twilio_content_base}/v1/Content/{content_sid}/ApprovalRequests",
+        )
         return {
             "success": True,
             "content_sid": content_sid,
-            "status": approval.status,
+            "status": (approval.get("whatsapp") or {}).get("status", "unknown"),
         }
     except Exception as e:
         logger.error(f"Failed to check template status: {e}")
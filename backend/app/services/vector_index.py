@@ -0,0 +1,213 @@
+from typing import Optional
+from langchain_core.documents import Document
+from app.config import get_settings
+from app.services.supabase_service import get_knowledge_base_rows, get_knowledge_base_version
+import numpy as np
+import asyncio
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_embedding(value) -> np.ndarray:
+    # PostgREST serializes pgvector columns as a "[0.1,0.2,...]" string
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _contains(metadata, expected) -> bool:
+    """Python equivalent of jsonb `metadata @> filter`."""
+    if isinstance(expected, dict):
+        return isinstance(metadata, dict) and all(
+            key in metadata and _contains(metadata[key], value) for key, value in expected.items()
+        )
+    if isinstance(expected, list):
+        if not isinstance(metadata, list):
+            return False
+        return all(any(_contains(item, value) for item in metadata) for value in expected)
+    return metadata == expected
+
+
+class LocalVectorIndex:
+    """In-memory copy of knowledge_base for top-k cosine search.
+
+    Embeddings live in one contiguous, L2-normalized float32 matrix, so a
+    query is a single matrix-vector product plus argpartition. The index is
+    refreshed incrementally from `updated_at`; deletions trigger a full reload.
+    """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max_rows
+        self.too_large = False
+        self.version: Optional[str] = None
+        self._ids: list[str] = []
+        self._titles: list[Optional[str]] = []
+        self._contents: list[str] = []
+        self._categories: list[Optional[str]] = []
+        self._priorities: list[Optional[int]] = []
+        self._metadata: list[dict] = []
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._max_updated_at: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _rebuild(self, rows_by_id: dict[str, dict]):
+        ids = list(rows_by_id)
+        vectors = np.stack([_parse_embedding(rows_by_id[i]["embedding"]) for i in ids]) if ids else np.empty((0, 0), dtype=np.float32)
+        if len(ids):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+
+        self._ids = ids
+        self._titles = [rows_by_id[i].get("title") for i in ids]
+        self._contents = [rows_by_id[i]["content"] for i in ids]
+        self._categories = [rows_by_id[i].get("category") for i in ids]
+        self._priorities = [rows_by_id[i].get("priority") for i in ids]
+        self._metadata = [rows_by_id[i].get("metadata") or {} for i in ids]
+        self._matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._max_updated_at = max((rows_by_id[i]["updated_at"] or "" for i in ids), default=None)
+
+    def _rows(self) -> dict[str, dict]:
+        return {
+            row_id: {
+                "title": self._titles[i],
+                "content": self._contents[i],
+                "category": self._categories[i],
+                "priority": self._priorities[i],
+                "metadata": self._metadata[i],
+                "embedding": self._matrix[i],
+                "updated_at": self._max_updated_at,
+            }
+            for i, row_id in enumerate(self._ids)
+        }
+
+    async def refresh(self):
+        """Bring the index in line with knowledge_base (incremental when possible)."""
+        version = await get_knowledge_base_version()
+        if version == self.version:
+            return
+        total = int(version.split(":", 1)[0] or 0)
+
+        if total > self.max_rows:
+            if not self.too_large:
+                logger.warning(f"knowledge_base has {total} rows (> {self.max_rows}), using pgvector retrieval")
+            self.too_large = True
+            self._rebuild({})
+            self.version = version
+            return
+        self.too_large = False
+
+        start = time.perf_counter()
+        if self._max_updated_at is None:
+            changed = await get_knowledge_base_rows()
+            rows = {row["id"]: row for row in changed}
+        else:
+            changed = await get_knowledge_base_rows(updated_after=self._max_updated_at)
+            rows = self._rows()
+            rows.update({row["id"]: row for row in changed})
+            if len(rows) != total:
+                # Rows were deleted (or lost their embedding): reload everything
+                changed = await get_knowledge_base_rows()
+                rows = {row["id"]: row for row in changed}
+
+        self._rebuild(rows)
+        self.version = version
+        logger.info(
+            f"Local vector index: {len(self)} rows ({len(changed)} fetched) "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+
+    def search_rows(self, embedding, k: int, filter: Optional[dict] = None) -> list[dict]:
+        """Top-k rows by cosine similarity, honoring `metadata @> filter`.
+
+        Rows have the same shape as the `hybrid_search` SQL function output,
+        minus the keyword and combined scores.
+        """
+        if not self._ids:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = self._matrix @ (query / norm if norm else query)
+
+        if filter:
+            mask = np.fromiter((_contains(m, filter) for m in self._metadata), dtype=bool, count=len(self._metadata))
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": self._ids[i],
+                "title": self._titles[i],
+                "content": self._contents[i],
+                "category": self._categories[i],
+                "priority": self._priorities[i],
+                "metadata": self._metadata[i],
+                "similarity": float(scores[i]),
+            }
+            for i in top
+        ]
+
+    def search(self, embedding, k: int, filter: Optional[dict] = None) -> list[Document]:
+        """Top-k documents by cosine similarity, honoring `metadata @> filter`."""
+        return [
+            Document(page_content=row["content"], metadata=row["metadata"])
+            for row in self.search_rows(embedding, k, filter)
+        ]
+
+
+_index: Optional[LocalVectorIndex] = None
+_refreshed_at = 0.0
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def _refresh():
+    global _refreshed_at
+    try:
+        await _index.refresh()
+    except Exception as e:
+        logger.error(f"Local vector index refresh failed: {e}", exc_info=True)
+    finally:
+        _refreshed_at = time.monotonic()
+
+
+async def load_local_index():
+    """Load the index ahead of the first message (FastAPI startup)."""
+    global _index
+    settings = get_settings()
+    if not settings.local_vector_index_enabled:
+        return
+    if _index is None:
+        _index = LocalVectorIndex(max_rows=settings.local_vector_index_max_rows)
+    await _refresh()
+
+
+def get_local_index() -> Optional[LocalVectorIndex]:
+    """Get the local index when it can serve queries, else None (use pgvector).
+
+    Schedules a background refresh when the index is older than
+    `local_vector_index_refresh_seconds`; queries never wait for it.
+    """
+    global _index, _refresh_task
+    settings = get_settings()
+    if not settings.local_vector_index_enabled:
+        return None
+    if _index is None:
+        _index = LocalVectorIndex(max_rows=settings.local_vector_index_max_rows)
+
+    stale = time.monotonic() - _refreshed_at > settings.local_vector_index_refresh_seconds
+    if stale and (_refresh_task is None or _refresh_task.done()):
+        _refresh_task = asyncio.create_task(_refresh())
+
+    if _index.too_large or _index.version is None:
+        return None
+    return _index
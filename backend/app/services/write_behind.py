@@ -0,0 +1,171 @@
+from datetime import datetime, timezone
+from typing import Optional
+from app.config import get_settings
+from app.services.supabase_service import build_ai_log_row, build_message_row, insert_rows
+from app.services.conversation_cache import record_message
+import asyncio
+import httpx
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def _is_transient(error: Exception) -> bool:
+    """Network errors, 5xx and 429 are retried; other 4xx mean the rows themselves are bad."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(error, httpx.TransportError)
+
+
+class WriteBehindQueue:
+    """Background batch writer for append-only tables (messages, ai_logs).
+
+    Rows are queued in memory and flushed by one task as multi-row inserts,
+    when `batch_size` rows are waiting or `flush_seconds` after the first one.
+    Transient Supabase errors are retried with exponential backoff up to
+    `max_retries` times; a batch rejected by Supabase is split in halves
+    until the offending rows are isolated and dropped alone. `close()` flushes everything still queued.
+    """
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_retries: int, max_queue: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "retries": 0, "batches": 0, "splits": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._closed
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, table: str, row: dict):
+        """Queue a row; waits only when `max_queue` rows are already pending."""
+        await self._queue.put((table, row))
+        self.stats["queued"] += 1
+
+    async def close(self):
+        """Stop accepting rows and flush the queue (app shutdown)."""
+        if self._task is None or self._closed:
+            return
+        self._closed = True
+        await self._queue.put(_STOP)
+        await self._task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[str, dict]]):
+        by_table: dict[str, list[dict]] = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+
+        for table, rows in by_table.items():
+            await self._insert(table, rows)
+
+    async def _insert(self, table: str, rows: list[dict]):
+        """Insert with retries; a rejected batch is split in halves so only its bad rows are lost."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await insert_rows(table, rows)
+                self.stats["written"] += len(rows)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                if not _is_transient(e) and len(rows) > 1:
+                    self.stats["splits"] += 1
+                    middle = len(rows) // 2
+                    await self._insert(table, rows[:middle])
+                    await self._insert(table, rows[middle:])
+                    return
+                if attempt < self.max_retries and _is_transient(e):
+                    self.stats["retries"] += 1
+                    delay = min(0.5 * 2 ** attempt, 10.0)
+                    logger.warning(f"Write-behind insert into {table} failed ({e}), retry in {delay}s")
+                    await asyncio.sleep(delay)
+                    continue
+                self.stats["dropped"] += len(rows)
+                if len(rows) == 1:
+                    logger.error(f"Write-behind dropped {table} row {rows[0]}: {e}")
+                else:
+                    logger.error(f"Write-behind dropped {len(rows)} {table} rows: {e}", exc_info=True)
+                return
+
+
+_queue: Optional[WriteBehindQueue] = None
+
+
+def start_write_behind():
+    """Start the process-wide queue (FastAPI startup)."""
+    global _queue
+    settings = get_settings()
+    if not settings.write_behind_enabled or (_queue is not None and _queue.running):
+        return
+    _queue = WriteBehindQueue(
+        batch_size=settings.write_behind_batch_size,
+        flush_seconds=settings.write_behind_flush_seconds,
+        max_retries=settings.write_behind_max_retries,
+        max_queue=settings.write_behind_max_queue,
+    )
+    _queue.start()
+
+
+async def stop_write_behind():
+    """Drain the queue (FastAPI shutdown)."""
+    if _queue is not None:
+        await _queue.close()
+        logger.info(f"Write-behind queue drained: {_queue.stats}")
+
+
+async def _write(table: str, row: dict):
+    # Timestamp taken now, not at flush time, so history order is preserved
+    row["created_at"] = datetime.now(timezone.utc).isoformat()
+    if _queue is not None and _queue.running:
+        await _queue.put(table, row)
+    else:
+        # No queue in this process (disabled, Celery worker, shutdown): write inline
+        await insert_rows(table, [row])
+
+
+async def queue_message(conversation_id: str, shop_id: str, role: str, content: str, metadata: dict = None):
+    """Persist a message through the write-behind queue and the conversation cache."""
+    row = build_message_row(conversation_id, shop_id, role, content, metadata, message_id=str(uuid.uuid4()))
+    await _write("messages", row)
+    await record_message(conversation_id, row["id"], role, content, row["created_at"])
+
+
+async def queue_ai_log(shop_id: str, conversation_id: str, input_text: str, output_text: str, metrics: dict = None):
+    """Persist an ai_logs row through the write-behind queue."""
+    await _write("ai_logs", build_ai_log_row(shop_id, conversation_id, input_text, output_text, metrics))
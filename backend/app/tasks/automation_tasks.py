@@ -1,27 +1,52 @@
+from celery import chord
+from celery.result import AsyncResult
 from app.tasks.celery_app import celery_app
+from app.tasks import runtime
+from app.config import get_settings
 from app.services.supabase_service import (
     get_active_automations,
-    get_audience_phones,
-    get_template_by_name,
-    get_all_templates,
-    upsert_template,
+    get_automation_candidates,
+    get_pending_templates,
+    insert_rows,
     increment_automation_executions,
+    update_automation,
 )
-from app.services.twilio_service import send_template_message, check_template_approval_status
+from app.services.twilio_service import (
+    TERMINAL_APPROVAL_STATUSES,
+    check_template_approval_status,
+    send_template_message,
+)
+from app.services.bulk_sender import send_bulk
+from app.services.template_cache import get_templates, save_templates
+from app.services.rate_limiter import get_sender_rate_limiter
+from app.services.redis_service import get_redis
+from datetime import datetime, timezone
+from typing import Optional
 import asyncio
-import logging
 import time
+import uuid
+import logging
 
 logger = logging.getLogger(__name__)
 
+CHECK_LOCK_KEY = "automations:check_lock"
+POLLED_AT_KEY = "templates:approval_polled_at"  # template name -> last approval poll (epoch)
 
-def _run_async(coro):
-    """Helper to run async functions from sync Celery tasks."""
-    loop = asyncio.new_event_loop()
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+# Release the run lock only if this run still holds it
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _running_key(automation_id: str) -> str:
+    return f"automation:{automation_id}:running"
+
+
+def _claimed_key(automation_id: str, run_id: str) -> str:
+    return f"automation:{automation_id}:run:{run_id}:claimed"
 
 
 # Mapping automation trigger types to audience segments
@@ -36,94 +61,293 @@ TRIGGER_TO_SEGMENT = {
 
 @celery_app.task(name="app.tasks.automation_tasks.check_automations")
 def check_automations():
-    """Periodic task: check active automations and execute them.
+    """Periodic task: check active automations and dispatch them.
 
-    Runs every 5 minutes via Celery Beat.
-    For each active automation:
-    1. Resolve the audience based on trigger type
-    2. Send the template to matching recipients
-    3. Increment execution count
+    Runs every 5 minutes via Celery Beat, under a Redis lock so that two
+    runs never overlap. Templates are loaded in one query. Each automation
+    only considers the conversations that entered its segment since its
+    high-water mark (`last_processed_at`), minus recipients it already
+    messaged within `AUTOMATION_COOLDOWN_HOURS` (`automation_logs`).
+    Sending is handed to `send_automation_chunk` tasks on the bulk-send
+    workers (shared rate limiter), so the beat task itself returns in seconds.
     """
-    automations = _run_async(get_active_automations())
+    return runtime.run(_check_automations())
+
+
+async def _check_automations() -> dict:
+    settings = get_settings()
+    redis = get_redis()
+    token = uuid.uuid4().hex
+    if not await redis.set(CHECK_LOCK_KEY, token, nx=True, ex=settings.automation_lock_seconds):
+        logger.info("check_automations already running, skipping this tick")
+        return {"checked": 0, "executed": 0, "skipped": "locked"}
+    try:
+        return await _dispatch_automations()
+    finally:
+        await redis.register_script(_RELEASE_LOCK_LUA)(keys=[CHECK_LOCK_KEY], args=[token])
+
+
+async def _dispatch_automations() -> dict:
+    automations = await get_active_automations()
 
     if not automations:
         return {"checked": 0, "executed": 0}
 
-    executed = 0
+    # 1. Every template in one query
+    templates = await get_templates(sorted({a["template_name"] for a in automations if a.get("template_name")}))
 
+    runnable = []
     for automation in automations:
+        template_name = automation.get("template_name")
+        trigger_type = automation.get("trigger_type")
+
+        if not template_name or not trigger_type:
+            continue
+
+        template = templates.get(template_name)
+        if not template or template["status"] != "approved":
+            logger.warning(f"Automation {automation['id']}: template '{template_name}' not approved, skipping")
+            continue
+
+        content_sid = template.get("twilio_content_sid")
+        if not content_sid:
+            continue
+
+        runnable.append((automation, content_sid, TRIGGER_TO_SEGMENT.get(trigger_type, "all")))
+
+    # 2. Delta of each automation's segment since its high-water mark, deduped server-side
+    redis = get_redis()
+    settings = get_settings()
+    until = datetime.now(timezone.utc).isoformat()
+    ready = []
+    for automation, content_sid, segment in runnable:
+        # The previous dispatch of this automation is still sending
+        if await redis.set(_running_key(automation["id"]), 1, nx=True, ex=settings.automation_run_ttl_seconds):
+            ready.append((automation, content_sid, segment))
+        else:
+            logger.info(f"Automation {automation['id']}: previous run still in progress, skipping")
+    candidates = await asyncio.gather(*(
+        get_automation_candidates(
+            automation["id"],
+            segment,
+            since=automation.get("last_processed_at"),
+            until=until,
+            cooldown_hours=settings.automation_cooldown_hours,
+        )
+        for automation, _, segment in ready
+    ), return_exceptions=True)
+
+    # 3. Fan out the sends, then move the high-water mark
+    executed = 0
+    totals = {"scanned": 0, "deduplicated": 0, "dispatched": 0}
+    for (automation, content_sid, segment), rows in zip(ready, candidates):
+        dispatched = False
         try:
-            template_name = automation.get("template_name")
-            trigger_type = automation.get("trigger_type")
+            if isinstance(rows, Exception):
+                raise rows
+            phones = [row["customer_phone"] for row in rows if not row["recently_sent"]]
+            if phones:
+                dispatch_automation(automation["id"], content_sid, phones, scanned=len(rows))
+                dispatched = True
+                executed += 1
+            await update_automation(automation["id"], {"last_processed_at": until})
+        except Exception as e:
+            logger.error(f"Automation {automation['id']} failed: {e}", exc_info=True)
+            continue
+        finally:
+            if not dispatched:
+                await redis.delete(_running_key(automation["id"]))
+        totals["scanned"] += len(rows)
+        totals["deduplicated"] += len(rows) - len(phones)
+        totals["dispatched"] += len(phones)
+        logger.info(
+            f"Automation {automation['id']} ({automation['name']}): {len(rows)} new candidates in '{segment}', "
+            f"{len(rows) - len(phones)} within cooldown, {len(phones)} dispatched"
+        )
+
+    return {"checked": len(automations), "executed": executed, **totals}
 
-            if not template_name or not trigger_type:
-                continue
 
-            # Get template
-            template = _run_async(get_template_by_name(template_name))
-            if not template or template["status"] != "approved":
-                logger.warning(f"Automation {automation['id']}: template '{template_name}' not approved, skipping")
-                continue
+def dispatch_automation(automation_id: str, content_sid: str, phones: list[str], scanned: int = 0) -> AsyncResult:
+    """Send an automation's template to its audience as a chord of chunk tasks.
+
+    `scanned` is the number of candidates evaluated for this run, reported
+    by `finalize_automation` next to the number actually sent. If a chunk
+    fails for good, `release_automation` lets the automation run again.
+    """
+    size = get_settings().campaign_chunk_size
+    run_id = uuid.uuid4().hex
+    header = [
+        send_automation_chunk.s(
+            automation_id=automation_id, content_sid=content_sid, phones=phones[i:i + size], run_id=run_id,
+        )
+        for i in range(0, len(phones), size)
+    ]
+    callback = finalize_automation.s(automation_id=automation_id, scanned=scanned).on_error(
+        release_automation.s(automation_id=automation_id)
+    )
+    return chord(header)(callback)
 
-            content_sid = template.get("twilio_content_sid")
-            if not content_sid:
-                continue
 
-            # Resolve audience
-            segment = TRIGGER_TO_SEGMENT.get(trigger_type, "all")
-            phones = _run_async(get_audience_phones(segment))
+@celery_app.task(
+    bind=True,
+    name="app.tasks.automation_tasks.send_automation_chunk",
+    autoretry_for=(Exception,),
+    max_retries=3,
+    retry_backoff=True,
+)
+def send_automation_chunk(self, automation_id: str, content_sid: str, phones: list[str], run_id: str = ""):
+    """Send an automation template to one chunk of recipients.
 
-            if not phones:
-                continue
+    Same pacing as campaign chunks (shared token bucket, `SEND_CONCURRENCY`
+    requests in flight); each send is recorded in `automation_logs`.
+    Recipients are claimed in a per-run Redis set right before their send,
+    so a retried or redelivered chunk (acks_late) skips them and never
+    messages anyone twice.
+    """
+    return runtime.run(_send_automation_chunk(automation_id, content_sid, phones, run_id or self.request.id))
 
-            # Send to each recipient (with rate limiting)
-            for phone in phones:
-                try:
-                    _run_async(send_template_message(to=phone, content_sid=content_sid))
-                    time.sleep(1)  # Rate limit
-                except Exception as e:
-                    logger.error(f"Automation {automation['id']}: failed to send to {phone}: {e}")
 
-            # Update execution count
-            _run_async(increment_automation_executions(automation["id"]))
-            executed += 1
+async def _send_automation_chunk(automation_id: str, content_sid: str, phones: list[str], run_id: str) -> dict:
+    settings = get_settings()
+    redis = get_redis()
+    claimed_key = _claimed_key(automation_id, run_id)
 
-            logger.info(f"Automation {automation['id']} ({automation['name']}): sent to {len(phones)} recipients")
+    async def _send(phone: str) -> dict:
+        return await send_template_message(to=phone, content_sid=content_sid)
 
+    # Claimed by an earlier attempt of this run: it may have been sent already, so never resend
+    async with redis.pipeline(transaction=False) as pipe:
+        for phone in phones:
+            pipe.sadd(claimed_key, phone)
+        pipe.expire(claimed_key, settings.automation_run_ttl_seconds)
+        added = await pipe.execute()
+    claimed = [phone for phone, new in zip(phones, added) if new]
+    skipped = len(phones) - len(claimed)
+    if skipped:
+        logger.info(f"Automation {automation_id}: resuming chunk, {skipped} recipients already handled")
+
+    results = await send_bulk(
+        claimed,
+        _send,
+        rate_limiter=get_sender_rate_limiter(),
+        concurrency=settings.send_concurrency,
+    )
+
+    failed = 0
+    logs = []
+    for result in results:
+        if not result.success:
+            failed += 1
+            logger.error(f"Automation {automation_id}: failed to send to {result.phone}: {result.error}")
+        logs.append({
+            "automation_id": automation_id,
+            "customer_phone": result.phone,
+            "status": "sent" if result.success else "failed",
+            "twilio_sid": result.message_sid,
+            "error_message": result.error,
+        })
+    for i in range(0, len(logs), settings.campaign_db_batch_size):
+        try:
+            await insert_rows("automation_logs", logs[i:i + settings.campaign_db_batch_size])
         except Exception as e:
-            logger.error(f"Automation {automation['id']} failed: {e}", exc_info=True)
+            logger.error(f"Automation {automation_id}: failed to write automation_logs: {e}")
+
+    return {"sent": len(results) - failed, "failed": failed, "skipped": skipped, "total": len(phones)}
+
+
+@celery_app.task(name="app.tasks.automation_tasks.finalize_automation")
+def finalize_automation(chunk_results: list[dict], automation_id: str, scanned: int = 0):
+    """Chord callback: count the execution and let the automation run again."""
+    return runtime.run(_finalize_automation(automation_id, chunk_results, scanned))
+
+
+async def _finalize_automation(automation_id: str, chunk_results: list[dict], scanned: int = 0) -> dict:
+    sent = sum(r["sent"] for r in chunk_results)
+    failed = sum(r["failed"] for r in chunk_results)
+    try:
+        await increment_automation_executions(automation_id)
+    finally:
+        await get_redis().delete(_running_key(automation_id))
+    logger.info(f"Automation {automation_id}: completed. Scanned={scanned}, Sent={sent}, Failed={failed}")
+    return {"automation_id": automation_id, "scanned": scanned, "sent": sent, "failed": failed}
+
+
+@celery_app.task(name="app.tasks.automation_tasks.release_automation")
+def release_automation(request, exc, traceback, automation_id: str):
+    """Chord errback: a chunk exhausted its retries, so `finalize_automation` will never run.
+
+    Clears the running key so the next `check_automations` can dispatch the
+    automation again instead of waiting for `AUTOMATION_RUN_TTL_SECONDS`.
+    """
+    logger.error(f"Automation {automation_id}: chunk {request.id} failed for good: {exc}")
+    return runtime.run(get_redis().delete(_running_key(automation_id)))
+
 
-    return {"checked": len(automations), "executed": executed}
+def _poll_due(template: dict, last_polled: Optional[float], now: float, base: int, maximum: int) -> bool:
+    """Exponential backoff from submission: polls at ~base, 2*base, 4*base... after it, capped at `maximum`."""
+    if last_polled is None:
+        return True
+    submitted = datetime.fromisoformat(template["created_at"]).timestamp() if template.get("created_at") else last_polled
+    interval = min(maximum, max(base, last_polled - submitted))
+    return now - last_polled >= interval
 
 
 @celery_app.task(name="app.tasks.automation_tasks.check_template_approvals")
 def check_template_approvals():
     """Periodic task: check pending template approvals on Twilio.
 
-    Runs every hour via Celery Beat.
-    Updates local status when Meta approves/rejects a template.
+    Runs every 5 minutes via Celery Beat. Only pending templates are loaded;
+    each is polled with an interval that doubles with its time since
+    submission (`TEMPLATE_POLL_BASE_SECONDS` to `TEMPLATE_POLL_MAX_SECONDS`).
+    Due templates are checked concurrently and every status change is
+    written in one bulk upsert.
     """
-    templates = _run_async(get_all_templates())
-    pending = [t for t in templates if t["status"] == "pending" and t.get("twilio_content_sid")]
+    return runtime.run(_check_template_approvals())
+
+
+async def _check_template_approvals() -> dict:
+    settings = get_settings()
+    redis = get_redis()
+    pending = await get_pending_templates()
 
     if not pending:
-        return {"checked": 0, "updated": 0}
+        return {"pending": 0, "checked": 0, "updated": 0}
 
-    updated = 0
+    now = time.time()
+    polled_at = await redis.hmget(POLLED_AT_KEY, [template["name"] for template in pending])
+    due = [
+        template for template, last in zip(pending, polled_at)
+        if _poll_due(template, float(last) if last else None, now,
+                     settings.template_poll_base_seconds, settings.template_poll_max_seconds)
+    ]
+    if not due:
+        return {"pending": len(pending), "checked": 0, "updated": 0}
 
-    for template in pending:
-        try:
-            result = _run_async(check_template_approval_status(template["twilio_content_sid"]))
+    semaphore = asyncio.Semaphore(settings.template_poll_concurrency)
 
-            if result["success"] and result.get("status") != "pending":
-                _run_async(upsert_template({
-                    "name": template["name"],
-                    "status": result["status"],
-                }))
-                updated += 1
-                logger.info(f"Template '{template['name']}' status updated to: {result['status']}")
+    async def _check(template: dict) -> dict:
+        async with semaphore:
+            return await check_template_approval_status(template["twilio_content_sid"])
 
-        except Exception as e:
-            logger.error(f"Failed to check template '{template['name']}': {e}")
+    results = await asyncio.gather(*(_check(template) for template in due))
+
+    changed = []
+    for template, result in zip(due, results):
+        if not result["success"]:
+            logger.error(f"Failed to check template '{template['name']}': {result.get('error')}")
+        elif result.get("status") in TERMINAL_APPROVAL_STATUSES:
+            changed.append({
+                **{k: v for k, v in template.items() if k not in ("created_at", "updated_at")},
+                "status": result["status"],
+            })
+            logger.info(f"Template '{template['name']}' status updated to: {result['status']}")
+
+    await save_templates(changed)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(POLLED_AT_KEY, mapping={template["name"]: now for template in due})
+        if changed:
+            pipe.hdel(POLLED_AT_KEY, *[template["name"] for template in changed])
+        await pipe.execute()
 
-    return {"checked": len(pending), "updated": updated}
+    return {"pending": len(pending), "checked": len(due), "updated": len(changed)}
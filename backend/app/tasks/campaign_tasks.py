@@ -1,82 +1,284 @@
+from celery import chord
+from celery.result import AsyncResult
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
 from app.tasks.celery_app import celery_app
+from app.tasks import runtime
+from app.config import get_settings
 from app.services.twilio_service import send_template_message
-from app.services.supabase_service import update_campaign
-import asyncio
+from app.services.supabase_service import (
+    get_campaign,
+    update_campaign,
+    enqueue_campaign_messages,
+    claim_campaign_messages,
+    complete_campaign_messages,
+    stream_audience_phones,
+    stream_campaign_messages,
+)
+from app.services.bulk_sender import send_bulk
+from app.services.rate_limiter import get_sender_rate_limiter
+from app.services.redis_service import get_redis
+import json
 import logging
-import time
 
 logger = logging.getLogger(__name__)
 
+# Finalization flag TTL, long enough to cover retries and late chord callbacks
+CAMPAIGN_STATE_TTL = 7 * 24 * 3600
 
-def _run_async(coro):
-    """Helper to run async functions from sync Celery tasks."""
-    loop = asyncio.new_event_loop()
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+
+async def _plan_chunks(phones: AsyncIterator[str], chunk_size: int) -> tuple[list[tuple[Optional[str], str]], int]:
+    """Cut an ordered stream of phone numbers into `(after, through]` ranges.
+
+    Only the range bounds are kept (one pair per chunk), never the numbers
+    themselves. Returns the ranges and the number of recipients.
+    """
+    bounds: list[tuple[Optional[str], str]] = []
+    after: Optional[str] = None
+    count = 0
+    last = None
+    async for phone in phones:
+        count += 1
+        last = phone
+        if count % chunk_size == 0:
+            bounds.append((after, phone))
+            after = phone
+    if last is not None and last != after:
+        bounds.append((after, last))
+    return bounds, count
+
+
+@celery_app.task(
+    bind=True,
+    name="app.tasks.campaign_tasks.plan_campaign",
+    autoretry_for=(Exception,),
+    max_retries=3,
+    retry_backoff=True,
+)
+def plan_campaign(self, campaign_id: str, content_sid: str, audience: str, variables: dict = None):
+    """Snapshot a campaign's audience into `campaign_messages`, then dispatch its chunks.
+
+    Runs off the request path: the audience is streamed once and every
+    recipient is enqueued ('queued' row) before any chunk exists, so the
+    chunks cut the snapshot, not the live audience, and a contact who joins
+    or leaves the segment meanwhile cannot shift a range. A retry re-enqueues
+    idempotently (existing rows are kept).
+    """
+    return runtime.run(_plan_campaign(campaign_id, content_sid, audience, variables))
 
 
-@celery_app.task(bind=True, name="app.tasks.campaign_tasks.send_campaign_bulk", max_retries=0)
+@celery_app.task(bind=True, name="app.tasks.campaign_tasks.send_campaign_bulk")
 def send_campaign_bulk(self, campaign_id: str, content_sid: str, phones: list[str], variables: dict = None):
-    """Send a template message to all phones in the audience.
+    """Deprecated: former one-task bulk send, kept for one release.
 
-    Rate limited to 1 message/second to respect Twilio limits.
-    Updates campaign stats (sent_count, delivered_count) as it progresses.
+    Drains messages still queued under this name at deploy time: the phone
+    list they carry becomes the campaign's snapshot and is sent through the
+    regular chunked path. Remove once no such message can remain.
     """
-    total = len(phones)
-    sent = 0
-    delivered = 0
-    failed = 0
-
-    logger.info(f"Campaign {campaign_id}: starting bulk send to {total} recipients")
-
-    for i, phone in enumerate(phones):
-        try:
-            result = _run_async(send_template_message(
-                to=phone,
-                content_sid=content_sid,
-                variables=variables,
-            ))
-
-            if result["success"]:
-                sent += 1
-                delivered += 1
+    logger.warning(f"Campaign {campaign_id}: legacy send_campaign_bulk message, rerouted to the chunked path")
+    return runtime.run(_plan_campaign(campaign_id, content_sid, "legacy", variables, phones=phones))
+
+
+async def _iterate(phones: list[str]) -> AsyncIterator[str]:
+    for phone in phones:
+        yield phone
+
+
+async def _plan_campaign(campaign_id: str, content_sid: str, audience: str, variables: dict = None,
+                         phones: Optional[list[str]] = None) -> dict:
+    settings = get_settings()
+    batch_size = settings.campaign_db_batch_size
+    recipients = (
+        _iterate(phones) if phones is not None
+        else stream_audience_phones(audience, page_size=settings.audience_page_size)
+    )
+
+    batch = []
+    async for phone in recipients:
+        batch.append(phone)
+        if len(batch) == batch_size:
+            await enqueue_campaign_messages(campaign_id, batch, batch_size=batch_size)
+            batch = []
+    if batch:
+        await enqueue_campaign_messages(campaign_id, batch, batch_size=batch_size)
+
+    snapshot = (
+        row["customer_phone"] async for row in
+        stream_campaign_messages(campaign_id, page_size=settings.audience_page_size)
+    )
+    bounds, recipients = await _plan_chunks(snapshot, settings.campaign_chunk_size)
+    if not recipients:
+        logger.warning(f"Campaign {campaign_id}: no recipients for audience '{audience}'")
+        await _close_campaign(campaign_id, "failed")
+        return {"campaign_id": campaign_id, "recipients": 0, "chunks": 0}
+
+    result = dispatch_campaign(campaign_id, content_sid, bounds, variables)
+    logger.info(f"Campaign {campaign_id} dispatched: {recipients} recipients in {len(bounds)} chunks, chord={result.id}")
+    return {"campaign_id": campaign_id, "recipients": recipients, "chunks": len(bounds), "chord_id": result.id}
+
+
+def dispatch_campaign(
+    campaign_id: str,
+    content_sid: str,
+    bounds: list[tuple[Optional[str], str]],
+    variables: dict = None,
+) -> AsyncResult:
+    """Send the campaign as a chord of chunks, one per `(after, through]` phone range.
+
+    Each chunk is an independent `send_campaign_chunk` task that reads its
+    own range of `campaign_messages` rows, so the campaign is spread over the
+    whole worker pool, task payloads stay small and a crash only replays one
+    chunk.
+    `finalize_campaign` runs once all chunks are done and writes the totals;
+    if a chunk fails for good, `fail_campaign` closes the campaign instead.
+    """
+    header = [
+        send_campaign_chunk.s(
+            campaign_id=campaign_id,
+            content_sid=content_sid,
+            after=after,
+            through=through,
+            variables=variables,
+        )
+        for after, through in bounds
+    ]
+    callback = finalize_campaign.s(campaign_id=campaign_id).on_error(fail_campaign.s(campaign_id=campaign_id))
+    return chord(header)(callback)
+
+
+@celery_app.task(
+    bind=True,
+    name="app.tasks.campaign_tasks.send_campaign_chunk",
+    autoretry_for=(Exception,),
+    max_retries=3,
+    retry_backoff=True,
+)
+def send_campaign_chunk(self, campaign_id: str, content_sid: str, after: Optional[str], through: str,
+                        variables: dict = None):
+    """Send a template message to one chunk (phone range) of a campaign.
+
+    Per-recipient state lives in `campaign_messages`: the rows enqueued by
+    `plan_campaign` are read back, claimed ('sending') before each send batch
+    and completed ('sent'/'failed' + Twilio SID) right after it. A retried or
+    redelivered chunk therefore resumes at the first queued row and never
+    resends. Twilio's answers for a batch are saved in Redis before it is
+    completed, so if completing fails the retry records them (SIDs included)
+    instead of marking the batch failed.
+    Completing a batch also adds its deltas to the campaign counters, so
+    progress is live and exact however many chunks run in parallel.
+    Returns the chunk's totals, including sends from earlier attempts.
+    """
+    return runtime.run(_send_chunk(campaign_id, content_sid, after, through, variables))
+
+
+async def _send_chunk(campaign_id: str, content_sid: str, after: Optional[str], through: str,
+                      variables: dict = None) -> dict:
+    settings = get_settings()
+    batch_size = settings.campaign_db_batch_size
+    rows = [
+        row async for row in
+        stream_campaign_messages(campaign_id, after=after, through=through, page_size=settings.audience_page_size)
+    ]
+
+    counts = {"delivered": 0, "failed": 0}
+    pending = []
+    interrupted = []
+    for row in rows:
+        if row["status"] == "queued":
+            pending.append(row)
+        elif row["status"] == "sending":
+            interrupted.append(row)
+        elif row["status"] == "failed":
+            counts["failed"] += 1
+        else:
+            counts["delivered"] += 1
+
+    if len(pending) < len(rows):
+        logger.info(f"Campaign {campaign_id}: resuming chunk, {len(rows) - len(pending)} recipients already handled")
+
+    # With delivery callbacks, 'delivered' is counted when Twilio reports it, not on acceptance
+    status_callback = settings.twilio_status_callback_url or None
+    redis = get_redis()
+    results_key = f"campaign:{campaign_id}:results"
+
+    # Claimed by an attempt that died mid-batch. If it got Twilio's answers, replay the
+    # saved outcomes (SIDs included); otherwise Twilio may have accepted them, so never resend
+    if interrupted:
+        saved = await redis.hmget(results_key, [row["id"] for row in interrupted])
+        updates = [
+            json.loads(outcome) if outcome else
+            {"id": row["id"], "status": "failed", "twilio_sid": None, "error_message": "interrupted before confirmation"}
+            for row, outcome in zip(interrupted, saved)
+        ]
+        await complete_campaign_messages(updates, count_accepted=status_callback is None)
+        await redis.hdel(results_key, *(update["id"] for update in updates))
+        replayed = sum(1 for outcome in saved if outcome)
+        if replayed:
+            logger.info(f"Campaign {campaign_id}: replayed {replayed} saved send outcomes")
+        for update in updates:
+            counts["delivered" if update["status"] == "sent" else "failed"] += 1
+
+    async def _send(phone: str) -> dict:
+        return await send_template_message(
+            to=phone, content_sid=content_sid, variables=variables, status_callback=status_callback,
+        )
+
+    rate_limiter = get_sender_rate_limiter()
+
+    for i in range(0, len(pending), batch_size):
+        claimed = await claim_campaign_messages([row["id"] for row in pending[i:i + batch_size]])
+        ids_by_phone = {row["customer_phone"]: row["id"] for row in claimed}
+
+        results = await send_bulk(
+            list(ids_by_phone),
+            _send,
+            rate_limiter=rate_limiter,
+            concurrency=settings.send_concurrency,
+        )
+
+        updates = []
+        for result in results:
+            if result.success:
+                counts["delivered"] += 1
             else:
-                sent += 1
-                failed += 1
-                logger.warning(f"Campaign {campaign_id}: failed to send to {phone}: {result.get('error')}")
-
-        except Exception as e:
-            sent += 1
-            failed += 1
-            logger.error(f"Campaign {campaign_id}: error sending to {phone}: {e}")
-
-        # Update progress every 10 messages
-        if (i + 1) % 10 == 0 or (i + 1) == total:
-            _run_async(update_campaign(campaign_id, {
-                "sent_count": sent,
-                "delivered_count": delivered,
-            }))
-            self.update_state(
-                state="PROGRESS",
-                meta={"sent": sent, "delivered": delivered, "failed": failed, "total": total},
-            )
-
-        # Rate limiting: 1 message per second
-        time.sleep(1)
-
-    # Final update
-    final_status = "completed" if failed == 0 else "completed_with_errors"
-    _run_async(update_campaign(campaign_id, {
-        "status": final_status,
-        "sent_count": sent,
-        "delivered_count": delivered,
-    }))
+                counts["failed"] += 1
+                logger.warning(f"Campaign {campaign_id}: failed to send to {result.phone}: {result.error}")
+            updates.append({
+                "id": ids_by_phone[result.phone],
+                "status": "sent" if result.success else "failed",
+                "twilio_sid": result.message_sid,
+                "error_message": result.error,
+            })
+        # Saved before completing: if the RPC fails, the retry replays them instead of losing the SIDs
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(results_key, mapping={update["id"]: json.dumps(update) for update in updates})
+            pipe.expire(results_key, CAMPAIGN_STATE_TTL)
+            await pipe.execute()
+        await complete_campaign_messages(updates, count_accepted=status_callback is None)
+        await redis.hdel(results_key, *(update["id"] for update in updates))
+
+    delivered, failed = counts["delivered"], counts["failed"]
+    return {"sent": delivered + failed, "delivered": delivered, "failed": failed, "total": len(rows)}
+
+
+@celery_app.task(bind=True, name="app.tasks.campaign_tasks.finalize_campaign")
+def finalize_campaign(self, chunk_results: list[dict], campaign_id: str):
+    """Chord callback: aggregate chunk totals and close the campaign.
+
+    Counters are already up to date (incremented batch by batch); only the
+    final status is written, once, guarded by a Redis flag.
+    """
+    return runtime.run(_finalize_campaign(campaign_id, chunk_results))
 
-    logger.info(f"Campaign {campaign_id}: completed. Sent={sent}, Delivered={delivered}, Failed={failed}")
 
-    return {
+async def _finalize_campaign(campaign_id: str, chunk_results: list[dict]) -> dict:
+    sent = sum(r["sent"] for r in chunk_results)
+    delivered = sum(r["delivered"] for r in chunk_results)
+    failed = sum(r["failed"] for r in chunk_results)
+    total = sum(r["total"] for r in chunk_results)
+    final_status = "completed" if failed == 0 else "completed_with_errors"
+
+    summary = {
         "campaign_id": campaign_id,
         "status": final_status,
         "sent": sent,
@@ -84,3 +286,46 @@ def send_campaign_bulk(self, campaign_id: str, content_sid: str, phones: list[st
         "failed": failed,
         "total": total,
     }
+
+    if await _close_campaign(campaign_id, final_status):
+        logger.info(f"Campaign {campaign_id}: completed. Sent={sent}, Delivered={delivered}, Failed={failed}")
+    return summary
+
+
+async def _close_campaign(campaign_id: str, status: str) -> bool:
+    """Write the final status once (chord callback or errback); False if already closed."""
+    redis = get_redis()
+    flag = f"campaign:{campaign_id}:finalized"
+    if not await redis.set(flag, 1, nx=True, ex=CAMPAIGN_STATE_TTL):
+        logger.info(f"Campaign {campaign_id}: already finalized, skipping")
+        return False
+
+    try:
+        await update_campaign(campaign_id, {
+            "status": status,
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+        })
+    except Exception:
+        await redis.delete(flag)
+        raise
+    return True
+
+
+@celery_app.task(name="app.tasks.campaign_tasks.fail_campaign")
+def fail_campaign(request, exc, traceback, campaign_id: str):
+    """Chord errback: a chunk exhausted its retries, so `finalize_campaign` will never run.
+
+    The counters already hold what was sent; the campaign is closed as
+    'partial' if anything went out, 'failed' otherwise.
+    """
+    logger.error(f"Campaign {campaign_id}: chunk {request.id} failed for good: {exc}")
+    return runtime.run(_fail_campaign(campaign_id))
+
+
+async def _fail_campaign(campaign_id: str) -> dict:
+    campaign = await get_campaign(campaign_id) or {}
+    counts = {key: campaign.get(f"{key}_count") or 0 for key in ("sent", "delivered", "failed")}
+    status = "partial" if counts["sent"] else "failed"
+    if await _close_campaign(campaign_id, status):
+        logger.warning(f"Campaign {campaign_id}: closed as {status}. Sent={counts['sent']}, Failed={counts['failed']}")
+    return {"campaign_id": campaign_id, "status": status, **counts}
@@ -1,5 +1,6 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
 import os
 
 redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
@@ -22,9 +23,10 @@ celery_app.conf.update(
     enable_utc=True,
     task_track_started=True,
     task_acks_late=True,
+    # Redeliver a campaign chunk if its worker dies mid-send
+    task_reject_on_worker_lost=True,
     worker_prefetch_multiplier=1,
-    # Rate limiting for Twilio (1 message per second)
-    task_default_rate_limit="1/s",
+    # Twilio pacing is done by the shared token bucket (app.services.rate_limiter)
 )
 
 # Celery Beat schedule for automations
@@ -33,8 +35,24 @@ celery_app.conf.beat_schedule = {
         "task": "app.tasks.automation_tasks.check_automations",
         "schedule": crontab(minute="*/5"),
     },
-    "check-template-approvals-hourly": {
+    # Each pending template is polled with its own exponential backoff
+    "check-template-approvals-every-5-minutes": {
         "task": "app.tasks.automation_tasks.check_template_approvals",
-        "schedule": crontab(minute=0),
+        "schedule": crontab(minute="*/5"),
     },
 }
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    # Imported here: app.services loads settings, which the beat/CLI entry points may not need
+    from app.services.template_cache import start_template_cache_listener
+    from app.tasks.runtime import start_worker_loop
+    start_worker_loop()
+    start_template_cache_listener()
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_process(**kwargs):
+    from app.tasks.runtime import stop_worker_loop
+    stop_worker_loop()
@@ -0,0 +1,87 @@
+from typing import Any, Coroutine, Optional
+import asyncio
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerLoop:
+    """One long-lived event loop per Celery worker process, run in a daemon thread.
+
+    Sync tasks submit their coroutines to it with `run()`, so the pooled
+    clients bound to the loop (PostgREST, Twilio, Redis) keep their
+    connections from one call and one task to the next. The loop is started
+    on `worker_process_init`, or lazily on first use (eager tasks, scripts),
+    and recreated in a forked child that inherited a parent's loop.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if not self.running:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="worker-loop", daemon=True)
+                thread.start()
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+            return self._loop
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run `coro` on the worker loop and wait for its result from the calling thread."""
+        loop = self._loop if self.running else self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Timeout, soft time limit or worker shutdown: don't leave the coroutine running
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 10.0):
+        """Close the loop's clients, then the loop itself (worker process shutdown)."""
+        if not self.running:
+            return
+        from app.services.redis_service import close_redis
+        from app.services.supabase_service import close_postgrest
+        from app.services.twilio_service import close_twilio_http
+
+        async def _close_clients():
+            await asyncio.gather(close_postgrest(), close_twilio_http(), close_redis(), return_exceptions=True)
+
+        loop, thread = self._loop, self._thread
+        try:
+            asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Worker loop: clients not closed cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        self._loop = self._thread = self._pid = None
+
+
+_worker_loop = WorkerLoop()
+
+
+def start_worker_loop():
+    """Start this process's event loop (Celery `worker_process_init`)."""
+    _worker_loop.start()
+
+
+def stop_worker_loop():
+    """Close the pooled clients and stop the loop (Celery `worker_process_shutdown`)."""
+    _worker_loop.stop()
+
+
+def run(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine from a sync Celery task on the process's persistent loop."""
+    return _worker_loop.run(coro, timeout)
@@ -0,0 +1,99 @@
+"""Benchmark the bulk-send engine against a local fake Twilio server.
+
+Usage (from backend/):
+    python -m benchmarks.bench_bulk_send --messages 200 --rates 5,10,20,40
+    python -m benchmarks.bench_bulk_send --redis-url redis://localhost:6379/1
+
+Needs a Redis server: the limiter is the production `RedisTokenBucket`, on a
+throwaway key per run.
+
+The fake server answers the Messages endpoint after `--latency-ms`, so the
+old sleep loop would be latency + 1s per message; the engine should track the
+configured token-bucket rate instead. Sends go through the real
+`send_template_message` transport, pointed at the fake server.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def start_fake_twilio(latency_ms: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency_ms / 1000)
+            body = json.dumps({"sid": f"SM{uuid.uuid4().hex}", "status": "queued"}).encode()
+            self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(rate: float, args) -> float:
+    from app.services.bulk_sender import send_bulk
+    from app.services.rate_limiter import RedisTokenBucket
+    from app.services.twilio_service import send_template_message, close_twilio_http
+    import redis.asyncio as aioredis
+
+    redis = aioredis.from_url(args.redis_url)
+    limiter = RedisTokenBucket(redis, key=f"bench:{uuid.uuid4().hex}", rate=rate, burst=args.burst)
+
+    async def _send(phone: str) -> dict:
+        return await send_template_message(to=phone, content_sid="HXbench", variables={"1": "Bench"})
+
+    phones = [f"+22501{i:08d}" for i in range(args.messages)]
+    start = time.perf_counter()
+    results = await send_bulk(phones, _send, rate_limiter=limiter, concurrency=args.concurrency)
+    elapsed = time.perf_counter() - start
+    await close_twilio_http()
+    await redis.aclose()
+
+    assert all(r.success for r in results)
+    return len(results) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rates", default="5,10,20,40,80")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=int, default=150)
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    args = parser.parse_args()
+
+    server = start_fake_twilio(args.latency_ms)
+    os.environ["TWILIO_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}"
+    for name in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "OPENROUTER_API_KEY",
+                 "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        os.environ.setdefault(name, "bench")
+    legacy = 1 / (1 + args.latency_ms / 1000)
+
+    print(f"{args.messages} messages, latency={args.latency_ms}ms, concurrency={args.concurrency}")
+    print(f"legacy sleep loop: {legacy:6.2f} msg/s")
+    for rate in (float(r) for r in args.rates.split(",")):
+        throughput = asyncio.run(run(rate, args))
+        print(f"rate={rate:6.1f}/s -> {throughput:6.2f} msg/s")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
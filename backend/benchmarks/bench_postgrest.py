@@ -0,0 +1,91 @@
+"""Load test the async data layer against a stub PostgREST server.
+
+Usage (from backend/):
+    python -m benchmarks.bench_postgrest --requests 400 --concurrency 1,10,50
+
+Compares `get_conversation` on the pooled httpx.AsyncClient with the previous
+implementation (synchronous supabase-py `.execute()` inside `async def`),
+which serializes every call on the event loop.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def start_stub_postgrest(latency_ms: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            body = json.dumps([{"id": str(uuid.uuid4()), "shop_id": str(uuid.uuid4()), "status": "active"}]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _gather_bounded(call, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one():
+        async with semaphore:
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--latency-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    server = start_stub_postgrest(args.latency_ms)
+    os.environ.setdefault("SUPABASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.service.role")
+    for name in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        os.environ.setdefault(name, "bench")
+
+    from app.services.supabase_service import get_conversation, get_supabase, close_postgrest
+
+    async def legacy_get_conversation():
+        get_supabase().table("conversations").select("*").eq("id", "bench").execute()
+
+    async def pooled_get_conversation():
+        await get_conversation("bench")
+
+    async def run(concurrency: int):
+        legacy = await _gather_bounded(legacy_get_conversation, args.requests, concurrency)
+        pooled = await _gather_bounded(pooled_get_conversation, args.requests, concurrency)
+        await close_postgrest()
+        return legacy, pooled
+
+    print(f"{args.requests} get_conversation calls, stub latency={args.latency_ms}ms")
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        legacy, pooled = asyncio.run(run(concurrency))
+        print(f"concurrency={concurrency:3d}  sync client: {legacy:7.1f} req/s  async pool: {pooled:7.1f} req/s")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Micro-benchmark the per-request RAG setup cost.
+
+Usage (from backend/):
+    python -m benchmarks.bench_rag_setup --iterations 200
+
+Compares rebuilding the embeddings, LLM, vector store, prompt and chain on
+every message (previous behavior) with reusing the process-wide RagRuntime
+(which no longer needs a vector store: retrieval goes through `retrieve()`).
+No network calls are made: only object construction is measured.
+"""
+import argparse
+import os
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.service.role")
+    for name in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        os.environ.setdefault(name, "bench")
+
+    from langchain_community.vectorstores import SupabaseVectorStore
+    from app.config import get_settings
+    from app.services.rag import _get_embeddings, _get_llm, _get_prompt, get_rag_runtime
+    from app.services.supabase_service import get_supabase
+
+    def legacy_setup():
+        # The per-message LangChain retriever the RAG used to build
+        vector_store = SupabaseVectorStore(
+            client=get_supabase(), embedding=_get_embeddings(), table_name="knowledge_base", query_name="match_documents",
+        )
+        vector_store.as_retriever(search_kwargs={"k": get_settings().rag_top_k})
+        _get_prompt() | _get_llm()
+
+    def cached_setup():
+        runtime = get_rag_runtime()
+        return runtime.embeddings, runtime.chain
+
+    for name, setup in (("rebuild per request", legacy_setup), ("cached runtime", cached_setup)):
+        setup()
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            setup()
+        per_call_us = (time.perf_counter() - start) / args.iterations * 1e6
+        print(f"{name:20s} {per_call_us:10.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compare local vector index retrieval with the match_documents RPC path.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_index --rows 300 --queries 200
+    python -m benchmarks.bench_vector_index --live   # RPC against SUPABASE_URL from .env
+
+Without --live, the RPC path runs SupabaseVectorStore against a stub PostgREST
+server answering after --latency-ms (a typical app-to-Supabase round trip),
+so it measures client overhead + network wait. The local path searches a
+synthetic corpus of --rows 1536-d embeddings.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import numpy as np
+
+DIMENSIONS = 1536
+
+
+def start_stub_postgrest(latency_ms: int, k: int) -> ThreadingHTTPServer:
+    body = json.dumps([
+        {"id": str(uuid.uuid4()), "content": "Bobotcho fonctionne sans électricité.", "metadata": {}, "similarity": 0.2}
+        for _ in range(k)
+    ]).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _report(name: str, samples: list[float]):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:18s} p50={statistics.median(samples):8.3f}ms  p95={p95:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--latency-ms", type=int, default=40)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    if not args.live:
+        server = start_stub_postgrest(args.latency_ms, args.k)
+        os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.service.role")
+        for name in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+            os.environ.setdefault(name, "bench")
+
+    from langchain_community.vectorstores import SupabaseVectorStore
+    from app.services.supabase_service import get_supabase
+    from app.services.vector_index import LocalVectorIndex
+
+    rng = np.random.default_rng(0)
+    corpus = rng.standard_normal((args.rows, DIMENSIONS), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, DIMENSIONS), dtype=np.float32)
+
+    index = LocalVectorIndex(max_rows=args.rows)
+    index._rebuild({
+        str(i): {
+            "content": f"chunk {i}",
+            "metadata": {"category": "livraison" if i % 2 else "produit"},
+            "embedding": corpus[i],
+            "updated_at": "2026-01-01T00:00:00",
+        }
+        for i in range(args.rows)
+    })
+
+    local = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k=args.k)
+        local.append((time.perf_counter() - start) * 1000)
+
+    local_filtered = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k=args.k, filter={"category": "livraison"})
+        local_filtered.append((time.perf_counter() - start) * 1000)
+
+    store = SupabaseVectorStore(
+        client=get_supabase(), embedding=None, table_name="knowledge_base", query_name="match_documents",
+    )
+    rpc = []
+    for query in queries[: min(args.queries, 100)]:
+        start = time.perf_counter()
+        store.similarity_search_by_vector(query.tolist(), k=args.k)
+        rpc.append((time.perf_counter() - start) * 1000)
+
+    print(f"corpus={args.rows} rows x {DIMENSIONS}d, k={args.k}" + ("" if args.live else f", stub latency={args.latency_ms}ms"))
+    _report("local index", local)
+    _report("local + filter", local_filtered)
+    _report("match_documents", rpc)
+
+
+if __name__ == "__main__":
+    main()
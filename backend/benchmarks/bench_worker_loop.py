@@ -0,0 +1,100 @@
+"""Per-message overhead of a new event loop per call vs the persistent worker loop.
+
+Usage (from backend/):
+    python -m benchmarks.bench_worker_loop --messages 500
+    python -m benchmarks.bench_worker_loop --messages 500 --latency-ms 20
+
+Celery tasks used to wrap every coroutine in `asyncio.new_event_loop()` /
+`loop.close()`, so each call also built a new pooled client and opened a new
+connection. Both modes below make the same sync-side call per message, the
+way a task does: `noop` isolates the loop setup, `send` goes through the real
+`send_template_message` transport against a local fake Twilio server.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def start_fake_twilio(latency_ms: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency_ms / 1000)
+            body = json.dumps({"sid": f"SM{uuid.uuid4().hex}", "status": "queued"}).encode()
+            self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_new_loop(coro):
+    """The former per-call `_run_async` of the Celery tasks."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def measure(run, make_coro, messages: int) -> float:
+    """Mean wall time per call, in milliseconds."""
+    run(make_coro())  # Warm-up (imports, first connection of the persistent loop)
+    start = time.perf_counter()
+    for _ in range(messages):
+        run(make_coro())
+    return (time.perf_counter() - start) / messages * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_fake_twilio(args.latency_ms)
+    os.environ["TWILIO_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}"
+    for name in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "OPENROUTER_API_KEY",
+                 "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        os.environ.setdefault(name, "bench")
+
+    from app.services.twilio_service import send_template_message
+    from app.tasks import runtime
+
+    async def _noop():
+        await asyncio.sleep(0)
+
+    async def _send():
+        result = await send_template_message(to="+2250100000000", content_sid="HXbench", variables={"1": "Bench"})
+        assert result["success"], result
+
+    print(f"{args.messages} calls per mode, fake Twilio latency={args.latency_ms}ms")
+    for mode, make_coro in (("noop", _noop), ("send", _send)):
+        before = measure(run_new_loop, make_coro, args.messages)
+        after = measure(runtime.run, make_coro, args.messages)
+        print(f"{mode:5s} new loop per call: {before:7.3f} ms/msg   "
+              f"persistent loop: {after:7.3f} ms/msg   overhead saved: {before - after:7.3f} ms/msg "
+              f"(x{before / after:.1f})")
+
+    runtime.stop_worker_loop()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
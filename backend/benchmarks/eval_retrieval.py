@@ -0,0 +1,118 @@
+"""Offline evaluation of the retrieval stage: recall@k and prompt size.
+
+Usage (from backend/):
+    python -m benchmarks.eval_retrieval
+    python -m benchmarks.eval_retrieval --embeddings openai   # real embeddings (OPENAI_API_KEY)
+    python -m benchmarks.eval_retrieval --fixture path/to/fixture.json
+
+The fixture holds a small knowledge base and questions labelled with the ids
+of the chunks that answer them (benchmarks/fixtures/retrieval_eval.json).
+Chunks are loaded into a LocalVectorIndex and each configuration is scored:
+
+- baseline: top rag_top_k by cosine similarity (previous behavior)
+- vector:   cosine + similarity cutoff, dedupe and dynamic trimming
+- hybrid:   vector + keyword + priority scoring, then dedupe and trimming
+
+The default "hashed" embeddings (character n-grams) need no network; they
+rank lexically, so use --embeddings openai for representative numbers.
+"""
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+DIMENSIONS = 1536
+DEFAULT_FIXTURE = Path(__file__).parent / "fixtures" / "retrieval_eval.json"
+_NON_WORD = re.compile(r"\W+")
+
+
+def hashed_embedding(text: str) -> list[float]:
+    """Deterministic bag of character 3-5-grams, hashed into DIMENSIONS buckets."""
+    text = " " + _NON_WORD.sub(" ", text.lower()).strip() + " "
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for size in (3, 4, 5):
+        for i in range(len(text) - size + 1):
+            bucket = int.from_bytes(hashlib.blake2b(text[i:i + size].encode(), digest_size=4).digest(), "little")
+            vector[bucket % DIMENSIONS] += 1.0
+    return vector.tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE)
+    parser.add_argument("--embeddings", choices=("hashed", "openai"), default="hashed")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.service.role")
+    for name in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        os.environ.setdefault(name, "bench")
+
+    from app.config import get_settings
+    from app.services.rag import SYSTEM_PROMPT
+    from app.services.retrieval import RetrievedChunk, rank_rows, select_chunks
+    from app.services.tokens import count_tokens
+    from app.services.vector_index import LocalVectorIndex
+
+    fixture = json.loads(args.fixture.read_text(encoding="utf-8"))
+    kb, questions = fixture["knowledge_base"], fixture["questions"]
+
+    if args.embeddings == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        model = OpenAIEmbeddings(model=get_settings().embedding_model, openai_api_key=get_settings().openai_api_key)
+        kb_vectors = model.embed_documents([f"{row['title']}\n{row['content']}" for row in kb])
+        question_vectors = model.embed_documents([q["question"] for q in questions])
+    else:
+        kb_vectors = [hashed_embedding(f"{row['title']}\n{row['content']}") for row in kb]
+        question_vectors = [hashed_embedding(q["question"]) for q in questions]
+
+    index = LocalVectorIndex(max_rows=len(kb))
+    index._rebuild({
+        row["id"]: {**row, "embedding": vector, "updated_at": "2026-01-01T00:00:00"}
+        for row, vector in zip(kb, kb_vectors)
+    })
+
+    base = get_settings()
+    # The hashed embeddings have a different similarity scale from OpenAI's
+    threshold = base.rag_similarity_threshold if args.embeddings == "openai" else 0.0
+
+    def baseline(rows, question):
+        return [RetrievedChunk(content=row["content"], metadata={}, id=row["id"]) for row in rows[:base.rag_top_k]]
+
+    def pipeline(hybrid: bool):
+        settings = base.model_copy(update={"rag_hybrid_search_enabled": hybrid, "rag_similarity_threshold": threshold})
+
+        def run(rows, question):
+            return select_chunks(rank_rows(rows, question, settings), settings)
+        return run
+
+    configs = {"baseline": baseline, "vector": pipeline(False), "hybrid": pipeline(True)}
+
+    print(f"{len(kb)} chunks, {len(questions)} questions, embeddings={args.embeddings}, rag_top_k={base.rag_top_k}")
+    print(f"{'config':10s} {'recall@k':>9s} {'hit rate':>9s} {'chunks':>7s} {'ctx tok':>8s} {'prompt tok':>11s}")
+    for name, select in configs.items():
+        recalls, hits, chunk_counts, context_tokens, prompt_tokens = [], [], [], [], []
+        for q, vector in zip(questions, question_vectors):
+            rows = index.search_rows(vector, k=base.rag_candidate_count)
+            chunks = select(rows, q["question"])
+            found = {chunk.id for chunk in chunks} & set(q["expected"])
+            context = "\n\n".join(chunk.content for chunk in chunks)
+
+            recalls.append(len(found) / len(q["expected"]))
+            hits.append(bool(found))
+            chunk_counts.append(len(chunks))
+            context_tokens.append(count_tokens(context))
+            prompt_tokens.append(count_tokens(SYSTEM_PROMPT.format(context=context, chat_history="")) + count_tokens(q["question"]))
+
+        print(
+            f"{name:10s} {np.mean(recalls):9.2f} {np.mean(hits):9.2f} {np.mean(chunk_counts):7.1f} "
+            f"{np.mean(context_tokens):8.0f} {np.mean(prompt_tokens):11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Replay a synthetic Twilio status-callback storm against the callback endpoint.
+
+Usage (from backend/):
+    python -m benchmarks.load_status_callbacks --messages 5000 --concurrency 200
+    python -m benchmarks.load_status_callbacks --redis-url redis://localhost:6379/0 --db-latency-ms 20
+    python -m benchmarks.load_status_callbacks --url https://api.example.com/api/twilio/status-callback --auth-token ...
+
+Each message gets sent/delivered/read callbacks (a `--failure-rate` share gets
+sent/undelivered instead), shuffled so that many arrive out of order, and a
+`--duplicates` share is posted twice as Twilio retries do. All requests are
+signed like Twilio's.
+
+Without --url, the callback router and the stream consumer run in-process
+(uvicorn on a local port, Redis from --redis-url), and
+`apply_message_statuses` is replaced by an in-memory campaign_messages table
+applying the same forward-only rule: the run then also reports the write
+batches and checks the final statuses and counters.
+"""
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+
+def build_storm(messages: int, failure_rate: float, duplicates: float, seed: int):
+    """Shuffled (sid, status) callbacks and the final status expected for each message."""
+    rng = random.Random(seed)
+    events, expected = [], {}
+    for i in range(messages):
+        sid = f"SM{i:032x}"
+        if rng.random() < failure_rate:
+            statuses, expected[sid] = ["sent", "undelivered"], "failed"
+        else:
+            statuses, expected[sid] = ["sent", "delivered", "read"], "read"
+        events.extend((sid, status) for status in statuses)
+    events.extend(rng.sample(events, int(len(events) * duplicates)))
+    rng.shuffle(events)
+    return events, expected
+
+
+class InMemoryMessages:
+    """Stand-in for campaign_messages + campaigns counters, with the RPC's forward-only rule."""
+
+    def __init__(self, sids, latency_ms: int):
+        from app.services.status_callbacks import advances
+
+        self._advances = advances
+        self.latency_ms = latency_ms
+        self.status = {sid: "sent" for sid in sids}  # As left by complete_campaign_messages
+        self.counters = {"delivered": 0, "read": 0, "failed": 0}
+        self.batch_sizes: list[int] = []
+
+    async def apply(self, updates: list[dict]) -> set[str]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        self.batch_sizes.append(len(updates))
+        for update in updates:
+            current, new = self.status[update["twilio_sid"]], update["status"]
+            if not self._advances(current, new):
+                continue
+            if new in ("delivered", "read") and current not in ("delivered", "read"):
+                self.counters["delivered"] += 1
+            if new in ("read", "failed"):
+                self.counters[new] += 1
+            self.status[update["twilio_sid"]] = new
+        return {update["twilio_sid"] for update in updates}
+
+
+def start_local_server(port: int, messages: InMemoryMessages):
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    import uvicorn
+    from app.config import get_settings
+    from app.routers import twilio_callbacks
+    from app.services import status_callbacks
+
+    status_callbacks.apply_message_statuses = messages.apply
+    settings = get_settings()
+    consumer = status_callbacks.StatusCallbackConsumer(
+        batch_size=settings.status_batch_size,
+        stale_seconds=settings.status_stale_seconds,
+        unmatched_ttl_seconds=settings.status_unmatched_ttl_seconds,
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        consumer.start()
+        yield
+        await consumer.stop()
+        await status_callbacks.get_redis().delete(status_callbacks.STREAM_KEY)
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(twilio_callbacks.router, prefix="/api")
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, consumer
+
+
+async def replay(url: str, auth_token: str, events, concurrency: int) -> tuple[float, list[float], int]:
+    import httpx
+    from twilio.request_validator import RequestValidator
+
+    validator = RequestValidator(auth_token)
+
+    latencies: list[float] = []
+    errors = 0
+    queue = iter(events)
+
+    async def _worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for sid, status in queue:
+            params = [("AccountSid", "ACbench"), ("MessageSid", sid), ("MessageStatus", status)]
+            if status == "undelivered":
+                params.append(("ErrorCode", "63016"))
+            headers = {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "X-Twilio-Signature": validator.compute_signature(url, dict(params)),
+            }
+            start = time.perf_counter()
+            response = await client.post(url, content=urlencode(params), headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 300:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--duplicates", type=float, default=0.05)
+    parser.add_argument("--db-latency-ms", type=int, default=20)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--url", default=None, help="Deployed endpoint; only the HTTP side is measured")
+    parser.add_argument("--auth-token", default="bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    events, expected = build_storm(args.messages, args.failure_rate, args.duplicates, args.seed)
+
+    url, server = args.url, None
+    if url is None:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}/api/twilio/status-callback"
+        os.environ["REDIS_URL"] = args.redis_url
+        os.environ["TWILIO_AUTH_TOKEN"] = args.auth_token
+        os.environ["TWILIO_STATUS_CALLBACK_URL"] = url
+        for name in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "OPENROUTER_API_KEY",
+                     "OPENAI_API_KEY", "TWILIO_ACCOUNT_SID"):
+            os.environ.setdefault(name, "bench")
+        from app.services import status_callbacks
+
+        status_callbacks.STREAM_KEY = f"bench:status:{uuid.uuid4().hex}"
+        messages = InMemoryMessages(expected, args.db_latency_ms)
+        server, thread, consumer = start_local_server(port, messages)
+
+    print(f"{len(events)} callbacks for {args.messages} messages, concurrency={args.concurrency}")
+    elapsed, latencies, errors = asyncio.run(replay(url, args.auth_token, events, args.concurrency))
+    latencies.sort()
+    print(f"endpoint: {len(events) / elapsed:8.0f} req/s, errors={errors}")
+    print(f"latency:  p50={statistics.median(latencies) * 1000:.1f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+
+    if server is None:
+        return
+
+    start = time.perf_counter()
+    while messages.status != expected and time.perf_counter() - start < args.drain_timeout:
+        time.sleep(0.05)
+    drained = time.perf_counter() - start
+    server.should_exit = True
+    thread.join()
+
+    writes = sum(messages.batch_sizes)
+    print(f"applied:  {len(messages.batch_sizes)} RPC calls for {len(events)} callbacks "
+          f"({writes} coalesced updates, {len(events) / max(1, len(messages.batch_sizes)):.0f} callbacks/call), "
+          f"drained {drained:.2f}s after the storm")
+    delivered = sum(1 for status in expected.values() if status == "read")
+    correct = (
+        messages.status == expected
+        and messages.counters == {"delivered": delivered, "read": delivered, "failed": args.messages - delivered}
+    )
+    print(f"counters: {messages.counters} -> {'OK' if correct else 'MISMATCH'}")
+    print(f"consumer: {consumer.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+-- Migration: Resumable, idempotent campaign sends
+-- One campaign_messages row per (campaign, recipient), written in batches by the backend
+
+-- 1. One row per recipient and campaign
+CREATE UNIQUE INDEX IF NOT EXISTS idx_campaign_messages_campaign_phone
+ON public.campaign_messages (campaign_id, customer_phone);
+
+CREATE INDEX IF NOT EXISTS idx_campaign_messages_campaign_status
+ON public.campaign_messages (campaign_id, status);
+
+-- 2. Enqueue a batch of recipients, return the state of every row of the batch
+-- (use_column: the OUT columns id/customer_phone/status would otherwise make the
+-- ON CONFLICT target and the column references ambiguous)
+CREATE OR REPLACE FUNCTION public.enqueue_campaign_messages(
+    p_campaign_id UUID,
+    p_phones TEXT[]
+)
+RETURNS TABLE (
+    id UUID,
+    customer_phone TEXT,
+    status TEXT
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    INSERT INTO public.campaign_messages (campaign_id, customer_phone, status)
+    SELECT p_campaign_id, phone, 'queued'
+    FROM unnest(p_phones) AS phone
+    ON CONFLICT (campaign_id, customer_phone) DO NOTHING;
+
+    RETURN QUERY
+    SELECT cm.id, cm.customer_phone, cm.status
+    FROM public.campaign_messages cm
+    WHERE cm.campaign_id = p_campaign_id
+      AND cm.customer_phone = ANY(p_phones)
+    ORDER BY cm.created_at, cm.customer_phone;
+END;
+$$;
+
+-- 3. Claim queued rows before sending (at-most-once: a claimed row is never sent twice)
+CREATE OR REPLACE FUNCTION public.claim_campaign_messages(
+    p_ids UUID[]
+)
+RETURNS TABLE (
+    id UUID,
+    customer_phone TEXT
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    UPDATE public.campaign_messages cm
+    SET status = 'sending'
+    WHERE cm.id = ANY(p_ids)
+      AND cm.status = 'queued'
+    RETURNING cm.id, cm.customer_phone;
+END;
+$$;
+
+-- 4. Record the outcome of a batch of sends
+-- p_results: [{"id": uuid, "status": "sent"|"failed", "twilio_sid": text, "error_message": text}]
+CREATE OR REPLACE FUNCTION public.complete_campaign_messages(
+    p_results JSONB
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    UPDATE public.campaign_messages cm
+    SET status = r.status,
+        twilio_sid = r.twilio_sid,
+        error_message = r.error_message,
+        sent_at = CASE WHEN r.status = 'sent' THEN now() ELSE cm.sent_at END
+    FROM jsonb_to_recordset(p_results) AS r(id UUID, status TEXT, twilio_sid TEXT, error_message TEXT)
+    WHERE cm.id = r.id;
+
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated;
+END;
+$$;
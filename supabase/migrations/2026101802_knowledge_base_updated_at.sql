@@ -0,0 +1,21 @@
+-- Migration: Keep knowledge_base.updated_at current
+-- The backend uses (row count, max(updated_at)) to detect knowledge base changes
+
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_trigger
+    WHERE tgname = 'set_knowledge_base_updated_at'
+      AND tgrelid = 'public.knowledge_base'::regclass
+  ) THEN
+    DROP TRIGGER set_knowledge_base_updated_at ON public.knowledge_base;
+  END IF;
+END $$;
+
+CREATE TRIGGER set_knowledge_base_updated_at
+BEFORE UPDATE ON public.knowledge_base
+FOR EACH ROW
+EXECUTE FUNCTION public.handle_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_updated_at
+ON public.knowledge_base (updated_at);
@@ -0,0 +1,107 @@
+-- Migration : recherche hybride sur knowledge_base
+-- Combine similarité vectorielle, score plein texte / trigrammes et priorité,
+-- avec un seuil de similarité, pour n'envoyer au LLM que les extraits pertinents.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 1. Vecteur plein texte (titre pondéré plus fort que le contenu)
+ALTER TABLE public.knowledge_base
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('french', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('french', coalesce(content, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_search_vector
+ON public.knowledge_base USING GIN (search_vector);
+
+-- Trigrammes : tolère les fautes de frappe ("livrason", "instalation")
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_content_trgm
+ON public.knowledge_base USING GIN (content gin_trgm_ops);
+
+-- 2. Fonction de recherche hybride
+-- Candidats = top vectoriel (index HNSW) ∪ correspondances mots-clés (index GIN),
+-- puis score = similarité * (1 - keyword_weight - priority_weight)
+--            + mots-clés * keyword_weight + priorité/10 * priority_weight
+CREATE OR REPLACE FUNCTION public.hybrid_search(
+    query_embedding vector(1536),
+    query_text text,
+    match_count int DEFAULT 12,
+    match_threshold float DEFAULT 0.3,
+    keyword_weight float DEFAULT 0.3,
+    priority_weight float DEFAULT 0.1,
+    filter jsonb DEFAULT '{}'::jsonb
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    content TEXT,
+    category TEXT,
+    priority INTEGER,
+    metadata JSONB,
+    similarity float,
+    keyword_score float,
+    score float
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('french', query_text) AS tsq
+    ),
+    vector_candidates AS (
+        SELECT kb.id
+        FROM public.knowledge_base kb
+        WHERE kb.embedding IS NOT NULL
+          AND (filter = '{}'::jsonb OR kb.metadata @> filter)
+        ORDER BY kb.embedding <=> query_embedding
+        LIMIT match_count * 2
+    ),
+    keyword_candidates AS (
+        SELECT kb.id
+        FROM public.knowledge_base kb, q
+        WHERE kb.embedding IS NOT NULL
+          AND (filter = '{}'::jsonb OR kb.metadata @> filter)
+          AND (kb.search_vector @@ q.tsq OR query_text <% kb.content)
+        ORDER BY ts_rank_cd(kb.search_vector, q.tsq, 32) DESC
+        LIMIT match_count * 2
+    ),
+    scored AS (
+        SELECT
+            kb.id,
+            kb.title,
+            kb.content,
+            kb.category,
+            kb.priority,
+            kb.metadata,
+            (1 - (kb.embedding <=> query_embedding))::float AS similarity,
+            greatest(
+                ts_rank_cd(kb.search_vector, q.tsq, 32),
+                word_similarity(query_text, kb.content)
+            )::float AS keyword_score
+        FROM public.knowledge_base kb, q
+        WHERE kb.id IN (
+            SELECT vc.id FROM vector_candidates vc
+            UNION
+            SELECT kc.id FROM keyword_candidates kc
+        )
+    )
+    SELECT
+        s.id,
+        s.title,
+        s.content,
+        s.category,
+        s.priority,
+        s.metadata,
+        s.similarity,
+        s.keyword_score,
+        (
+            (1 - keyword_weight - priority_weight) * s.similarity
+            + keyword_weight * s.keyword_score
+            + priority_weight * coalesce(s.priority, 5)::float / 10
+        )::float AS score
+    FROM scored s
+    WHERE s.similarity >= match_threshold
+    ORDER BY score DESC
+    LIMIT match_count;
+$$;
@@ -0,0 +1,7 @@
+-- Migration : réponses IA en streaming, activables par conversation
+-- NULL = valeur par défaut du backend (AI_STREAMING_ENABLED),
+-- true = la première phrase part dès qu'elle est générée, le reste suit dans un second message,
+-- false = une seule réponse WhatsApp.
+
+ALTER TABLE public.conversations
+ADD COLUMN IF NOT EXISTS ai_streaming BOOLEAN;
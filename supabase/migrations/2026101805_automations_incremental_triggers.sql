@@ -0,0 +1,70 @@
+-- Migration : déclenchement incrémental des automations
+-- Chaque exécution de check_automations ne traite que les conversations entrées dans
+-- le segment depuis la précédente (high-water mark), et ne recontacte pas un client
+-- déjà servi par la même automation pendant la période de cooldown.
+
+-- 1. High-water mark : borne haute (created_at / last_message_at) déjà traitée
+ALTER TABLE public.automations
+ADD COLUMN IF NOT EXISTS last_processed_at TIMESTAMPTZ;
+
+-- 2. Index pour la recherche du delta et la déduplication
+CREATE INDEX IF NOT EXISTS idx_conversations_created_at
+ON public.conversations (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_conversations_last_message_at
+ON public.conversations (last_message_at);
+
+CREATE INDEX IF NOT EXISTS idx_automation_logs_automation_phone
+ON public.automation_logs (automation_id, customer_phone, created_at DESC);
+
+-- 3. Destinataires entrés dans le segment entre p_since (exclu, NULL = sans borne) et p_until (inclus)
+--    new_7d       : conversations créées dans la fenêtre (au plus 7 jours au premier passage)
+--    active_30d   : conversations actives ayant reçu un message dans la fenêtre (au plus 30 jours)
+--    inactive_30d : conversations dont le dernier message a franchi les 30 jours dans la fenêtre
+--    all          : conversations créées dans la fenêtre
+-- recently_sent = le numéro a déjà reçu ce template (hors échec) depuis moins de p_cooldown_hours
+CREATE OR REPLACE FUNCTION public.automation_candidates(
+    p_automation_id UUID,
+    p_segment TEXT,
+    p_since TIMESTAMPTZ,
+    p_until TIMESTAMPTZ,
+    p_cooldown_hours INTEGER
+)
+RETURNS TABLE (
+    customer_phone TEXT,
+    recently_sent BOOLEAN
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH delta AS (
+        SELECT DISTINCT c.customer_phone
+        FROM public.conversations c
+        WHERE CASE p_segment
+            WHEN 'new_7d' THEN
+                c.created_at > coalesce(p_since, p_until - interval '7 days')
+                AND c.created_at <= p_until
+            WHEN 'active_30d' THEN
+                c.status = 'active'
+                AND c.last_message_at > coalesce(p_since, p_until - interval '30 days')
+                AND c.last_message_at <= p_until
+            WHEN 'inactive_30d' THEN
+                c.last_message_at <= p_until - interval '30 days'
+                AND (p_since IS NULL OR c.last_message_at > p_since - interval '30 days')
+            ELSE
+                (p_since IS NULL OR c.created_at > p_since)
+                AND c.created_at <= p_until
+        END
+    )
+    SELECT
+        d.customer_phone,
+        EXISTS (
+            SELECT 1
+            FROM public.automation_logs l
+            WHERE l.automation_id = p_automation_id
+              AND l.customer_phone = d.customer_phone
+              AND l.status <> 'failed'
+              AND l.created_at > p_until - make_interval(hours => p_cooldown_hours)
+        ) AS recently_sent
+    FROM delta d;
+$$;
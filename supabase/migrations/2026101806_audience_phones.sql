@@ -0,0 +1,105 @@
+-- Migration : résolution des audiences côté serveur, paginée par keyset
+-- Les numéros sont renvoyés DISTINCT et triés, par pages de p_limit après p_after :
+-- le backend les consomme en flux sans jamais charger toute l'audience.
+
+-- 1. Segments enregistrés (audience 'segment:<id>' des campagnes)
+-- rules : {"status": "active", "created_within_days": 7, "active_within_days": 30, "inactive_for_days": 30}
+-- (toutes les clés sont optionnelles et se combinent)
+CREATE TABLE IF NOT EXISTS public.segments (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    shop_id UUID REFERENCES public.shops(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    rules JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+ALTER TABLE public.segments ENABLE ROW LEVEL SECURITY;
+
+CREATE INDEX IF NOT EXISTS idx_segments_shop_id ON public.segments(shop_id);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename = 'segments' AND policyname = 'Service role full access segments'
+  ) THEN
+    CREATE POLICY "Service role full access segments"
+    ON public.segments FOR ALL TO service_role
+    USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename = 'segments' AND policyname = 'Public read segments'
+  ) THEN
+    CREATE POLICY "Public read segments"
+    ON public.segments FOR SELECT TO public
+    USING (true);
+  END IF;
+END $$;
+
+DROP TRIGGER IF EXISTS set_segments_updated_at ON public.segments;
+CREATE TRIGGER set_segments_updated_at
+BEFORE UPDATE ON public.segments
+FOR EACH ROW EXECUTE FUNCTION public.handle_updated_at();
+
+-- 2. Parcours des numéros dans l'ordre (keyset)
+CREATE INDEX IF NOT EXISTS idx_conversations_customer_phone
+ON public.conversations (customer_phone);
+
+-- 3. Numéros d'une audience dans l'intervalle ]p_after, p_through], au plus p_limit
+-- p_audience : all, active_30d, inactive_30d, new_7d, segment:<id>
+CREATE OR REPLACE FUNCTION public.audience_phones(
+    p_audience TEXT,
+    p_after TEXT DEFAULT NULL,
+    p_through TEXT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    customer_phone TEXT
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+#variable_conflict use_column
+DECLARE
+    rules JSONB;
+BEGIN
+    IF p_audience LIKE 'segment:%' THEN
+        SELECT s.rules || jsonb_build_object('shop_id', s.shop_id) INTO rules
+        FROM public.segments s
+        WHERE s.id::text = substring(p_audience FROM 9);
+
+        IF rules IS NULL THEN
+            RETURN;  -- segment inconnu : audience vide
+        END IF;
+    ELSE
+        rules := CASE p_audience
+            WHEN 'active_30d' THEN '{"status": "active", "active_within_days": 30}'::jsonb
+            WHEN 'inactive_30d' THEN '{"inactive_for_days": 30}'::jsonb
+            WHEN 'new_7d' THEN '{"created_within_days": 7}'::jsonb
+            ELSE '{}'::jsonb
+        END;
+    END IF;
+
+    RETURN QUERY
+    SELECT DISTINCT c.customer_phone
+    FROM public.conversations c
+    WHERE (p_after IS NULL OR c.customer_phone > p_after)
+      AND (p_through IS NULL OR c.customer_phone <= p_through)
+      AND (rules->>'shop_id' IS NULL OR c.shop_id = (rules->>'shop_id')::uuid)
+      AND (rules->>'status' IS NULL OR c.status = rules->>'status')
+      AND (rules->>'created_within_days' IS NULL
+           OR c.created_at >= now() - make_interval(days => (rules->>'created_within_days')::int))
+      AND (rules->>'active_within_days' IS NULL
+           OR c.last_message_at >= now() - make_interval(days => (rules->>'active_within_days')::int))
+      AND (rules->>'inactive_for_days' IS NULL
+           OR c.last_message_at < now() - make_interval(days => (rules->>'inactive_for_days')::int))
+    ORDER BY c.customer_phone
+    LIMIT p_limit;
+END;
+$$;
@@ -0,0 +1,65 @@
+-- Migration : compteurs incrémentés côté serveur
+-- Les workers n'écrivent plus de valeurs absolues : chaque appel applique un delta
+-- (UPDATE ... SET x = x + n), en un aller-retour, correct quel que soit le parallélisme.
+
+-- 1. Exécutions d'une automation
+CREATE OR REPLACE FUNCTION public.increment_automation_executions(
+    p_automation_id UUID,
+    p_delta INTEGER DEFAULT 1
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    UPDATE public.automations
+    SET executions_count = coalesce(executions_count, 0) + p_delta,
+        last_executed_at = now()
+    WHERE id = p_automation_id
+    RETURNING executions_count;
+$$;
+
+-- 2. Résultat d'un lot d'envois + deltas des compteurs dans la même transaction
+-- Seules les lignes encore 'sending' sont mises à jour et comptées : un lot rejoué
+-- (retry Celery) ne compte jamais deux fois.
+-- p_results: [{"id": uuid, "status": "sent"|"failed", "twilio_sid": text, "error_message": text}]
+CREATE OR REPLACE FUNCTION public.complete_campaign_messages(
+    p_results JSONB
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    WITH completed AS (
+        UPDATE public.campaign_messages cm
+        SET status = r.status,
+            twilio_sid = r.twilio_sid,
+            error_message = r.error_message,
+            sent_at = CASE WHEN r.status = 'sent' THEN now() ELSE cm.sent_at END
+        FROM jsonb_to_recordset(p_results) AS r(id UUID, status TEXT, twilio_sid TEXT, error_message TEXT)
+        WHERE cm.id = r.id
+          AND cm.status = 'sending'
+        RETURNING cm.campaign_id, cm.status
+    ),
+    deltas AS (
+        SELECT campaign_id,
+               count(*) AS sent,
+               count(*) FILTER (WHERE status = 'sent') AS delivered,
+               count(*) FILTER (WHERE status = 'failed') AS failed
+        FROM completed
+        GROUP BY campaign_id
+    ),
+    counters AS (
+        UPDATE public.campaigns c
+        SET sent_count = coalesce(c.sent_count, 0) + d.sent,
+            delivered_count = coalesce(c.delivered_count, 0) + d.delivered,
+            failed_count = coalesce(c.failed_count, 0) + d.failed
+        FROM deltas d
+        WHERE c.id = d.campaign_id
+    )
+    SELECT coalesce(sum(sent), 0) INTO updated
+    FROM deltas;
+
+    RETURN updated;
+END;
+$$;
@@ -0,0 +1,140 @@
+-- Migration : statuts de livraison Twilio (StatusCallback)
+-- Les callbacks sont mis en file dans un stream Redis puis appliqués par lots :
+-- un seul aller-retour par lot, transitions monotones, compteurs incrémentés par delta.
+--
+-- Sémantique des compteurs de campagne :
+--   sent_count      : envois tentés (acceptés ou rejetés par Twilio)
+--   delivered_count : messages livrés au téléphone (callback delivered ou read)
+--   read_count      : messages lus
+--   failed_count    : rejetés à l'envoi + failed/undelivered signalés par callback
+-- Sans URL de callback configurée, delivered_count compte les messages acceptés par
+-- Twilio (comportement précédent), faute de mieux.
+
+-- 1. Recherche par SID Twilio
+CREATE INDEX IF NOT EXISTS idx_campaign_messages_twilio_sid
+ON public.campaign_messages (twilio_sid)
+WHERE twilio_sid IS NOT NULL;
+
+-- 2. Ordre des statuts : queued/sending < sent < delivered < read ; failed est terminal
+CREATE OR REPLACE FUNCTION public.message_status_rank(p_status TEXT)
+RETURNS INTEGER
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE p_status
+        WHEN 'queued' THEN 0
+        WHEN 'sending' THEN 0
+        WHEN 'sent' THEN 1
+        WHEN 'delivered' THEN 2
+        WHEN 'read' THEN 3
+    END;
+$$;
+
+-- 3. Résultat d'un lot d'envois : delivered_count n'est plus alimenté ici quand les
+-- callbacks sont actifs (p_count_accepted = false)
+DROP FUNCTION IF EXISTS public.complete_campaign_messages(JSONB);
+CREATE OR REPLACE FUNCTION public.complete_campaign_messages(
+    p_results JSONB,
+    p_count_accepted BOOLEAN DEFAULT true
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    WITH completed AS (
+        UPDATE public.campaign_messages cm
+        SET status = r.status,
+            twilio_sid = r.twilio_sid,
+            error_message = r.error_message,
+            sent_at = CASE WHEN r.status = 'sent' THEN now() ELSE cm.sent_at END
+        FROM jsonb_to_recordset(p_results) AS r(id UUID, status TEXT, twilio_sid TEXT, error_message TEXT)
+        WHERE cm.id = r.id
+          AND cm.status = 'sending'
+        RETURNING cm.campaign_id, cm.status
+    ),
+    deltas AS (
+        SELECT campaign_id,
+               count(*) AS sent,
+               count(*) FILTER (WHERE status = 'sent' AND p_count_accepted) AS delivered,
+               count(*) FILTER (WHERE status = 'failed') AS failed
+        FROM completed
+        GROUP BY campaign_id
+    ),
+    counters AS (
+        UPDATE public.campaigns c
+        SET sent_count = coalesce(c.sent_count, 0) + d.sent,
+            delivered_count = coalesce(c.delivered_count, 0) + d.delivered,
+            failed_count = coalesce(c.failed_count, 0) + d.failed
+        FROM deltas d
+        WHERE c.id = d.campaign_id
+    )
+    SELECT coalesce(sum(sent), 0) INTO updated
+    FROM deltas;
+
+    RETURN updated;
+END;
+$$;
+
+-- 4. Application d'un lot de statuts (un seul statut par SID, déjà coalescé par le backend)
+-- p_updates: [{"twilio_sid": text, "status": "sent"|"delivered"|"read"|"failed", "at": timestamptz, "error_message": text}]
+-- Une transition n'est appliquée que si elle avance : un callback en retard ou rejoué
+-- ne fait jamais reculer un message ni compter deux fois.
+-- Renvoie les SID connus (appliqués ou ignorés) ; les autres sont réessayés plus tard
+-- (le callback peut précéder l'enregistrement du SID par le worker).
+CREATE OR REPLACE FUNCTION public.apply_message_statuses(
+    p_updates JSONB
+)
+RETURNS TABLE (
+    twilio_sid TEXT
+)
+LANGUAGE sql
+AS $$
+    WITH updates AS (
+        SELECT *
+        FROM jsonb_to_recordset(p_updates) AS u(twilio_sid TEXT, status TEXT, at TIMESTAMPTZ, error_message TEXT)
+    ),
+    matched AS (
+        SELECT cm.id, cm.campaign_id, cm.twilio_sid, cm.status AS old_status,
+               u.status AS new_status, u.at, u.error_message
+        FROM public.campaign_messages cm
+        JOIN updates u ON u.twilio_sid = cm.twilio_sid
+        FOR UPDATE OF cm
+    ),
+    advanced AS (
+        UPDATE public.campaign_messages cm
+        SET status = m.new_status,
+            delivered_at = CASE WHEN public.message_status_rank(m.new_status) >= 2
+                                THEN coalesce(cm.delivered_at, m.at) ELSE cm.delivered_at END,
+            read_at = CASE WHEN m.new_status = 'read' THEN coalesce(cm.read_at, m.at) ELSE cm.read_at END,
+            error_message = CASE WHEN m.new_status = 'failed' THEN m.error_message ELSE cm.error_message END
+        FROM matched m
+        WHERE cm.id = m.id
+          AND m.old_status <> 'failed'
+          AND CASE WHEN m.new_status = 'failed'
+                   THEN public.message_status_rank(m.old_status) < 2
+                   ELSE public.message_status_rank(m.new_status) > public.message_status_rank(m.old_status)
+              END
+        RETURNING cm.campaign_id, m.old_status, m.new_status
+    ),
+    deltas AS (
+        SELECT campaign_id,
+               count(*) FILTER (WHERE public.message_status_rank(new_status) >= 2
+                                  AND public.message_status_rank(old_status) < 2) AS delivered,
+               count(*) FILTER (WHERE new_status = 'read') AS read,
+               count(*) FILTER (WHERE new_status = 'failed') AS failed
+        FROM advanced
+        GROUP BY campaign_id
+    ),
+    counters AS (
+        UPDATE public.campaigns c
+        SET delivered_count = coalesce(c.delivered_count, 0) + d.delivered,
+            read_count = coalesce(c.read_count, 0) + d.read,
+            failed_count = coalesce(c.failed_count, 0) + d.failed
+        FROM deltas d
+        WHERE c.id = d.campaign_id
+    )
+    SELECT m.twilio_sid
+    FROM matched m;
+$$;
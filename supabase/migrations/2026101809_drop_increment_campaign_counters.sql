@@ -0,0 +1,5 @@
+-- Migration : suppression de increment_campaign_counters
+-- Les deltas des compteurs de campagne sont appliqués par complete_campaign_messages
+-- (envois) et apply_message_statuses (callbacks delivered/read/failed), dans la
+-- transaction qui met à jour les lignes : la fonction n'a plus d'appelant.
+DROP FUNCTION IF EXISTS public.increment_campaign_counters(UUID, INTEGER, INTEGER, INTEGER, INTEGER);